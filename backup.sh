@@ -10,8 +10,8 @@ BACKUP_FOLDER="gdrive1:SQLiteBackups"  # Google Drive folder where backups are s
 TIMESTAMP=$(date +"%Y-%m-%d_%H-%M-%S")
 BACKUP_NAME="backup_$TIMESTAMP.sqlite3"
 
-# Copy database to backup file
-cp $LOCAL_DB_PATH $BACKUP_NAME
+# Copy database to backup file (online backup, writers are not blocked)
+python manage.py backup_db --source $LOCAL_DB_PATH --output $BACKUP_NAME --verify || exit 1
 echo "✅ Database copied successfully: $BACKUP_NAME"
 
 # Upload backup to Google Drive
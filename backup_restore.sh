@@ -10,12 +10,13 @@ mkdir -p $BACKUP_DIR
 
 # Backup existing database before deployment
 if [ -f "$DB_FILE" ]; then
-    cp $DB_FILE $BACKUP_FILE
+    python manage.py backup_db --source $DB_FILE --output $BACKUP_FILE --verify || exit 1
     echo "✅ Backup created: $BACKUP_FILE"
 fi
 
 # Restore database after deployment
+# (restore_db checks the backup's integrity before touching the database)
 if [ -f "$BACKUP_FILE" ]; then
-    cp $BACKUP_FILE $DB_FILE
+    python manage.py restore_db $BACKUP_FILE --target $DB_FILE --no-safety-copy || exit 1
     echo "✅ Database restored from backup!"
 fi
@@ -1,27 +1,49 @@
-from .models import Category, Expense, Income
-from django.contrib import admin
-from django.db.models import Sum
-from django.utils.timezone import now, timedelta
+from .models import (
+    ArchivedCycle, Budget, Category, CategoryRule, CycleRollup, ExchangeRate, Expense, Income,
+    LedgerEvent, Membership, Profile, RecurringTransaction, Task, Workspace)
+from .budgets import budget_expression
+from .search import rank, search
+from . import bulk
+from .caching import cached_for_cycle
+from .cycles import current_cycle
+from .currency import home_currency_for
+from .tasks import visible_tasks
+from .trends import cycle_trends
+from .workspaces import members_category_totals, members_cycle_totals
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.db.models import Case, DecimalField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
 import json  # ✅ Import json for sending chart data
-# ✅ Import date and timedelta for date calculations
-from datetime import date, timedelta
 from django.shortcuts import render  # ✅ Import render for rendering templates
 from django.template.response import TemplateResponse
 from django.urls import path
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 
 
 admin.site.site_header = "Expense Tracker"  # ✅ Change the header
 admin.site.site_title = "Expense Dashboard"  # ✅ Change the index title
 
 
-class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('name', 'user')
+class WorkspaceScopedMixin:
+    """ ✅ Only rows of the user's workspaces, and only those workspaces to pick from """
 
     def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        if request.user.is_superuser:
-            return qs.filter(add_by=request.user)
-        return qs
+        return super().get_queryset(request).for_user(request.user)
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'workspace':
+            kwargs['queryset'] = Workspace.objects.filter(members=request.user)
+        elif db_field.name == 'category':
+            kwargs['queryset'] = Category.objects.for_user(request.user)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+class CategoryAdmin(WorkspaceScopedMixin, admin.ModelAdmin):
+    list_display = ('name', 'user', 'workspace')
 
     def save_model(self, request, obj, form, change):
         if not obj.pk:
@@ -35,23 +57,47 @@ class CategoryAdmin(admin.ModelAdmin):
         return form
 
 
-class ExpenseAdmin(admin.ModelAdmin):
-    list_display = ('amount', 'category', 'add_by', 'description', 'date')
+class RankedChangeList(ChangeList):
+    def get_queryset(self, request, exclude_parameters=None):
+        qs = super().get_queryset(request, exclude_parameters)
+        # ✅ Best matches first unless a column header was clicked
+        if self.query and ORDER_VAR not in self.params:
+            qs = rank(qs, self.query)
+        return qs
+
+
+class FullTextSearchMixin:
+    """ ✅ Admin search through the FTS5 index, best matches first """
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return search(queryset, search_term), False
+
+    def get_changelist(self, request, **kwargs):
+        return RankedChangeList
+
+
+class BulkEditActionForm(ActionForm):
+    # ✅ Targets for the recategorize / re-date actions, next to the action picker
+    category = forms.ModelChoiceField(queryset=Category.objects.all(), required=False)
+    date = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+
+
+class ExpenseAdmin(WorkspaceScopedMixin, FullTextSearchMixin, admin.ModelAdmin):
+    list_display = ('amount', 'currency', 'category', 'add_by', 'description', 'date')
+    exclude = ('workspace',)  # Follows the category
+    search_fields = ('description',)  # ✅ Served by the full-text index
+    action_form = BulkEditActionForm
+    actions = ('recategorize_selected', 'redate_selected')
     # ✅ Uses a calendar picker
     # list_filter = (("date", DateRangePickerFilter),)
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        if request.user.is_superuser:
-            qs = qs.filter(add_by=request.user)
-
-        # ✅ Apply default filtering for the 27th of the previous month to the 26th of this month
-        today = now().date()
-        first_date = today.replace(day=27) if today.day >= 27 else (
-            today.replace(day=1) - timedelta(days=1)).replace(day=27)
-        last_date = (first_date + timedelta(days=31)).replace(day=26)
 
-        return qs.filter(date__gte=first_date, date__lte=last_date)
+        # ✅ Apply default filtering to the user's current billing cycle (27th -> 26th)
+        return qs.filter(date__range=current_cycle(request.user).range)
 
     def save_model(self, request, obj, form, change):
         if not obj.pk:
@@ -64,56 +110,100 @@ class ExpenseAdmin(admin.ModelAdmin):
         form.base_fields['add_by'].disabled = True
         return form
 
+    def delete_queryset(self, request, queryset):
+        # ✅ "Delete selected" writes the rollups once, not once per row
+        bulk.delete_many(queryset)
 
-class CategoryExpenseAdmin(admin.ModelAdmin):
-    list_display = ('name', 'total_spent')
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        # ✅ The action form is built per request in there; offer only the
+        # categories of the user's workspaces before it renders
+        action_form = (getattr(response, 'context_data', None) or {}).get('action_form')
+        if action_form is not None:
+            action_form.fields['category'].queryset = Category.objects.for_user(request.user)
+        return response
+
+    @admin.action(description="Move selected expenses to the chosen category")
+    def recategorize_selected(self, request, queryset):
+        category_id = request.POST.get('category', '')
+        category = Category.objects.for_user(request.user).filter(
+            pk=category_id).first() if category_id.isdigit() else None
+        if category is None:
+            self.message_user(request, "Choose one of your categories first.", messages.WARNING)
+            return
+        moved = bulk.recategorize(queryset, category)
+        self.message_user(request, f"Moved {moved} expenses to {category.name}.", messages.SUCCESS)
+
+    @admin.action(description="Change the date of selected expenses")
+    def redate_selected(self, request, queryset):
+        try:
+            day = parse_date(request.POST.get('date', ''))
+        except ValueError:
+            day = None
+        if day is None:
+            self.message_user(request, "Choose a valid date first.", messages.WARNING)
+            return
+        moved = bulk.redate(queryset, day)
+        self.message_user(request, f"Moved {moved} expenses to {day}.", messages.SUCCESS)
+
+
+class CategoryExpenseAdmin(WorkspaceScopedMixin, admin.ModelAdmin):
+    list_display = ('name', 'total_spent', 'budget', 'budget_status')
 
     def total_spent(self, obj):
         """ ✅ Sum of expenses per category for the default date range """
-        today = now().date()
-        first_date = today.replace(day=27) if today.day >= 27 else (
-            today.replace(day=1) - timedelta(days=1)).replace(day=27)
-        last_date = (first_date + timedelta(days=31)).replace(day=26)
-
-        expenses = Expense.objects.filter(
-            category=obj, add_by=self.request.user,
-            date__gte=first_date, date__lte=last_date
-        )
-        total = expenses.aggregate(Sum('amount'))['amount__sum'] or 0
-        return float(total)  # ✅ Convert Decimal to float
+        return float(obj.cycle_total)  # ✅ Convert Decimal to float
 
     total_spent.short_description = "Total Spent"
+    total_spent.admin_order_field = 'cycle_total'
+
+    def budget(self, obj):
+        return obj.cycle_budget
+
+    budget.admin_order_field = 'cycle_budget'
+
+    def budget_status(self, obj):
+        """ ✅ Compares the two annotations, no extra query per row """
+        if obj.cycle_budget is None:
+            return '-'
+        if obj.cycle_total > obj.cycle_budget:
+            return f"Over by {obj.cycle_total - obj.cycle_budget}"
+        return f"{obj.cycle_budget - obj.cycle_total} left"
+
+    budget_status.short_description = "Budget Status"
 
     def get_queryset(self, request):
-        self.request = request
         qs = super().get_queryset(request)
-        return qs.filter(user=request.user)
+        cycle = current_cycle(request.user)
+        # ✅ Read each category's total from the rollup table in the same query
+        cycle_totals = CycleRollup.objects.filter(
+            user=request.user, kind=CycleRollup.EXPENSE,
+            cycle_start=cycle.start, category=OuterRef('pk'),
+        ).values('total')[:1]
+        total = DecimalField(max_digits=14, decimal_places=2)
+        cycle_total = Coalesce(Subquery(cycle_totals), Value(0), output_field=total)
+        # ✅ Shared categories also count what the other members spent
+        others = members_category_totals(request.user, cycle)
+        if others:
+            cycle_total += Case(
+                *[When(pk=pk, then=Value(amount)) for pk, amount in others.items()],
+                default=Value(0), output_field=total)
+        return qs.annotate(
+            cycle_total=cycle_total,
+            cycle_budget=budget_expression(request.user, cycle),
+        )
 
     def changelist_view(self, request, extra_context=None):
         """ ✅ Show Total Spending with Pie Chart """
-        today = now().date()
-        first_date = today.replace(day=27) if today.day >= 27 else (
-            today.replace(day=1) - timedelta(days=1)).replace(day=27)
-        last_date = (first_date + timedelta(days=31)).replace(day=26)
-
-        # ✅ Get total spending across all categories
-        total_spending = Expense.objects.filter(
-            add_by=request.user, date__gte=first_date, date__lte=last_date
-        ).aggregate(Sum('amount'))['amount__sum'] or 0
-
-        # ✅ Get category-wise spending
-        category_totals = Expense.objects.filter(
-            add_by=request.user, date__gte=first_date, date__lte=last_date
-        ).values('category__name').annotate(total=Sum('amount'))
-
-        category_labels = [c['category__name'] for c in category_totals]
-        # ✅ Convert Decimal to float
-        category_values = [float(c['total']) for c in category_totals]
+        chart = get_category_chart_for_user(request.user)
 
         extra_context = extra_context or {}
-        extra_context['total_spending'] = total_spending  # ✅ Pass to template
-        extra_context['category_labels'] = json.dumps(category_labels)
-        extra_context['category_values'] = json.dumps(category_values)
+        extra_context['total_spending'] = chart['total_spending']  # ✅ Pass to template
+        extra_context['currency'] = home_currency_for(request.user)
+        extra_context['category_labels'] = chart['category_labels']
+        extra_context['category_values'] = chart['category_values']
+        # ✅ Line and stacked charts over the last year of cycles
+        extra_context['trends'] = cycle_trends(request.user, cycles=12)
         extra_context['chart_width'] = 400  # Adjust width
         extra_context['chart_height'] = 400  # Adjust height
 
@@ -121,10 +211,10 @@ class CategoryExpenseAdmin(admin.ModelAdmin):
 
 
 @admin.register(Income)
-class IncomeAdmin(admin.ModelAdmin):
+class IncomeAdmin(WorkspaceScopedMixin, FullTextSearchMixin, admin.ModelAdmin):
     # Display these columns in admin
-    list_display = ('source', 'amount', 'date')
-    search_fields = ('source',)  # Allow searching by source name
+    list_display = ('source', 'amount', 'currency', 'date')
+    search_fields = ('source', 'description')  # Searched through the full-text index
     list_filter = ('date',)  # Filter by date
    # Custom method to display the totals for income, expense, and balance
 
@@ -136,6 +226,7 @@ class IncomeAdmin(admin.ModelAdmin):
         extra_context['total_income'] = dashboard_data["total_income"]
         extra_context['total_expense'] = dashboard_data["total_expense"]
         extra_context['balance'] = dashboard_data["balance"]
+        extra_context['currency'] = dashboard_data["currency"]
 
         # Call the default changelist view to render the page with extra context
         return super().changelist_view(request, extra_context=extra_context)
@@ -155,25 +246,244 @@ admin.site.register(Expense, ExpenseAdmin)
 
 
 def get_dashboard_data_for_user(user):
-    today = date.today()
-
-    # Calculate start date (27th of the previous month) and end date (26th of the current month)
-    start_date = date(today.year, today.month - 1,
-                      27) if today.day < 27 else date(today.year, today.month, 27)
-    end_date = date(today.year, today.month, 26) if today.day < 27 else date(
-        today.year, today.month + 1, 26)
-
-    # Total income and total expenses for the given date range
-    total_income = Income.objects.filter(add_by=user,
-                                         date__range=[start_date, end_date]).aggregate(Sum('amount'))['amount__sum'] or 0
-    total_expense = Expense.objects.filter(add_by=user,
-                                           date__range=[start_date, end_date]).aggregate(Sum('amount'))['amount__sum'] or 0
+    # ✅ Served from cache until the user's ledger changes
+    cycle = current_cycle(user)
+    return cached_for_cycle(user, cycle, 'dashboard',
+                            lambda: _compute_dashboard_data(user, cycle))
+
+
+def _compute_dashboard_data(user, cycle):
+    # ✅ One grouped read over the rollup table instead of scanning the ledger
+    totals = dict(CycleRollup.objects.filter(
+        user=user, cycle_start=cycle.start,
+    ).values('kind').annotate(total=Sum('total')).values_list('kind', 'total'))
+
+    # Total income and total expenses for the current cycle
+    total_income = totals.get(CycleRollup.INCOME) or 0
+    total_expense = totals.get(CycleRollup.EXPENSE) or 0
+    # ✅ Plus the other members' rows in shared workspaces, as the lists show them
+    for (_, kind, _, _, _), total in members_cycle_totals(user, cycle).items():
+        if kind == CycleRollup.INCOME:
+            total_income += total
+        else:
+            total_expense += total
 
     # Calculate the balance (Income - Expense)
     balance = total_income - total_expense
 
     return {
+        "start_date": cycle.start,
+        "end_date": cycle.end,
         "total_income": total_income,
         "total_expense": total_expense,
         "balance": balance,
+        # ✅ Rollups are kept in the home currency
+        "currency": home_currency_for(user),
+    }
+
+
+def get_category_chart_for_user(user):
+    """ ✅ Pie chart payload for the current cycle, cached like the dashboard """
+    cycle = current_cycle(user)
+    return cached_for_cycle(user, cycle, 'category-chart',
+                            lambda: _compute_category_chart(user, cycle))
+
+
+def _compute_category_chart(user, cycle):
+    # ✅ Get category-wise spending from the precomputed rollups
+    totals = {}
+    for category_id, name, total in CycleRollup.objects.filter(
+            user=user, kind=CycleRollup.EXPENSE, cycle_start=cycle.start, count__gt=0,
+    ).values_list('category', 'category__name', 'total'):
+        totals[category_id] = [name, total]
+    # Shared categories also count the other members' spending
+    for (_, kind, category_id, name, _), total in members_cycle_totals(user, cycle).items():
+        if kind == CycleRollup.EXPENSE:
+            totals.setdefault(category_id, [name, 0])[1] += total
+    category_totals = list(totals.values())
+
+    return {
+        'category_labels': json.dumps([name for name, _ in category_totals]),
+        # ✅ Convert Decimal to float
+        'category_values': json.dumps([float(total) for _, total in category_totals]),
+        # ✅ Get total spending across all categories
+        'total_spending': sum(total for _, total in category_totals),
     }
+
+
+@admin.register(Profile)
+class ProfileAdmin(admin.ModelAdmin):
+    list_display = ('user', 'cycle_start_day', 'home_currency')
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        if request.user.is_superuser:
+            return qs
+        return qs.filter(user=request.user)
+
+
+@admin.register(CategoryRule)
+class CategoryRuleAdmin(admin.ModelAdmin):
+    list_display = ('pattern', 'category', 'is_regex', 'priority')
+    list_editable = ('priority',)
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request).select_related('category')
+        return qs.filter(user=request.user)
+
+    def save_model(self, request, obj, form, change):
+        if not obj.pk:
+            obj.user = request.user
+        obj.save()
+
+    def get_form(self, request, obj=None, **kwargs):
+        form = super().get_form(request, obj, **kwargs)
+        form.base_fields['user'].initial = request.user
+        form.base_fields['user'].disabled = True
+        return form
+
+
+@admin.register(Budget)
+class BudgetAdmin(admin.ModelAdmin):
+    list_display = ('category', 'amount', 'cycle_start')
+    list_filter = ('cycle_start',)
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request).select_related('category')
+        return qs.filter(user=request.user)
+
+    def save_model(self, request, obj, form, change):
+        if not obj.pk:
+            obj.user = request.user
+        obj.save()
+
+    def get_form(self, request, obj=None, **kwargs):
+        form = super().get_form(request, obj, **kwargs)
+        form.base_fields['user'].initial = request.user
+        form.base_fields['user'].disabled = True
+        form.base_fields['category'].queryset = Category.objects.for_user(request.user)
+        return form
+
+
+@admin.register(RecurringTransaction)
+class RecurringTransactionAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'kind', 'frequency', 'interval', 'day', 'next_due', 'active')
+    list_filter = ('kind', 'frequency', 'active')
+    readonly_fields = ('next_due',)
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request).select_related('category')
+        return qs.filter(user=request.user)
+
+    def save_model(self, request, obj, form, change):
+        if not obj.pk:
+            obj.user = request.user
+        obj.save()
+
+    def get_form(self, request, obj=None, **kwargs):
+        form = super().get_form(request, obj, **kwargs)
+        form.base_fields['user'].initial = request.user
+        form.base_fields['user'].disabled = True
+        form.base_fields['category'].queryset = Category.objects.for_user(request.user)
+        return form
+
+
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+    list_display = ('currency', 'date', 'rate')
+    list_filter = ('currency',)
+    date_hierarchy = 'date'
+
+
+@admin.register(LedgerEvent)
+class LedgerEventAdmin(admin.ModelAdmin):
+    """ ✅ Read-only: the log is append-only """
+    list_display = ('created_at', 'action', 'model', 'object_id', 'user_id')
+    list_filter = ('model', 'action')
+    date_hierarchy = 'created_at'
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        if request.user.is_superuser:
+            return qs
+        return qs.filter(user_id=request.user.pk)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class MembershipInline(admin.TabularInline):
+    model = Membership
+    extra = 1
+
+
+@admin.register(Workspace)
+class WorkspaceAdmin(admin.ModelAdmin):
+    list_display = ('name', 'personal_for')
+    inlines = (MembershipInline,)
+    exclude = ('personal_for',)
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        if request.user.is_superuser:
+            return qs
+        return qs.filter(members=request.user)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # ✅ Whoever creates a household owns it
+        if not change:
+            Membership.objects.get_or_create(
+                user=request.user, workspace=form.instance, defaults={'role': Membership.OWNER})
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'progress', 'user', 'created_at',
+                    'finished_at')
+    list_filter = ('status', 'name')
+    readonly_fields = [field.name for field in Task._meta.fields]
+    actions = ['retry']
+
+    def get_queryset(self, request):
+        # ✅ kwargs hold upload paths and ids; only superusers see everyone's
+        return visible_tasks(request.user)
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="Retry selected failed tasks")
+    def retry(self, request, queryset):
+        # ✅ A fresh set of attempts, due now
+        count = queryset.filter(status=Task.FAILED).update(
+            status=Task.QUEUED, attempts=0, run_after=timezone.now(), finished_at=None)
+        self.message_user(request, f"✅ Queued {count} tasks again")
+
+
+@admin.register(ArchivedCycle)
+class ArchivedCycleAdmin(admin.ModelAdmin):
+    """ ✅ Read-only: `manage.py archive_cycles` writes these """
+    list_display = ('user', 'start', 'end', 'rows', 'total', 'currency', 'archived_at')
+    date_hierarchy = 'start'
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        if request.user.is_superuser:
+            return qs
+        return qs.filter(user=request.user)
+
+    def get_list_filter(self, request):
+        # The filter would list every user
+        return ('user',) if request.user.is_superuser else ()
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
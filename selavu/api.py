@@ -0,0 +1,269 @@
+import json
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_date
+from django.utils.http import http_date, quote_etag
+from django.utils.timezone import now
+from django.views.decorators.http import require_http_methods
+
+from .admin import get_dashboard_data_for_user
+from .archive import aarchived_through, archived_expenses, reaches_archive
+from .budgets import budget_status
+from .bulk import create_expenses
+from .caching import ledger_version
+from .classifier import suggest_category
+from .forms import ExpenseForm
+from .models import Category, Expense, Workspace
+from .pagination import MAX_ID, InvalidCursor, apaginate_by_cursor
+from .search import search
+from .tasks import task_json, visible_tasks
+from .workspaces import shared_dashboard
+
+API_PAGE_SIZE = 50
+
+
+def api_login_required(view):
+    """ ✅ 401 JSON instead of a login redirect; resolves the user without blocking """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return JsonResponse({'error': "Authentication required"}, status=401)
+        # Later sync helpers (ETags, forms) read the loaded user, no lazy query
+        request.user = user
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def ledger_etag(request, *args, **kwargs):
+    # ✅ Any write to the user's ledger bumps the version, so the ETag is
+    # known before a single query runs
+    return f'"{request.user.pk}-{ledger_version(request.user.pk)}"'
+
+
+def ledger_modified(request, *args, **kwargs):
+    return datetime.fromtimestamp(int(ledger_version(request.user.pk)) / 1e9, tz=timezone.utc)
+
+
+def dashboard_etag(request, *args, **kwargs):
+    # The current cycle moves on with the calendar, not only with writes
+    return f'"{request.user.pk}-{ledger_version(request.user.pk)}-{now().date()}"'
+
+
+def _validators(etag_func, request, *args, **kwargs):
+    modified = int(ledger_modified(request).timestamp())
+    return quote_etag(etag_func(request, *args, **kwargs)), modified
+
+
+def conditional(etag_func):
+    """
+    ✅ 304/412 for GET and HEAD only; writes always reach the view. The
+    validators read the cache, so they run off the event loop in one hop.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return await view(request, *args, **kwargs)
+            etag, modified = await sync_to_async(_validators)(etag_func, request, *args, **kwargs)
+            response = get_conditional_response(request, etag=etag, last_modified=modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if not response.has_header('Last-Modified'):
+                response.headers['Last-Modified'] = http_date(modified)
+            response.headers.setdefault('ETag', etag)
+            return response
+        return wrapper
+    return decorator
+
+
+def expense_json(expense):
+    return {
+        'id': expense.pk,
+        'date': expense.date,
+        'amount': expense.amount,
+        'currency': expense.currency,
+        'description': expense.description,
+        'category': {'id': expense.category_id, 'name': expense.category.name},
+    }
+
+
+def _error(message, status=400, **extra):
+    return JsonResponse({'error': message, **extra}, status=status)
+
+
+@require_http_methods(['GET', 'HEAD', 'POST'])
+@api_login_required
+@conditional(ledger_etag)
+async def expenses(request):
+    """ ✅ GET: one keyset page of the user's expenses. POST: create one """
+    if request.method == 'POST':
+        return await create_expense(request)
+
+    qs = Expense.objects.for_user(request.user).select_related('category')
+    archived = archived_expenses(request.user).select_related('category')
+    params = request.GET
+    start = None
+    for name, lookup in (('start', 'date__gte'), ('end', 'date__lte')):
+        if params.get(name):
+            try:
+                day = parse_date(params[name])
+            except ValueError:  # Well formed, but no such day
+                day = None
+            if day is None:
+                return _error(f"Invalid {name} date")
+            qs = qs.filter(**{lookup: day})
+            archived = archived.filter(**{lookup: day})
+            start = day if name == 'start' else start
+    if params.get('category'):
+        if not params['category'].isdigit() or int(params['category']) > MAX_ID:
+            return _error("Invalid category")
+        qs = qs.filter(category_id=int(params['category']))
+        archived = archived.filter(category_id=int(params['category']))
+    through = None
+    if params.get('q'):
+        qs = search(qs, params['q'])  # The archive has no full-text index
+    else:
+        # ✅ Archived cycles join in only when the range reaches back to them
+        through = await aarchived_through(request.user)
+        if not reaches_archive(through, start):
+            through = None
+
+    try:
+        page = await apaginate_by_cursor(
+            qs, after=params.get('after'), before=params.get('before'),
+            page_size=API_PAGE_SIZE, older=archived, older_through=through)
+    except InvalidCursor as e:
+        return _error(str(e))
+    return JsonResponse({
+        'results': [expense_json(e) for e in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+def _save_expenses(user, rows):
+    """ ✅ All rows or none; every invalid row's errors come back, keyed by index """
+    forms = [ExpenseForm(row, user=user) for row in rows]
+    errors = {index: form.errors for index, form in enumerate(forms) if not form.is_valid()}
+    if errors:
+        return None, errors
+    return create_expenses(user, forms), None
+
+
+async def create_expense(request):
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return _error("Body is not valid JSON")
+    else:
+        data = request.POST
+    # request.POST is a dict too
+    if not (isinstance(data, dict) or (
+            isinstance(data, list) and all(isinstance(row, dict) for row in data))):
+        return _error("Body must be an object or a list of objects")
+    # ✅ A JSON list creates a whole receipt in one transaction
+    many = isinstance(data, list)
+    # Form validation and the rollup/budget writes are sync code
+    created, errors = await sync_to_async(_save_expenses)(request.user, data if many else [data])
+    if errors:
+        if many:
+            return _error("Invalid expenses", errors=errors)
+        return _error("Invalid expense", errors=errors[0])
+    if many:
+        return JsonResponse({'results': [expense_json(e) for e in created]}, status=201)
+    return JsonResponse(expense_json(created[0]), status=201)
+
+
+@require_http_methods(['GET', 'HEAD'])
+@api_login_required
+@conditional(ledger_etag)
+async def expense_detail(request, pk):
+    expense = await Expense.objects.for_user(request.user).select_related('category').filter(
+        pk=pk).afirst()
+    if expense is None:
+        return _error("Not found", status=404)
+    return JsonResponse(expense_json(expense))
+
+
+@require_http_methods(['GET', 'HEAD'])
+@api_login_required
+@conditional(ledger_etag)
+async def categories(request):
+    rows = Category.objects.for_user(request.user).order_by('name').values('id', 'name')
+    return JsonResponse({'results': [row async for row in rows]})
+
+
+@require_http_methods(['GET'])
+@api_login_required
+async def suggest(request):
+    """ ✅ Category the classifier would pick for ?description=...&amount=... """
+    amount = None
+    if request.GET.get('amount'):
+        try:
+            amount = Decimal(request.GET['amount'])
+        except InvalidOperation:
+            amount = Decimal('NaN')
+        if not amount.is_finite():
+            return _error("Invalid amount")
+    # The classifier lives in this process' memory and trains with sync ORM reads
+    suggestion = await sync_to_async(suggest_category)(
+        request.user, request.GET.get('description', ''), amount)
+    category = suggestion and await Category.objects.for_user(request.user).filter(
+        pk=suggestion.category_id).values('id', 'name').afirst()
+    if not category:
+        return JsonResponse({'category': None})
+    return JsonResponse({'category': category, 'source': suggestion.source,
+                         'confidence': round(suggestion.confidence, 3)})
+
+
+def _dashboard(user):
+    data = get_dashboard_data_for_user(user)
+    return dict(data, budgets=[status._asdict() for status in budget_status(user).values()])
+
+
+@require_http_methods(['GET', 'HEAD'])
+@api_login_required
+@conditional(dashboard_etag)
+async def dashboard(request):
+    """ ✅ Current cycle totals and budgets, served from the dashboard cache """
+    # One hop to a worker thread, and only when the ETag didn't already match
+    return JsonResponse(await sync_to_async(_dashboard)(request.user))
+
+
+@require_http_methods(['GET', 'HEAD'])
+@api_login_required
+@conditional(ledger_etag)
+async def workspaces(request):
+    rows = Workspace.objects.filter(members=request.user).order_by('name').values(
+        'id', 'name', 'personal_for')
+    return JsonResponse({'results': [
+        {'id': row['id'], 'name': row['name'], 'personal': row['personal_for'] is not None}
+        async for row in rows]})
+
+
+@require_http_methods(['GET', 'HEAD'])
+@api_login_required
+@conditional(dashboard_etag)
+async def workspace_dashboard(request, pk):
+    """ ✅ Every member's spending in the current cycle; members' writes bump the ETag """
+    workspace = await Workspace.objects.filter(members=request.user, pk=pk).afirst()
+    if workspace is None:
+        return _error("Not found", status=404)
+    return JsonResponse(await sync_to_async(shared_dashboard)(workspace, request.user))
+
+
+@require_http_methods(['GET', 'HEAD'])
+@api_login_required
+async def task_status(request, pk):
+    """ ✅ Status, progress and result of a background task the user queued """
+    task = await visible_tasks(request.user).filter(pk=pk).afirst()
+    if task is None:
+        return _error("Not found", status=404)
+    return JsonResponse(task_json(task))
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SelavuConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'selavu'
+
+    def ready(self):
+        from . import signals  # noqa: F401  ✅ Keeps the rollups in sync
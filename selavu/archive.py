@@ -0,0 +1,170 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Exists, Max, OuterRef, Sum
+from django.utils.timezone import now
+
+from . import workspaces
+from .caching import bump_versions
+from .currency import home_currency_for_id
+from .cycles import cycle_back, cycle_for, default_start_day, start_days_for_ids
+from .models import (
+    ArchivedCycle, ArchivedExpense, Attachment, CycleRollup, Expense, Membership)
+
+# Columns both tables share, so rows move as plain values
+FIELDS = [field.attname for field in ArchivedExpense._meta.concrete_fields]
+
+
+def archive_after():
+    return getattr(settings, 'SELAVU_ARCHIVE_AFTER_CYCLES', 12)
+
+
+def _visible_cycles(user):
+    # Archived cycles of everyone the user shares a workspace with
+    return ArchivedCycle.objects.filter(user__in=Membership.objects.filter(
+        workspace__in=Membership.objects.filter(user=user).values('workspace')).values('user'))
+
+
+def archived_through(user):
+    """
+    ✅ Last day of any archived cycle in the ledgers the user can see, or
+    None when nothing is archived. One query on the small ArchivedCycle
+    table, so reads of recent data never touch the archive.
+    """
+    return _visible_cycles(user).aggregate(day=Max('end'))['day']
+
+
+async def aarchived_through(user):
+    return (await _visible_cycles(user).aaggregate(day=Max('end')))['day']
+
+
+def reaches_archive(through, start):
+    """ Whether a range from `start` (None: the beginning) goes back into the archive """
+    return through is not None and (start is None or start <= through)
+
+
+def archived_expenses(user):
+    """ The archived rows the user can see; filter them like Expense.objects.for_user() """
+    return ArchivedExpense.objects.for_user(user)
+
+
+def with_archive(rows, archived_rows, through, start=None):
+    """
+    ✅ Union two values()/values_list() querysets of the same columns when
+    the range from `start` reaches back into the archive; `rows` alone
+    otherwise. Order the result by column name (e.g. 'date', 'id').
+    """
+    if not reaches_archive(through, start):
+        return rows
+    return rows.union(archived_rows, all=True)
+
+
+def horizon(start_day, keep, today=None):
+    """ First day kept in the hot table: the start of the cycle `keep` cycles back """
+    return cycle_back(today or now().date(), keep, start_day).start
+
+
+def archive_cycles(users=None, keep=None, batch_size=500, today=None):
+    """
+    ✅ Move expenses of cycles more than `keep` cycles old (default
+    SELAVU_ARCHIVE_AFTER_CYCLES) to the archive table, one user per
+    transaction, and record each archived cycle with its totals. Returns
+    how many rows moved.
+
+    Archiving moves rows without changing the ledger: they keep their ids,
+    their rollups and their audit history, so no signal runs. Expenses with
+    receipts stay in the hot table.
+    """
+    keep = archive_after() if keep is None else keep
+    if users is None:
+        user_ids = list(Expense.objects.order_by().values_list('add_by', flat=True).distinct())
+    else:
+        user_ids = [getattr(user, 'pk', user) for user in users]
+    start_days = start_days_for_ids(user_ids)
+    moved = 0
+    for user_id in user_ids:
+        start_day = start_days.get(user_id) or default_start_day()
+        moved += _archive_user(user_id, horizon(start_day, keep, today), start_day, batch_size)
+    return moved
+
+
+def _archive_user(user_id, first_kept, start_day, batch_size):
+    table = Expense._meta.db_table
+    rows = Expense.objects.filter(add_by_id=user_id, date__lt=first_kept).exclude(
+        Exists(Attachment.objects.filter(expense=OuterRef('pk')))).order_by()
+    days = Counter()
+    workspace_ids = set()
+    with transaction.atomic():
+        while True:
+            batch = list(rows.values(*FIELDS)[:batch_size])
+            if not batch:
+                break
+            ArchivedExpense.objects.bulk_create(ArchivedExpense(**row) for row in batch)
+            # Raw DELETE: the ORM's would send delete signals, and these
+            # rows are moving, not leaving the ledger
+            placeholders = ', '.join(['%s'] * len(batch))
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {table} WHERE id IN ({placeholders})",
+                               [row['id'] for row in batch])
+            days.update(row['date'] for row in batch)
+            workspace_ids.update(row['workspace_id'] for row in batch)
+        if not days:
+            return 0
+        _record_cycles(user_id, {cycle_for(day, start_day) for day in days}, start_day)
+    bump_versions([user_id])
+    workspaces.touch(workspace_ids)  # Members' lists changed too
+    return sum(days.values())
+
+
+def _record_cycles(user_id, cycles, start_day):
+    starts = [cycle.start for cycle in cycles]
+    rollups = CycleRollup.objects.filter(
+        user_id=user_id, kind=CycleRollup.EXPENSE, cycle_start__in=starts).values('cycle_start')
+    totals = {row['cycle_start']: (row['total'], row['count'])
+              for row in rollups.annotate(total=Sum('total'), count=Sum('count'))}
+    first, last = min(starts), max(cycle.end for cycle in cycles)
+    rows = Counter()
+    for day, n in ArchivedExpense.objects.filter(
+            add_by_id=user_id, date__range=(first, last)).values('date').annotate(
+            n=Count('id')).order_by().values_list('date', 'n'):
+        rows[cycle_for(day, start_day).start] += n
+    currency = home_currency_for_id(user_id)
+    ArchivedCycle.objects.bulk_create([
+        ArchivedCycle(user_id=user_id, start=cycle.start, end=cycle.end, rows=rows[cycle.start],
+                      total=totals.get(cycle.start, (0, 0))[0],
+                      count=totals.get(cycle.start, (0, 0))[1], currency=currency)
+        for cycle in cycles
+    ], update_conflicts=True, unique_fields=['user', 'start'],
+        update_fields=['end', 'rows', 'total', 'count', 'currency', 'archived_at'])
+
+
+def restore(user, since=None, batch_size=500):
+    """
+    ✅ Move a user's archived expenses back into the hot table, whole cycles
+    from the one containing `since` (default: all of them). Returns how
+    many rows moved.
+    """
+    user_id = getattr(user, 'pk', user)
+    cycles = ArchivedCycle.objects.filter(user_id=user_id)
+    rows = ArchivedExpense.objects.filter(add_by_id=user_id).order_by()
+    if since is not None:
+        first = cycle_for(since, start_days_for_ids([user_id]).get(user_id)).start
+        cycles = cycles.filter(end__gte=first)
+        rows = rows.filter(date__gte=first)
+    moved = 0
+    workspace_ids = set()
+    with transaction.atomic():
+        while True:
+            batch = list(rows.values(*FIELDS)[:batch_size])
+            if not batch:
+                break
+            # bulk_create sends no signals; the rollups never lost these rows
+            Expense.objects.bulk_create(Expense(**row) for row in batch)
+            ArchivedExpense.objects.filter(pk__in=[row['id'] for row in batch]).delete()
+            workspace_ids.update(row['workspace_id'] for row in batch)
+            moved += len(batch)
+        cycles.delete()
+    bump_versions([user_id])
+    workspaces.touch(workspace_ids)
+    return moved
@@ -0,0 +1,333 @@
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.db import connection, transaction
+from django.db.models import Count
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+
+from .models import Attachment, Blob
+
+try:  # Optional: without Pillow, images get no dimensions or thumbnail
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (320, 320)
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# (magic bytes, content type); the client's Content-Type is never trusted
+SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'%PDF-', 'application/pdf'),
+]
+# Shown in the browser; anything else is served as a download
+INLINE_TYPES = {'image/jpeg', 'image/png', 'image/gif', 'image/webp', 'application/pdf'}
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def sniff(head):
+    for magic, content_type in SIGNATURES:
+        if head.startswith(magic):
+            return content_type
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'application/octet-stream'
+
+
+def attachment_dir():
+    return Path(getattr(settings, 'SELAVU_ATTACHMENT_DIR',
+                        os.path.join(settings.BASE_DIR, 'attachments')))
+
+
+def blob_path(digest, root=None):
+    return Path(root or attachment_dir()) / 'blobs' / digest[:2] / digest
+
+
+def thumbnail_path(digest, root=None):
+    return Path(root or attachment_dir()) / 'thumbs' / digest[:2] / f'{digest}.jpg'
+
+
+class BlobWriter:
+    """
+    ✅ Write a file into the store chunk by chunk, hashing as it goes; the
+    file only gets its content address once it is complete.
+    """
+
+    def __init__(self, root=None, max_bytes=None):
+        self.root = Path(root or attachment_dir())
+        self.max_bytes = max_bytes or getattr(
+            settings, 'SELAVU_ATTACHMENT_MAX_BYTES', 10 * 1024 * 1024)
+        tmp_dir = self.root / 'tmp'
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=tmp_dir, prefix='upload-')
+        self.file = os.fdopen(fd, 'wb')
+        self.hash = hashlib.sha256()
+        self.size = 0
+        self.head = b''
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self.discard()
+            raise ValueError(f"File is larger than {self.max_bytes} bytes")
+        if len(self.head) < 16:
+            self.head += data[:16 - len(self.head)]
+        self.hash.update(data)
+        self.file.write(data)
+
+    def reopen(self):
+        """
+        A read handle on what was written, taken before close(): it stays
+        readable even if the stored copy is pruned before it is attached
+        """
+        self.file.flush()
+        return open(self.tmp_path, 'rb')
+
+    def close(self):
+        """ Move the file to its content address; returns the digest """
+        self.file.close()
+        digest = self.hash.hexdigest()
+        path = blob_path(digest, self.root)
+        if path.exists():
+            os.unlink(self.tmp_path)  # ✅ Same bytes already stored
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(self.tmp_path, path)
+        return digest
+
+    def discard(self):
+        if not self.file.closed:
+            self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.unlink(self.tmp_path)
+
+
+class StoredUpload(UploadedFile):
+    """ An upload already in the blob store, as request.FILES hands it over """
+
+    def __init__(self, digest, name, content_type, size, root=None, file=None):
+        self.digest = digest
+        super().__init__(file or open(blob_path(digest, root), 'rb'), name, content_type, size)
+
+
+class BlobUploadHandler(FileUploadHandler):
+    """
+    ✅ Stream uploaded files straight into the blob store: no copy in
+    memory and no second temporary file. Files over
+    SELAVU_ATTACHMENT_MAX_BYTES are skipped and listed in
+    request.upload_errors.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.writer = BlobWriter()
+
+    def receive_data_chunk(self, raw_data, start):
+        try:
+            self.writer.write(raw_data)
+        except ValueError as e:
+            self.request.upload_errors = getattr(self.request, 'upload_errors', []) + [str(e)]
+            raise SkipFile() from e
+        return None  # Later handlers get nothing to buffer
+
+    def file_complete(self, file_size):
+        head = self.writer.head
+        content = self.writer.reopen()
+        digest = self.writer.close()
+        return StoredUpload(digest, self.file_name, sniff(head), file_size, file=content)
+
+    def upload_interrupted(self):
+        if hasattr(self, 'writer'):
+            self.writer.discard()
+
+
+def store_file(fileobj, root=None):
+    """ Store a readable file (imports, tests) the way uploads are; returns (digest, type, size) """
+    writer = BlobWriter(root)
+    try:
+        while True:
+            data = fileobj.read(STREAM_CHUNK_SIZE)
+            if not data:
+                break
+            writer.write(data)
+    except BaseException:
+        writer.discard()
+        raise
+    head = writer.head
+    return writer.close(), sniff(head), writer.size
+
+
+def attach(expense, user, digest, name, content_type, size, source=None):
+    """
+    ✅ Attach a stored blob to an expense. New blobs get their metadata and
+    thumbnail extracted in the background once the transaction commits.
+
+    Pass the upload as `source` and call this in a transaction: if prune()
+    removed the stored file in the meantime (the bytes had been stored
+    before and were orphaned), it is stored again from there.
+    """
+    blob, created = Blob.objects.get_or_create(
+        digest=digest, defaults={'size': size, 'content_type': content_type})
+    if source is not None and not blob_path(digest).exists():
+        source.seek(0)
+        if store_file(source)[0] != digest:
+            raise ValueError(f"Upload does not match blob {digest}")
+    attachment = Attachment.objects.create(
+        expense=expense, blob=blob, name=os.path.basename(name)[:255] or digest[:12],
+        uploaded_by=user)
+    if created:
+        transaction.on_commit(lambda: schedule(digest))
+    return attachment
+
+
+_executor = None
+
+
+def schedule(digest):
+    """ Run process_blob() on the worker pool, or inline with SELAVU_ATTACHMENT_WORKERS=0 """
+    global _executor
+    workers = getattr(settings, 'SELAVU_ATTACHMENT_WORKERS', 2)
+    if not workers:
+        process_blob(digest)
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='attachments')
+    _executor.submit(_process_in_worker, digest)
+
+
+def _process_in_worker(digest):
+    try:
+        process_blob(digest)
+    except Exception:
+        logger.exception("Processing attachment %s failed", digest)
+    finally:
+        # Each worker thread has its own connection; don't leave it open
+        connection.close()
+
+
+def process_blob(digest):
+    """ ✅ Image dimensions and a JPEG thumbnail, written next to the blob """
+    blob = Blob.objects.filter(digest=digest).first()
+    if blob is None or blob.processed_at is not None:
+        return
+    changes = {'processed_at': timezone.now()}
+    if Image is not None and blob.content_type.startswith('image/'):
+        try:
+            with Image.open(blob_path(digest)) as image:
+                changes['width'], changes['height'] = image.size
+                image.thumbnail(THUMBNAIL_SIZE)
+                target = thumbnail_path(digest)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                image.convert('RGB').save(target, 'JPEG', quality=80)
+                changes['has_thumbnail'] = True
+        except (OSError, ValueError, Image.DecompressionBombError):
+            # A broken image is still a valid attachment, just without a preview
+            logger.warning("No thumbnail for attachment %s", digest, exc_info=True)
+    Blob.objects.filter(digest=digest).update(**changes)
+
+
+def annotate_counts(expenses):
+    """
+    ✅ Set `attachment_count` on a page of expenses with one grouped query,
+    however many attachments the rows have.
+    """
+    expenses = list(expenses)
+    counts = dict(Attachment.objects.filter(
+        expense_id__in=[expense.pk for expense in expenses]).values('expense_id').annotate(
+        n=Count('id')).order_by().values_list('expense_id', 'n'))
+    for expense in expenses:
+        expense.attachment_count = counts.get(expense.pk, 0)
+    return expenses
+
+
+def stream_range(path, start, stop, chunk_size=STREAM_CHUNK_SIZE):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def file_response(request, path, content_type, etag, filename=None):
+    """
+    ✅ Serve a stored file with Range support (206/416), so large PDFs and
+    images can be resumed and seeked. Content never changes under a digest,
+    so the ETag alone answers conditional requests.
+    """
+    etag = f'"{etag}"'
+    if request.headers.get('If-None-Match') == etag:
+        return HttpResponseNotModified(headers={'ETag': etag})
+    size = path.stat().st_size
+    start, stop, status = 0, size, 200
+    match = RANGE.match(request.headers.get('Range', ''))
+    if match and request.headers.get('If-Range', etag) == etag and any(match.groups()):
+        first, last = match.groups()
+        if not first:  # bytes=-N: the last N bytes
+            start = max(size - int(last), 0)
+        else:
+            start = int(first)
+            stop = min(int(last) + 1, size) if last else size
+        if start >= stop:
+            return HttpResponse(status=416, headers={'Content-Range': f'bytes */{size}'})
+        status = 206
+
+    response = StreamingHttpResponse(stream_range(path, start, stop), status=status,
+                                     content_type=content_type)
+    response['Content-Length'] = stop - start
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    if status == 206:
+        response['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+    if filename is not None:
+        response['Content-Disposition'] = content_disposition_header(
+            content_type not in INLINE_TYPES, filename)
+    return response
+
+
+def prune(stale_after=timedelta(days=1)):
+    """
+    ✅ Delete blobs no attachment uses any more, with their files and
+    thumbnails, and temp files left by interrupted uploads. Returns
+    (blobs, temp files) removed.
+    """
+    orphans = set(Blob.objects.filter(attachments__isnull=True).values_list('digest', flat=True))
+    # ✅ The write lock is held until the files are gone too, so attach()
+    # (in its own transaction) sees either the blob with its file or neither
+    with transaction.atomic():
+        Blob.objects.filter(digest__in=orphans, attachments__isnull=True).delete()
+        # A blob re-attached before the delete keeps its row, and its file
+        orphans -= set(Blob.objects.filter(digest__in=orphans).values_list('digest', flat=True))
+        for digest in orphans:
+            for path in (blob_path(digest), thumbnail_path(digest)):
+                path.unlink(missing_ok=True)
+
+    tmp_files = 0
+    cutoff = (timezone.now() - stale_after).timestamp()
+    tmp_dir = attachment_dir() / 'tmp'
+    if tmp_dir.is_dir():
+        for path in tmp_dir.iterdir():
+            if path.stat().st_mtime < cutoff:
+                path.unlink(missing_ok=True)
+                tmp_files += 1
+    return len(orphans), tmp_files
@@ -0,0 +1,221 @@
+import threading
+from contextlib import contextmanager
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from . import rollups
+from .models import Category, Expense, Income, LedgerCheckpoint, LedgerEvent
+
+# Audited models, by the name their events and checkpoints use
+MODELS = {'expense': Expense, 'income': Income, 'category': Category}
+NAMES = {model: name for name, model in MODELS.items()}
+
+# Events collected by collected() instead of being inserted one by one
+_pending = threading.local()
+
+
+def owner_id(instance):
+    return instance.user_id if isinstance(instance, Category) else instance.add_by_id
+
+
+def row_data(instance, fields=None):
+    """ {attname: value} of the row's concrete fields, or only of `fields` """
+    return {field.attname: field.value_from_object(instance)
+            for field in instance._meta.concrete_fields
+            if fields is None or field.name in fields or field.attname in fields}
+
+
+def event_for(instance, action, fields=None):
+    return LedgerEvent(user_id=owner_id(instance), model=NAMES[type(instance)],
+                       object_id=instance.pk, action=action, data=row_data(instance, fields))
+
+
+def record(instance, action):
+    """ ✅ Log one save or delete; the caller's transaction makes it atomic with the change """
+    write([event_for(instance, action)])
+
+
+def record_many(instances, action, fields=None):
+    """ ✅ Log rows written in bulk (bulk_create, queryset.update) with one INSERT """
+    write([event_for(instance, action, fields) for instance in instances])
+
+
+@contextmanager
+def collected():
+    """
+    ✅ Collect the events of every record() inside the block and insert them
+    together on the way out. Use in the same transaction as the writes.
+    """
+    if collecting():
+        yield  # The outer block inserts everything
+        return
+    _pending.events = []
+    try:
+        yield
+        events, _pending.events = _pending.events, None
+        write(events)
+    finally:
+        _pending.events = None
+
+
+def collecting():
+    return getattr(_pending, 'events', None) is not None
+
+
+def write(events, batch_size=500):
+    if not events:
+        return
+    if collecting():
+        _pending.events.extend(events)
+        return
+    now = timezone.now()
+    for event in events:
+        event.created_at = now
+    LedgerEvent.objects.bulk_create(events, batch_size=batch_size)
+    checkpoint_if_due(events)
+
+
+# {user id: (checkpoint interval, last event id seen, event id from which a
+# checkpoint may be due)}, so most writes decide without a query
+_due = {}
+
+
+def checkpoint_if_due(events):
+    """
+    ✅ Take a new checkpoint for users with SELAVU_AUDIT_CHECKPOINT_EVERY
+    events since their last one, so a replay never reads more than that.
+
+    Event ids are shared by all users, so a user can't have `every` new
+    events before the ids have moved on by `every` past their checkpoint.
+    Until then the write costs nothing; after that one COUNT says how far
+    to look next. Ids going backwards (a rolled-back write) start over.
+    """
+    every = getattr(settings, 'SELAVU_AUDIT_CHECKPOINT_EVERY', 1000)
+    last_ids = {}
+    for event in events:
+        last_ids[event.user_id] = max(event.pk or 0, last_ids.get(event.user_id, 0))
+    unknown = [user_id for user_id, last_id in last_ids.items()
+               if user_id not in _due or _due[user_id][0] != every
+               or not last_id or last_id <= _due[user_id][1]]
+    if unknown:
+        for user_id, checkpointed in _checkpointed(unknown).items():
+            _due[user_id] = (every, 0, checkpointed + every)
+    due = [user_id for user_id, last_id in last_ids.items()
+           if not last_id or last_id >= _due[user_id][2]]
+    for user_id, last_id in last_ids.items():
+        _due[user_id] = (every, last_id, _due[user_id][2])
+    if not due:
+        return
+
+    latest = _checkpointed(due)
+    since = reduce(or_, (Q(user_id=user_id, pk__gt=latest[user_id]) for user_id in due))
+    counts = dict(LedgerEvent.objects.filter(since).values('user_id').annotate(
+        events=Count('id')).order_by().values_list('user_id', 'events'))
+    for user_id in due:
+        events = counts.get(user_id, 0)
+        if events >= every:
+            checkpoint = take_checkpoint(user_id)
+            next_check = checkpoint.last_event_id + every
+        else:
+            next_check = last_ids[user_id] + every - events
+        _due[user_id] = (every, last_ids[user_id], next_check)
+
+
+def _checkpointed(user_ids):
+    """ {user id: last event id of their latest checkpoint, 0 for none} """
+    latest = dict(LedgerCheckpoint.objects.filter(user_id__in=user_ids).values(
+        'user_id').annotate(last=Max('last_event_id')).values_list('user_id', 'last'))
+    return {user_id: latest.get(user_id, 0) for user_id in user_ids}
+
+
+def take_checkpoint(user_id):
+    """ Checkpoint the user's ledger as of their latest event """
+    state, last = replay(user_id)
+    if last is None:
+        return None
+    return LedgerCheckpoint.objects.create(user_id=user_id, last_event_id=last.pk,
+                                           taken_at=last.created_at, state=state)
+
+
+def baseline(users):
+    """
+    ✅ Checkpoint users' ledgers straight from the tables, for rows written
+    without events (seeded data, rows older than the log). Later replays
+    start from here.
+    """
+    last_id = LedgerEvent.objects.aggregate(last=Max('id'))['last'] or 0
+    taken_at = timezone.now()
+    user_ids = [getattr(user, 'pk', user) for user in users]
+    states = {user_id: {name: {} for name in MODELS} for user_id in user_ids}
+    for name, model in MODELS.items():
+        owner = 'user_id' if model is Category else 'add_by_id'
+        for row in model.objects.filter(**{f'{owner}__in': user_ids}).values().iterator():
+            states[row[owner]][name][str(row['id'])] = row
+    LedgerCheckpoint.objects.bulk_create(
+        LedgerCheckpoint(user_id=user_id, last_event_id=last_id, taken_at=taken_at, state=state)
+        for user_id, state in states.items())
+
+
+def replay(user_id, when=None):
+    """
+    ✅ The user's ledger state as of `when` (default: now) as
+    ({model name: {pk: fields}}, last event applied): the nearest checkpoint
+    at or before `when`, plus the events after it.
+    """
+    checkpoints = LedgerCheckpoint.objects.filter(user_id=user_id)
+    events = LedgerEvent.objects.filter(user_id=user_id)
+    if when is not None:
+        checkpoints = checkpoints.filter(taken_at__lte=when)
+        events = events.filter(created_at__lte=when)
+    checkpoint = checkpoints.order_by('-last_event_id').first()
+    if checkpoint is None:
+        state, last_id = {name: {} for name in MODELS}, 0
+    else:
+        state, last_id = checkpoint.state, checkpoint.last_event_id
+    last = None
+    for event in events.filter(pk__gt=last_id).order_by('pk').iterator():
+        rows = state[event.model]
+        key = str(event.object_id)
+        if event.action == LedgerEvent.DELETE:
+            rows.pop(key, None)
+        else:
+            rows.setdefault(key, {}).update(event.data)
+        last = event
+    if last is None and checkpoint is not None:
+        last = LedgerEvent(pk=checkpoint.last_event_id, created_at=checkpoint.taken_at)
+    return state, last
+
+
+def instances(name, rows):
+    """ Unsaved model instances for replayed rows, with their fields' Python types """
+    model = MODELS[name]
+    fields = {field.attname: field for field in model._meta.concrete_fields}
+    return [model(**{attname: fields[attname].to_python(value)
+                     for attname, value in data.items() if attname in fields})
+            for data in rows.values()]
+
+
+def ledger_as_of(user, when):
+    """ ✅ {'expense': [...], 'income': [...], 'category': [...]} as they were at `when` """
+    state, _ = replay(getattr(user, 'pk', user), when)
+    return {name: instances(name, rows) for name, rows in state.items()}
+
+
+def cycle_totals(ledger):
+    """
+    ✅ Cycle totals of a ledger_as_of() result, as the rollups showed them:
+    {(cycle start, kind, category id, source): (total, count)}, in the
+    user's current home currency at each row's date.
+    """
+    entries = [(rollups.entry_of(row), 1) for name in ('expense', 'income')
+               for row in ledger[name]]
+    return {key[1:]: (total, count)
+            for key, (total, count) in rollups.signed_deltas(entries).items() if count}
+
+
+def totals_as_of(user, when):
+    return cycle_totals(ledger_as_of(user, when))
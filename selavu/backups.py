@@ -0,0 +1,144 @@
+import os
+import sqlite3
+import zlib
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+
+BACKUP_DIR = Path(getattr(settings, 'SELAVU_BACKUP_DIR',
+                          os.path.join(settings.BASE_DIR, 'backups')))
+# How many backup_*.sqlite3 files to keep in BACKUP_DIR
+BACKUP_KEEP = getattr(settings, 'SELAVU_BACKUP_KEEP', 10)
+# Pages copied per backup step; the source is unlocked between steps
+BACKUP_STEP_PAGES = getattr(settings, 'SELAVU_BACKUP_STEP_PAGES', 1024)
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class BackupError(Exception):
+    pass
+
+
+def database_path(alias='default'):
+    return str(settings.DATABASES[alias]['NAME'])
+
+
+def online_backup(target_path, source_path=None, pages=BACKUP_STEP_PAGES, sleep=0.005):
+    """
+    ✅ Copy a live SQLite database with the online backup API.
+
+    Pages are copied `pages` at a time and the source is released between
+    steps, so writers keep going while the backup runs. The copy is written
+    next to `target_path` and renamed into place once complete, so a
+    half-written file is never left behind under the final name.
+    """
+    source_path = source_path or database_path()
+    target_path = Path(target_path)
+    target_path.parent.mkdir(parents=True, exist_ok=True)
+    partial_path = target_path.with_name(target_path.name + '.partial')
+
+    try:
+        source = sqlite3.connect(f"file:{source_path}?mode=ro", uri=True)
+        try:
+            target = sqlite3.connect(partial_path)
+            try:
+                source.backup(target, pages=pages, sleep=sleep)
+            finally:
+                target.close()
+        finally:
+            source.close()
+    except sqlite3.Error as e:
+        partial_path.unlink(missing_ok=True)
+        raise BackupError(f"Backup of {source_path} failed: {e}")
+    os.replace(partial_path, target_path)
+    return target_path
+
+
+def backup_name(when=None):
+    return f"backup_{(when or datetime.now()).strftime('%Y-%m-%d_%H-%M-%S')}.sqlite3"
+
+
+def create_backup(backup_dir=BACKUP_DIR, keep=BACKUP_KEEP, source_path=None):
+    """ Take a timestamped backup into `backup_dir` and rotate old ones out (keep=None: don't) """
+    path = online_backup(Path(backup_dir) / backup_name(), source_path=source_path)
+    if keep is not None:
+        rotate_backups(backup_dir, keep)
+    return path
+
+
+def list_backups(backup_dir=BACKUP_DIR):
+    """ backup_*.sqlite3 files, newest first (names sort by timestamp) """
+    return sorted(Path(backup_dir).glob('backup_*.sqlite3'), reverse=True)
+
+
+def rotate_backups(backup_dir=BACKUP_DIR, keep=BACKUP_KEEP):
+    removed = []
+    for path in list_backups(backup_dir)[keep:]:
+        path.unlink()
+        removed.append(path)
+    return removed
+
+
+def stream_file(path, compress=False, chunk_size=STREAM_CHUNK_SIZE):
+    """ Yield a file in chunks, optionally gzip-compressed on the fly """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            if compressor:
+                chunk = compressor.compress(chunk)
+                if not chunk:
+                    continue
+            yield chunk
+    if compressor:
+        yield compressor.flush()
+
+
+def check_integrity(path):
+    """ Raise BackupError unless PRAGMA integrity_check reports ok """
+    if not Path(path).is_file():
+        raise BackupError(f"{path} does not exist")
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            result = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError as e:
+        raise BackupError(f"{path} is not a usable SQLite database: {e}")
+    if result != ['ok']:
+        raise BackupError(f"{path} failed the integrity check: {'; '.join(result[:5])}")
+
+
+def restore_backup(backup_path, target_path=None, keep_safety_copy=True):
+    """
+    Check `backup_path` and copy it over the live database through the
+    backup API. The current database is saved first as a safety copy.
+    Returns the safety copy's path, if one was taken.
+    """
+    check_integrity(backup_path)
+    target_path = target_path or database_path()
+
+    safety_copy = None
+    if keep_safety_copy and Path(target_path).is_file():
+        safety_copy = online_backup(
+            BACKUP_DIR / f"pre_restore_{backup_name()}", source_path=target_path)
+
+    connections.close_all()  # Don't keep Django's handles on the old pages
+    try:
+        source = sqlite3.connect(f"file:{backup_path}?mode=ro", uri=True)
+        try:
+            target = sqlite3.connect(target_path)
+            try:
+                source.backup(target, pages=BACKUP_STEP_PAGES)
+            finally:
+                target.close()
+        finally:
+            source.close()
+    except sqlite3.Error as e:
+        raise BackupError(f"Restore into {target_path} failed: {e}")
+    check_integrity(target_path)
+    return safety_copy
@@ -0,0 +1,156 @@
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DecimalField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .caching import cached_for_cycle
+from .cycles import current_cycle
+from .models import Budget, Category, CycleRollup
+from .notifiers import notify
+
+# Alert when spending first reaches this share of a budget, then again past it
+WARN_PERCENT = getattr(settings, 'SELAVU_BUDGET_WARN_PERCENT', 80)
+
+BudgetStatus = namedtuple('BudgetStatus', ['category', 'budget', 'spent', 'percent', 'over'])
+
+
+class BudgetAlert(namedtuple('BudgetAlert', [
+        'user_id', 'category', 'cycle_start', 'budget', 'spent', 'level'])):
+    WARNING = 'warning'
+    OVER = 'over'
+
+    @property
+    def message(self):
+        if self.level == self.OVER:
+            return (f"Over budget: {self.category} spent {self.spent} of {self.budget} "
+                    f"in the cycle starting {self.cycle_start}")
+        return (f"{self.category} has used {WARN_PERCENT}% of its budget "
+                f"({self.spent} of {self.budget}) in the cycle starting {self.cycle_start}")
+
+    def as_dict(self):
+        return dict(self._asdict(), message=self.message)
+
+
+def budget_for(user_id, category_id, cycle_start):
+    """ The cycle's own budget if set, otherwise the every-cycle one """
+    amounts = dict(Budget.objects.filter(
+        Q(cycle_start=cycle_start) | Q(cycle_start__isnull=True),
+        user_id=user_id, category_id=category_id,
+    ).values_list('cycle_start', 'amount'))
+    return amounts.get(cycle_start, amounts.get(None))
+
+
+def crossed_level(before, after, budget):
+    """ The highest threshold spending moved past, if any """
+    if before <= budget < after:
+        return BudgetAlert.OVER
+    warn_at = budget * WARN_PERCENT / 100
+    if before < warn_at <= after and after <= budget:
+        return BudgetAlert.WARNING
+    return None
+
+
+def _alert_if_crossed(key, amount, spent, budget, names=None):
+    user_id, cycle_start, _, category_id, _ = key
+    level = crossed_level(spent - amount, spent, budget)
+    if level is None:
+        return None
+    if names is None or category_id not in names:
+        names = dict(Category.objects.filter(pk=category_id).values_list('pk', 'name'))
+    alert = BudgetAlert(user_id, names.get(category_id), cycle_start, budget, spent, level)
+    # ✅ Rolled back saves don't alert
+    transaction.on_commit(lambda: notify(alert))
+    return alert
+
+
+def evaluate(key, amount):
+    """
+    ✅ Called after a rollup row moved by `amount`: compares the running
+    total before and after against the category budget, without rescanning
+    the cycle, and queues an alert for commit when a threshold was crossed.
+    """
+    user_id, cycle_start, kind, category_id, _ = key
+    if kind != CycleRollup.EXPENSE or amount <= 0:
+        return None
+    budget = budget_for(user_id, category_id, cycle_start)
+    if budget is None:
+        return None
+    spent = CycleRollup.objects.filter(
+        user_id=user_id, cycle_start=cycle_start, kind=kind, category_id=category_id,
+    ).values_list('total', flat=True).first() or 0
+    return _alert_if_crossed(key, amount, spent, budget)
+
+
+def evaluate_many(moves, batch_size=500):
+    """
+    evaluate() for bulk writes: `moves` are (rollup key, amount, new total)
+    and the budgets of every touched user are read in chunks up front.
+    """
+    moves = [m for m in moves if m[0][2] == CycleRollup.EXPENSE and m[1] > 0]
+    user_ids = sorted({key[0] for key, _, _ in moves})
+    budgets = {}
+    for i in range(0, len(user_ids), batch_size):
+        budgets.update({
+            (user_id, category_id, cycle_start): amount
+            for user_id, category_id, cycle_start, amount in Budget.objects.filter(
+                user_id__in=user_ids[i:i + batch_size],
+            ).values_list('user_id', 'category_id', 'cycle_start', 'amount')})
+    if not budgets:
+        return []
+
+    alerts = []
+    names = {}
+    for key, amount, spent in moves:
+        user_id, cycle_start, _, category_id, _ = key
+        budget = budgets.get((user_id, category_id, cycle_start),
+                             budgets.get((user_id, category_id, None)))
+        if budget is not None:
+            alert = _alert_if_crossed(key, amount, spent, budget, names)
+            if alert:
+                alerts.append(alert)
+    return alerts
+
+
+def _statuses(user, cycle):
+    from .workspaces import members_category_totals
+
+    # Shared categories count every member's spending, not only the user's
+    others = members_category_totals(user, cycle)
+    spent = CycleRollup.objects.filter(
+        user=user, kind=CycleRollup.EXPENSE, cycle_start=cycle.start,
+        category=OuterRef('category'),
+    ).values('total')[:1]
+    rows = Budget.objects.filter(
+        Q(cycle_start=cycle.start) | Q(cycle_start__isnull=True), user=user,
+    ).annotate(spent=Coalesce(Subquery(spent), Value(0),
+                              output_field=DecimalField(max_digits=14, decimal_places=2)),
+    ).values_list('category_id', 'category__name', 'cycle_start', 'amount', 'spent')
+
+    statuses = {}
+    # Every-cycle budgets go last, so a cycle's own budget wins
+    for category_id, name, cycle_start, budget, spent_total in sorted(
+            rows, key=lambda row: row[2] is None):
+        if category_id in statuses and cycle_start is None:
+            continue
+        spent_total += others.get(category_id, 0)
+        percent = round(spent_total / budget * 100, 1) if budget else None
+        statuses[category_id] = BudgetStatus(name, budget, spent_total, percent,
+                                             spent_total > budget)
+    return statuses
+
+
+def budget_status(user, cycle=None):
+    """ ✅ {category_id: BudgetStatus} for the cycle, cached until the ledger changes """
+    cycle = cycle or current_cycle(user)
+    return cached_for_cycle(user, cycle, 'budgets', lambda: _statuses(user, cycle))
+
+
+def budget_expression(user, cycle):
+    """ Category queryset annotation: the budget that applies in the cycle """
+    budgets = Budget.objects.filter(user=user, category=OuterRef('pk'))
+    return Coalesce(
+        Subquery(budgets.filter(cycle_start=cycle.start).values('amount')[:1]),
+        Subquery(budgets.filter(cycle_start__isnull=True).values('amount')[:1]),
+        output_field=DecimalField(max_digits=12, decimal_places=2))
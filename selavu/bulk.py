@@ -0,0 +1,69 @@
+from django.db import transaction
+
+from . import audit, rollups, workspaces
+from .caching import bump_versions
+from .classifier import CLASSIFIER_SCOPE
+from .models import Expense, LedgerEvent
+
+
+def create_expenses(user, forms, batch_size=500):
+    """
+    ✅ Save already validated ExpenseForms as `user`'s expenses with one
+    bulk_create in one transaction. The rollups are folded in afterwards,
+    since bulk_create skips the save signals.
+    """
+    expenses = []
+    for form in forms:
+        expense = form.save(commit=False)
+        expense.add_by = user
+        expenses.append(expense)
+    with transaction.atomic():
+        Expense.objects.bulk_create(expenses, batch_size=batch_size)
+        rollups.apply_many(expenses, batch_size=batch_size)
+        audit.record_many(expenses, LedgerEvent.CREATE)
+        workspaces.touch({expense.workspace_id for expense in expenses})
+    return expenses
+
+
+def _move(queryset, **changes):
+    """ One UPDATE for every row, then one rollup write for all the buckets they left """
+    queryset = queryset.order_by()
+    with rollups.batched():
+        rows = list(queryset.only('add_by', 'date', 'amount', 'currency', 'category',
+                                  'workspace'))
+        queryset.update(**changes)
+        touched = {row.workspace_id for row in rows}
+        for row in rows:
+            previous = rollups.snapshot(row)
+            for name, value in changes.items():
+                setattr(row, name, value)
+            rollups.record_change(previous, rollups.snapshot(row))
+        audit.record_many(rows, LedgerEvent.UPDATE, fields=changes)
+        workspaces.touch(touched | {row.workspace_id for row in rows})
+        # The classifier learned these rows as they were
+        bump_versions({row.add_by_id for row in rows}, CLASSIFIER_SCOPE)
+    return len(rows)
+
+
+def recategorize(queryset, category):
+    """ ✅ Move every expense in the queryset to `category`; returns how many """
+    # Expenses live in their category's workspace
+    return _move(queryset, category=category, workspace_id=category.workspace_id)
+
+
+def redate(queryset, day):
+    """ ✅ Give every expense in the queryset the date `day`; returns how many """
+    return _move(queryset, date=day)
+
+
+def delete_many(queryset):
+    """
+    ✅ Queryset delete whose per-row signals only collect their rollup
+    changes and audit events, written once at the end. Returns
+    queryset.delete()'s result.
+    """
+    with rollups.batched(), audit.collected():
+        owners = set(queryset.order_by().values_list('add_by', 'workspace').distinct())
+        bump_versions({user_id for user_id, _ in owners}, CLASSIFIER_SCOPE)
+        workspaces.touch({workspace_id for _, workspace_id in owners})
+        return queryset.delete()
@@ -0,0 +1,61 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+
+CACHE_ALIAS = getattr(settings, 'SELAVU_CACHE_ALIAS', 'dashboard')
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _version_key(user_id, scope):
+    return f"selavu:{scope}-version:{user_id}"
+
+
+def ledger_version(user_id, scope='ledger'):
+    """
+    ✅ Opaque version of a user's ledger; it changes on every write. A missing
+    version (cold or evicted cache) starts a new one, which is only a miss.
+    Other scopes are versions bumped by their own subset of writes.
+    """
+    key = _version_key(user_id, scope)
+    version = _cache().get(key)
+    if version is None:
+        version = str(time.time_ns())
+        # add() so two workers starting the version at once agree on it
+        if not _cache().add(key, version, timeout=None):
+            version = _cache().get(key) or version
+    return version
+
+
+def _bump(user_ids, scope):
+    version = str(time.time_ns())
+    _cache().set_many({_version_key(user_id, scope): version for user_id in user_ids},
+                      timeout=None)
+
+
+def bump_versions(user_ids, scope='ledger'):
+    """
+    ✅ Invalidate everything cached for these users. The version is bumped now
+    and again after commit, so a reader that recomputed from the not yet
+    committed state can't leave its result under the current version.
+    """
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return
+    _bump(user_ids, scope)
+    transaction.on_commit(lambda: _bump(user_ids, scope))
+
+
+def cached_for_cycle(user, cycle, name, compute, timeout=DEFAULT_TIMEOUT):
+    """ ✅ compute() once per (user, cycle, ledger version) """
+    key = f"selavu:{name}:{user.pk}:{cycle.start.isoformat()}:{ledger_version(user.pk)}"
+    value = _cache().get(key)
+    if value is None:
+        value = compute()
+        _cache().set(key, value, timeout=timeout)
+    return value
@@ -0,0 +1,182 @@
+import math
+import re
+import threading
+from collections import Counter, OrderedDict, defaultdict, namedtuple
+from decimal import Decimal
+
+from django.conf import settings
+
+from .caching import ledger_version
+from .models import CategoryRule, Expense
+
+# Bumped by writes that change what a user's classifier has already learned
+# (rule changes, edited or deleted expenses); plain new expenses are learned
+# incrementally instead
+CLASSIFIER_SCOPE = 'classifier'
+
+# Words only: reference numbers and dates differ on every statement line
+WORD = re.compile(r'[^\W\d_]{2,}', re.UNICODE)
+BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=')
+
+Suggestion = namedtuple('Suggestion', ['category_id', 'source', 'confidence'])
+
+
+def tokens(description, amount=None):
+    """ Lower-cased words of the description, plus the amount's order of magnitude """
+    words = [word.lower() for word in WORD.findall(description or '')]
+    if amount is not None:
+        amount = abs(Decimal(str(amount)))
+        words.append(f'#amount:{len(str(int(amount)))}')
+    return words
+
+
+class RuleMatcher:
+    """
+    ✅ A user's CategoryRules compiled into one regex. Every rule is a
+    lookahead alternative, so a single search tries them in priority order
+    and `lastgroup` names the rule that matched.
+    """
+
+    def __init__(self, rules):
+        # rules: (pattern, is_regex, category_id) in priority order
+        self.categories = []
+        self.regex = None
+        self.rules = []
+        alternatives = []
+        for index, (pattern, is_regex, category_id) in enumerate(rules):
+            body = pattern if is_regex else re.escape(pattern)
+            alternatives.append(f'(?=.*?(?:{body}))(?P<rule{index}>)')
+            self.categories.append(category_id)
+            self.rules.append((body, category_id))
+        if not alternatives:
+            return
+        # Backreferences count groups, which merging renumbers
+        if not any(BACKREFERENCE.search(body) for body, _ in self.rules):
+            try:
+                self.regex = re.compile('|'.join(alternatives), re.IGNORECASE | re.DOTALL)
+            except re.error:
+                pass  # e.g. inline flags that are only valid at a pattern's start
+        if self.regex is None:
+            self.rules = [(re.compile(body, re.IGNORECASE), category_id)
+                          for body, category_id in self.rules]
+
+    def match(self, description):
+        """ Category id of the first rule matching `description`, or None """
+        if self.regex is not None:
+            found = self.regex.match(description)
+            return self.categories[int(found.lastgroup[4:])] if found else None
+        for pattern, category_id in self.rules:
+            if pattern.search(description):
+                return category_id
+        return None
+
+
+class NaiveBayes:
+    """
+    ✅ Multinomial naive Bayes over token counts with add-one smoothing.
+    learn() folds in one more example, so the model grows with the ledger
+    instead of being retrained from scratch.
+    """
+
+    def __init__(self):
+        self.documents = Counter()
+        self.counts = defaultdict(Counter)
+        self.totals = Counter()
+        self.vocabulary = set()
+
+    def learn(self, label, words):
+        self.documents[label] += 1
+        self.counts[label].update(words)
+        self.totals[label] += len(words)
+        self.vocabulary.update(words)
+
+    def predict(self, words):
+        """ (label, posterior probability) of the likeliest label, or None untrained """
+        if not self.documents:
+            return None
+        documents = sum(self.documents.values())
+        size = len(self.vocabulary) + 1
+        scores = {}
+        for label, count in self.documents.items():
+            counts = self.counts[label]
+            denominator = math.log(self.totals[label] + size)
+            scores[label] = math.log(count / documents) + sum(
+                math.log(counts[word] + 1) - denominator for word in words)
+        best = max(scores, key=scores.get)
+        # Softmax of the log scores, shifted so the best one is exp(0)
+        evidence = sum(math.exp(score - scores[best]) for score in scores.values())
+        return best, 1 / evidence
+
+
+class Classifier:
+    """ ✅ Rules first, then the model trained on the user's own expenses """
+
+    def __init__(self, user_id, version):
+        self.user_id = user_id
+        self.version = version
+        self.matcher = RuleMatcher(CategoryRule.objects.filter(user_id=user_id).values_list(
+            'pattern', 'is_regex', 'category_id'))
+        self.model = NaiveBayes()
+        self.last_id = 0
+        self.ledger = None
+        # Requests of one user may share the instance across threads
+        self.lock = threading.Lock()
+
+    def catch_up(self):
+        """ Learn the expenses added since the last call; no query when there are none """
+        ledger = ledger_version(self.user_id)
+        if ledger == self.ledger:
+            return
+        with self.lock:
+            rows = Expense.objects.filter(add_by_id=self.user_id, pk__gt=self.last_id).order_by(
+                'pk').values_list('pk', 'category_id', 'description', 'amount')
+            for pk, category_id, description, amount in rows.iterator():
+                self.model.learn(category_id, tokens(description, amount))
+                self.last_id = pk
+            self.ledger = ledger
+
+    def suggest(self, description, amount=None, min_confidence=None):
+        """ Suggestion for a new expense, or None when nothing is confident enough """
+        category_id = self.matcher.match(description or '')
+        if category_id is not None:
+            return Suggestion(category_id, 'rule', 1.0)
+        if min_confidence is None:
+            min_confidence = getattr(settings, 'SELAVU_CLASSIFIER_MIN_CONFIDENCE', 0.6)
+        with self.lock:
+            predicted = self.model.predict(tokens(description, amount))
+        if predicted is None or predicted[1] < min_confidence:
+            return None
+        return Suggestion(predicted[0], 'model', predicted[1])
+
+
+_classifiers = OrderedDict()
+_lock = threading.Lock()
+
+
+def classifier_for(user):
+    """
+    ✅ The user's classifier from this process' memory, brought up to date:
+    rebuilt after rule changes or edits, otherwise only taught the new rows.
+    """
+    user_id = getattr(user, 'pk', user)
+    version = ledger_version(user_id, CLASSIFIER_SCOPE)
+    with _lock:
+        classifier = _classifiers.get(user_id)
+        if classifier is not None and classifier.version == version:
+            _classifiers.move_to_end(user_id)
+        else:
+            classifier = None
+    if classifier is None:
+        # Built outside the lock, so one user's training doesn't stall the others
+        classifier = Classifier(user_id, version)
+        with _lock:
+            _classifiers[user_id] = classifier
+            # Least recently used users go first
+            while len(_classifiers) > getattr(settings, 'SELAVU_CLASSIFIER_CACHE_SIZE', 256):
+                _classifiers.popitem(last=False)
+    classifier.catch_up()
+    return classifier
+
+
+def suggest_category(user, description, amount=None):
+    return classifier_for(user).suggest(description, amount)
@@ -0,0 +1,177 @@
+import csv
+import io
+from bisect import bisect_right
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import (
+    ArchivedExpense, Expense, ExchangeRate, Income, Profile, default_currency)
+
+CENT = Decimal('0.01')
+RATE_PLACES = Decimal('1e-10')  # ExchangeRate.rate's decimal places
+SYMBOLS = {'INR': '₹', 'USD': '$', 'EUR': '€', 'GBP': '£', 'JPY': '¥'}
+
+
+class MissingRate(ValueError):
+    pass
+
+
+def base_currency():
+    """ The currency the loaded rates are quoted in; its own rate is always 1 """
+    return getattr(settings, 'SELAVU_BASE_CURRENCY', None) or default_currency()
+
+
+def home_currency_for(user):
+    """ ✅ The user's home currency, looked up once per user object """
+    if user is None or not getattr(user, 'pk', None):
+        return default_currency()
+    if not hasattr(user, '_home_currency'):
+        user._home_currency = home_currency_for_id(user.pk)
+    return user._home_currency
+
+
+def home_currency_for_id(user_id):
+    code = Profile.objects.filter(user_id=user_id).values_list(
+        'home_currency', flat=True).first()
+    return code or default_currency()
+
+
+def home_currencies_for_ids(user_ids=None):
+    """ {user_id: home currency} in one query, for bulk jobs; profile-less users are left out """
+    profiles = Profile.objects.all()
+    if user_ids is not None:
+        profiles = profiles.filter(user_id__in=user_ids)
+    return dict(profiles.values_list('user_id', 'home_currency'))
+
+
+class RateCache:
+    """
+    ✅ Exchange rates for one batch of conversions. load() reads the rates
+    the batch needs with one query per currency, and every later lookup is a
+    bisect over that currency's dates.
+    """
+
+    def __init__(self):
+        self.base = base_currency()
+        self.series = {}
+
+    def load(self, pairs):
+        """ Make sure rates for every (currency, day) pair are at hand """
+        spans = {}
+        for currency, day in pairs:
+            if currency == self.base:
+                continue
+            first, last = spans.get(currency, (day, day))
+            spans[currency] = (min(first, day), max(last, day))
+        for currency, (first, last) in spans.items():
+            loaded = self.series.get(currency)
+            if loaded is not None and loaded[2] <= first and last <= loaded[3]:
+                continue
+            self.series[currency] = self._read(currency, first, last)
+
+    @staticmethod
+    def _read(currency, first, last):
+        rates = ExchangeRate.objects.filter(currency=currency)
+        # The last rate before the span covers its first days; without one,
+        # the earliest rate after it does
+        since = rates.filter(date__lt=first).order_by('-date').values_list(
+            'date', flat=True).first() or first
+        rows = list(rates.filter(date__gte=since, date__lte=last).order_by(
+            'date').values_list('date', 'rate'))
+        if not rows:
+            rows = list(rates.filter(date__gt=last).order_by('date').values_list(
+                'date', 'rate')[:1])
+        return ([day for day, _ in rows], [rate for _, rate in rows], first, last)
+
+    def rate(self, currency, day):
+        """ Base-currency value of one unit of `currency` on `day` """
+        if currency == self.base:
+            return Decimal(1)
+        if currency not in self.series:
+            self.load([(currency, day)])
+        dates, rates, _, _ = self.series[currency]
+        if not rates:
+            raise MissingRate(f"No exchange rate for {currency}")
+        return rates[max(bisect_right(dates, day) - 1, 0)]
+
+    def convert(self, amount, currency, to_currency, day):
+        """ `amount` in `to_currency` at `day`'s rates, rounded to cents """
+        if currency == to_currency:
+            return amount
+        amount = Decimal(amount) * self.rate(currency, day) / self.rate(to_currency, day)
+        return amount.quantize(CENT)
+
+
+def convert(amount, currency, to_currency, day):
+    """ One-off conversion; batches should share a RateCache instead """
+    return RateCache().convert(amount, currency, to_currency, day)
+
+
+def money(amount, currency):
+    """ "₹1,234.50", or "CHF 1,234.50" for currencies without a known symbol """
+    amount = Decimal(amount or 0).quantize(CENT)
+    symbol = SYMBOLS.get(currency)
+    return f"{symbol}{amount:,}" if symbol else f"{currency} {amount:,}"
+
+
+def parse_rates(fileobj, inverse=False):
+    """
+    Yield (currency, date, rate) from a CSV with date, currency and rate
+    columns: one unit of `currency` is worth `rate` base units. With
+    `inverse`, the file quotes units of `currency` per base unit instead.
+    """
+    if isinstance(fileobj, (bytes, bytearray)):
+        fileobj = io.StringIO(fileobj.decode('utf-8-sig'))
+    for line, row in enumerate(csv.DictReader(fileobj), start=2):
+        try:
+            currency = row['currency'].strip().upper()
+            day = date.fromisoformat(row['date'].strip())
+            rate = Decimal(row['rate'].strip())
+        except (KeyError, AttributeError, ValueError, InvalidOperation) as e:
+            raise ValueError(f"Line {line}: expected date, currency and rate ({e})") from e
+        if not rate.is_finite() or rate <= 0:
+            raise ValueError(f"Line {line}: rate must be positive")
+        yield currency, day, ((1 / rate).quantize(RATE_PLACES) if inverse else rate)
+
+
+def rebuild_for_currencies(currencies):
+    """
+    ✅ Rebuild the rollups of every user whose totals use these currencies'
+    rates: users with rows in them, and users keeping their totals in them.
+    Returns how many users were rebuilt.
+    """
+    from . import rollups  # rollups converts through this module
+
+    currencies = sorted(set(currencies))
+    users = set(Profile.objects.filter(
+        home_currency__in=currencies).values_list('user_id', flat=True))
+    changed = Q(currency__in=currencies)
+    if default_currency() in currencies:
+        # Users without a profile keep their totals in the default currency
+        changed |= Q(add_by__profile__isnull=True) & ~Q(currency=default_currency())
+    for model in (Expense, ArchivedExpense, Income):
+        users.update(model.objects.filter(changed).order_by().values_list(
+            'add_by', flat=True).distinct())
+    if users:
+        rollups.rebuild(users=sorted(users))
+    return len(users)
+
+
+def load_rates(rows, batch_size=1000):
+    """
+    ✅ Upsert (currency, date, rate) rows in bulk, then rebuild the rollups
+    that used the changed currencies. Returns (rates written, users rebuilt).
+    """
+    rates = [ExchangeRate(currency=currency, date=day, rate=rate) for currency, day, rate in rows]
+    if not rates:
+        return 0, 0
+    with transaction.atomic():
+        ExchangeRate.objects.bulk_create(
+            rates, batch_size=batch_size, update_conflicts=True,
+            unique_fields=['currency', 'date'], update_fields=['rate'])
+        users = rebuild_for_currencies({rate.currency for rate in rates})
+    return len(rates), users
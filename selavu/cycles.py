@@ -0,0 +1,111 @@
+import calendar
+from collections import namedtuple
+from datetime import date, timedelta
+from functools import lru_cache
+
+from django.utils.timezone import now
+
+from .models import Profile, default_cycle_start_day
+
+
+def default_start_day():
+    """ SELAVU_CYCLE_START_DAY, for users without a profile """
+    return default_cycle_start_day()
+
+
+class Cycle(namedtuple('Cycle', ['start', 'end'])):
+    """ ✅ One billing cycle, both ends inclusive (27th -> 26th by default) """
+
+    def __contains__(self, day):
+        return self.start <= day <= self.end
+
+    @property
+    def range(self):
+        """ Ready for `date__range=cycle.range` """
+        return (self.start, self.end)
+
+
+def _month_shift(year, month, months):
+    index = year * 12 + (month - 1) + months
+    return index // 12, index % 12 + 1
+
+
+def _start_in_month(year, month, start_day):
+    # ✅ A cycle that starts on the 31st starts on the 28th/29th/30th in short months
+    days_in_month = calendar.monthrange(year, month)[1]
+    return date(year, month, min(start_day, days_in_month))
+
+
+def cycle_for(day, start_day=None):
+    """ The cycle containing `day`; handles January/December rollover """
+    # The default is read per call, so settings changes are seen
+    return _cycle_for(day, start_day or default_start_day())
+
+
+@lru_cache(maxsize=4096)
+def _cycle_for(day, start_day):
+    year, month = day.year, day.month
+    if day < _start_in_month(year, month, start_day):
+        year, month = _month_shift(year, month, -1)
+    return _cycle_of_month(year, month, start_day)
+
+
+@lru_cache(maxsize=4096)
+def _cycle_of_month(year, month, start_day):
+    next_year, next_month = _month_shift(year, month, 1)
+    start = _start_in_month(year, month, start_day)
+    end = _start_in_month(next_year, next_month, start_day) - timedelta(days=1)
+    return Cycle(start, end)
+
+
+def cycle_back(day, n, start_day=None):
+    """ The cycle `n` cycles before the one containing `day` (0 is the current one) """
+    start_day = start_day or default_start_day()
+    current = cycle_for(day, start_day)
+    year, month = _month_shift(current.start.year, current.start.month, -n)
+    return _cycle_of_month(year, month, start_day)
+
+
+def cycles_back(day, n, start_day=None):
+    """ The last `n` cycles up to and including the current one, oldest first """
+    return [cycle_back(day, i, start_day) for i in range(n - 1, -1, -1)]
+
+
+def span(cycles):
+    """ One (first start, last end) window covering consecutive cycles """
+    return (cycles[0].start, cycles[-1].end)
+
+
+def start_day_for(user):
+    """ ✅ The user's configured cycle start day, looked up once per user object """
+    if user is None or not getattr(user, 'pk', None):
+        return default_start_day()
+    if not hasattr(user, '_cycle_start_day'):
+        user._cycle_start_day = start_day_for_id(user.pk)
+    return user._cycle_start_day
+
+
+def start_day_for_id(user_id):
+    day = Profile.objects.filter(user_id=user_id).values_list(
+        'cycle_start_day', flat=True).first()
+    return day or default_start_day()
+
+
+def start_days_for_ids(user_ids=None):
+    """ {user_id: start day} in one query, for bulk jobs """
+    profiles = Profile.objects.all()
+    if user_ids is not None:
+        profiles = profiles.filter(user_id__in=user_ids)
+    return dict(profiles.values_list('user_id', 'cycle_start_day'))
+
+
+def current_cycle(user, today=None):
+    return cycle_for(today or now().date(), start_day_for(user))
+
+
+def user_cycle_back(user, n, today=None):
+    return cycle_back(today or now().date(), n, start_day_for(user))
+
+
+def user_cycles_back(user, n, today=None):
+    return cycles_back(today or now().date(), n, start_day_for(user))
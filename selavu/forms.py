@@ -1,18 +1,150 @@
 from django import forms
-from .models import Expense
+from .models import Category, Expense
+from .search import search
+from .classifier import suggest_category
+from .currency import MissingRate, RateCache, home_currency_for, home_currency_for_id
 from datetime import date
 
 
 class ExpenseForm(forms.ModelForm):
     class Meta:
         model = Expense
-        fields = ['category', 'date', 'description', 'amount']
+        fields = ['category', 'date', 'description', 'amount', 'currency']
         widgets = {
             'date': forms.DateInput(attrs={'type': 'date'}),  # Date picker
             'description': forms.Textarea(attrs={'rows': 3}),
         }
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, user=None, **kwargs):
         super().__init__(*args, **kwargs)
         # ✅ Set the default value for the date field
         self.fields['date'].initial = date.today().strftime('%Y-%m-%d')
+        self.user = user
+        # ✅ Blank keeps the row's currency, or uses the home currency for new rows
+        self.fields['currency'].required = False
+        if user is not None and not self.instance.pk:
+            self.fields['currency'].initial = home_currency_for(user)
+        if user is not None:
+            self.fields['category'].queryset = Category.objects.for_user(user)
+            # ✅ Left empty, the category is picked by the user's classifier
+            self.fields['category'].required = False
+            self.fields['category'].empty_label = "Suggest automatically"
+
+    def home_currency(self):
+        if self.user is not None:
+            return home_currency_for(self.user)
+        return home_currency_for_id(self.instance.add_by_id)
+
+    def clean_currency(self):
+        currency = self.cleaned_data.get('currency')
+        if not currency:
+            return self.instance.currency if self.instance.pk else self.home_currency()
+        return currency
+
+    def clean(self):
+        cleaned_data = super().clean()
+        currency, day = cleaned_data.get('currency'), cleaned_data.get('date')
+        if currency and day and currency != self.home_currency():
+            # Totals are kept in the home currency, so a rate must exist
+            try:
+                RateCache().convert(1, currency, self.home_currency(), day)
+            except MissingRate as e:
+                self.add_error('currency', str(e))
+        if self.user is None or cleaned_data.get('category') or self.has_error('category'):
+            return cleaned_data
+        suggestion = suggest_category(self.user, cleaned_data.get('description', ''),
+                                      cleaned_data.get('amount'))
+        category = suggestion and self.fields['category'].queryset.filter(
+            pk=suggestion.category_id).first()
+        if category is None:
+            self.add_error('category', "No category could be suggested; please pick one.")
+        else:
+            cleaned_data['category'] = category
+        return cleaned_data
+
+
+# ✅ Several receipt lines in one submit; blank rows are skipped
+ExpenseFormSet = forms.modelformset_factory(Expense, form=ExpenseForm, extra=5)
+
+
+class ExpenseFilterForm(forms.Form):
+    q = forms.CharField(required=False, max_length=200, widget=forms.TextInput(
+        attrs={'class': 'form-control', 'placeholder': 'Search descriptions'}))
+    start_date = forms.DateField(required=False, widget=forms.DateInput(
+        attrs={'type': 'date', 'class': 'form-control'}))
+    end_date = forms.DateField(required=False, widget=forms.DateInput(
+        attrs={'type': 'date', 'class': 'form-control'}))
+    category = forms.ModelChoiceField(
+        queryset=Category.objects.all(), required=False,
+        widget=forms.Select(attrs={'class': 'form-select'}))
+    min_amount = forms.DecimalField(
+        required=False, max_digits=10, decimal_places=2,
+        widget=forms.NumberInput(attrs={'class': 'form-control'}))
+    max_amount = forms.DecimalField(
+        required=False, max_digits=10, decimal_places=2,
+        widget=forms.NumberInput(attrs={'class': 'form-control'}))
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if user is not None:
+            # ✅ Only categories of the user's own workspaces
+            self.fields['category'].queryset = Category.objects.for_user(user)
+
+    def filter_queryset(self, qs):
+        """ ✅ Apply only the filters the user actually filled in """
+        data = self.cleaned_data
+        if data.get('q'):
+            qs = search(qs, data['q'])
+        if data.get('start_date'):
+            qs = qs.filter(date__gte=data['start_date'])
+        if data.get('end_date'):
+            qs = qs.filter(date__lte=data['end_date'])
+        if data.get('category'):
+            qs = qs.filter(category=data['category'])
+        if data.get('min_amount') is not None:
+            qs = qs.filter(amount__gte=data['min_amount'])
+        if data.get('max_amount') is not None:
+            qs = qs.filter(amount__lte=data['max_amount'])
+        return qs
+
+
+class StatementImportForm(forms.Form):
+    FORMATS = [('csv', 'CSV'), ('ofx', 'OFX')]
+    DEBIT_SIGNS = [
+        ('any', 'Every row is an expense'),
+        ('negative', 'Negative amounts are expenses'),
+        ('positive', 'Positive amounts are expenses'),
+    ]
+
+    statement = forms.FileField(
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control'}))
+    statement_format = forms.ChoiceField(
+        choices=FORMATS, initial='csv',
+        widget=forms.Select(attrs={'class': 'form-select'}))
+    default_category = forms.ModelChoiceField(
+        queryset=Category.objects.all(),
+        widget=forms.Select(attrs={'class': 'form-select'}))
+    debit_sign = forms.ChoiceField(
+        choices=DEBIT_SIGNS, initial='any',
+        widget=forms.Select(attrs={'class': 'form-select'}))
+    # ✅ CSV column mapping, ignored for OFX
+    date_column = forms.CharField(initial='date', widget=forms.TextInput(
+        attrs={'class': 'form-control'}))
+    amount_column = forms.CharField(initial='amount', widget=forms.TextInput(
+        attrs={'class': 'form-control'}))
+    description_column = forms.CharField(initial='description', widget=forms.TextInput(
+        attrs={'class': 'form-control'}))
+    date_format = forms.CharField(initial='%Y-%m-%d', widget=forms.TextInput(
+        attrs={'class': 'form-control'}))
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if user is not None:
+            # ✅ Only categories of the user's own workspaces
+            self.fields['default_category'].queryset = Category.objects.for_user(user)
+
+    def csv_options(self):
+        if self.cleaned_data['statement_format'] != 'csv':
+            return {}
+        return {name: self.cleaned_data[name] for name in (
+            'date_column', 'amount_column', 'description_column', 'date_format')}
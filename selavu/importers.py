@@ -0,0 +1,241 @@
+import csv
+import hashlib
+import io
+import re
+from collections import namedtuple
+from contextlib import nullcontext
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db import transaction
+
+from . import audit, rollups, workspaces
+from .classifier import classifier_for
+from .currency import CENT, home_currency_for
+from .models import ArchivedExpense, Expense, LedgerEvent
+
+IMPORT_BATCH_SIZE = 1000
+
+# One transaction line from a bank statement
+StatementRow = namedtuple('StatementRow', ['date', 'amount', 'description'])
+ImportResult = namedtuple('ImportResult', ['created', 'duplicates', 'skipped'])
+
+OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<\r\n]*)')
+# A number with thousands separators, a sign before or after a currency
+# label ("₹", "Rs.", "USD") and an optional label after it; nothing else
+AMOUNT = re.compile(
+    r'([+-]?)\s*(?:[^\d\s.,+\-]+\.?\s*)?([+-]?)\s*(\d[\d,]*(?:\.\d*)?|\.\d+)'
+    r'(?:\s*[^\d\s.,+\-]+)?')
+
+
+class StatementError(ValueError):
+    pass
+
+
+def parse_amount(value):
+    """ "1,234.50", "(12.00)", "₹ -99" -> Decimal; "1e5" or "12abc" are errors """
+    text = value.strip()
+    negative = text.startswith('(') and text.endswith(')')
+    match = AMOUNT.fullmatch(text[1:-1].strip() if negative else text)
+    if match is None or (match[1] and match[2]):
+        raise StatementError(f"Invalid amount: {value!r}")
+    amount = Decimal(match[3].replace(',', ''))
+    if '-' in (match[1], match[2]):
+        amount = -amount
+    return -amount if negative else amount
+
+
+def _text_stream(fileobj, encoding):
+    # ✅ Wrap binary uploads without reading them into memory
+    if isinstance(fileobj, io.TextIOBase):
+        return fileobj
+    return io.TextIOWrapper(fileobj, encoding=encoding, newline='')
+
+
+def iter_csv(fileobj, date_column='date', amount_column='amount',
+             description_column='description', date_format='%Y-%m-%d',
+             encoding='utf-8-sig'):
+    """ Yield StatementRow per CSV line, one line in memory at a time """
+    reader = csv.DictReader(_text_stream(fileobj, encoding))
+    # ✅ ISO dates skip strptime, which dominates parsing time on big files
+    parse_date = date.fromisoformat if date_format == '%Y-%m-%d' else \
+        (lambda value: datetime.strptime(value, date_format).date())
+    missing = {date_column, amount_column, description_column} - set(reader.fieldnames or ())
+    if missing:
+        raise StatementError(f"Missing CSV column(s): {', '.join(sorted(missing))}")
+
+    for record in reader:
+        line = reader.line_num  # Of the record's last line; quoted values can span lines
+        if not (record.get(date_column) or '').strip():
+            continue  # Blank or footer line
+        try:
+            day = parse_date(record[date_column].strip())
+        except ValueError:
+            raise StatementError(f"Line {line}: invalid date {record[date_column]!r}")
+        if record[amount_column] is None:
+            # DictReader fills the columns a short row doesn't have with None
+            raise StatementError(f"Line {line}: no {amount_column} column")
+        try:
+            amount = parse_amount(record[amount_column])
+        except StatementError as e:
+            raise StatementError(f"Line {line}: {e}")
+        yield StatementRow(day, amount, (record[description_column] or '').strip())
+
+
+def iter_ofx(fileobj, encoding='latin-1'):
+    """
+    Yield StatementRow per <STMTTRN> block. Handles both SGML (unclosed tags)
+    and XML flavoured OFX, streaming line by line.
+    """
+    transaction_fields = None
+    for line in _text_stream(fileobj, encoding):
+        for closing, tag, value in OFX_TAG.findall(line):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if not closing:
+                    transaction_fields = {}
+                elif transaction_fields is not None:
+                    yield _ofx_row(transaction_fields)
+                    transaction_fields = None
+            elif transaction_fields is not None and not closing and value.strip():
+                transaction_fields[tag] = value.strip()
+
+
+def _ofx_row(fields):
+    try:
+        day = datetime.strptime(fields['DTPOSTED'][:8], '%Y%m%d').date()
+        amount = parse_amount(fields['TRNAMT'])
+    except (KeyError, ValueError):
+        raise StatementError(f"Incomplete OFX transaction: {fields}")
+    description = ' '.join(
+        part for part in (fields.get('NAME'), fields.get('MEMO')) if part)
+    return StatementRow(day, amount, description)
+
+
+def description_hash(description):
+    normalized = ' '.join((description or '').lower().split())
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+def fingerprint(day, amount, description):
+    """ (date, amount, description hash) used to spot rows already imported """
+    return day, Decimal(amount).quantize(CENT), description_hash(description)
+
+
+class CategoryMatcher:
+    """
+    ✅ Pick a category id for a statement line: the user's CategoryRules,
+    then their learned classifier, then the import's default category
+    """
+
+    def __init__(self, user, default_category):
+        self.default_category_id = default_category.pk
+        self.classifier = classifier_for(user)
+
+    def match(self, description, amount=None):
+        suggestion = self.classifier.suggest(description, amount)
+        return suggestion.category_id if suggestion else self.default_category_id
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class _Deduplicator:
+    """
+    Fingerprints of the user's expenses, archived ones included, on every
+    day the statement touches. Each day's history is read once per import (on the (add_by, date)
+    index), and rows written by this import are added as they go.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.loaded_days = set()
+        self.seen = set()
+
+    def load(self, batch):
+        days = {row.date for row in batch} - self.loaded_days
+        if not days:
+            return
+        # ✅ Archived cycles count too, or re-importing an old statement
+        # would write their rows again
+        existing = Expense.objects.filter(add_by=self.user, date__in=days).values_list(
+            'date', 'amount', 'description').union(ArchivedExpense.objects.filter(
+                add_by=self.user, date__in=days).values_list('date', 'amount', 'description'),
+            all=True)
+        self.seen.update(fingerprint(*values) for values in existing.iterator())
+        self.loaded_days |= days
+
+    def is_new(self, key):
+        if key in self.seen:
+            return False
+        self.seen.add(key)
+        return True
+
+
+def import_statement(user, rows, default_category, debit_sign='any',
+                     batch_size=IMPORT_BATCH_SIZE, progress=None, currency=None, atomic=True):
+    """
+    Write statement rows as the user's expenses with bulk_create in batches.
+
+    `debit_sign` picks which rows are spending: 'negative' or 'positive' keep
+    only rows with that sign, 'any' keeps everything. Amounts are stored
+    positive. Rows matching an existing expense on (date, amount, description
+    hash), including ones earlier in the same file, are skipped. Amounts are
+    in `currency`, the user's home currency by default.
+
+    The whole import is one transaction; with `atomic=False` each batch
+    commits on its own and `progress` is called between them, so a long
+    import doesn't hold SQLite's write lock from start to end.
+    """
+    currency = currency or home_currency_for(user)
+    matcher = CategoryMatcher(user, default_category)
+    deduplicator = _Deduplicator(user)
+    created = duplicates = skipped = 0
+
+    with transaction.atomic() if atomic else nullcontext():
+        for batch in _batches(rows, batch_size):
+            with transaction.atomic():
+                deduplicator.load(batch)
+                expenses = []
+                for row in batch:
+                    # ✅ Stored with two decimals; the rollups must add the same amount
+                    amount = Decimal(row.amount).quantize(CENT)
+                    if not amount or (debit_sign == 'negative' and amount > 0) \
+                            or (debit_sign == 'positive' and amount < 0):
+                        skipped += 1
+                        continue
+                    amount = abs(amount)
+                    if not deduplicator.is_new(fingerprint(row.date, amount, row.description)):
+                        duplicates += 1
+                        continue
+                    expenses.append(Expense(
+                        category_id=matcher.match(row.description, amount), date=row.date,
+                        add_by_id=user.pk, description=row.description, amount=amount,
+                        currency=currency))
+
+                Expense.objects.bulk_create(expenses, batch_size=batch_size)
+                rollups.apply_many(expenses)  # bulk_create skips the rollup signals
+                audit.record_many(expenses, LedgerEvent.CREATE)
+                workspaces.touch({expense.workspace_id for expense in expenses})
+            created += len(expenses)
+            if progress:
+                progress(created, duplicates, skipped)
+
+    return ImportResult(created, duplicates, skipped)
+
+
+def parse_statement(fileobj, statement_format='csv', **options):
+    """ Pick the streaming parser for `statement_format` ('csv' or 'ofx') """
+    if statement_format == 'ofx':
+        return iter_ofx(fileobj)
+    if statement_format == 'csv':
+        return iter_csv(fileobj, **options)
+    raise StatementError(f"Unsupported statement format: {statement_format}")
@@ -0,0 +1,47 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from selavu import archive, tasks
+
+
+class Command(BaseCommand):
+    help = "Move expenses of old closed cycles into the archive table (or back with --restore)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', action='append', dest='usernames', default=[],
+            help="Only archive this user's expenses (repeatable)")
+        parser.add_argument('--keep', type=int, default=None,
+                            help="Cycles to keep in the hot table "
+                                 "(default: SELAVU_ARCHIVE_AFTER_CYCLES)")
+        parser.add_argument('--restore', action='store_true',
+                            help="Move archived expenses back instead")
+        parser.add_argument('--since', help="With --restore: only cycles from this date on")
+        parser.add_argument('--queue', action='store_true',
+                            help="Hand archiving to `manage.py run_tasks` and return")
+
+    def handle(self, *args, usernames, keep, restore, since, queue, **options):
+        users = None
+        if usernames:
+            users = list(User.objects.filter(username__in=usernames))
+            missing = set(usernames) - {u.username for u in users}
+            if missing:
+                raise CommandError(f"Unknown user(s): {', '.join(sorted(missing))}")
+
+        if restore:
+            if users is None:
+                raise CommandError("--restore needs --user")
+            day = since and parse_date(since)
+            if since and day is None:
+                raise CommandError(f"Invalid date: {since}")
+            moved = sum(archive.restore(user, since=day) for user in users)
+            self.stdout.write(self.style.SUCCESS(f"✅ Restored {moved} expenses"))
+            return
+        if queue:
+            task = tasks.enqueue('archive_cycles', keep=keep,
+                                 user_ids=users and [user.pk for user in users])
+            self.stdout.write(self.style.SUCCESS(f"✅ Queued as task #{task.pk}"))
+            return
+        moved = archive.archive_cycles(users=users, keep=keep)
+        self.stdout.write(self.style.SUCCESS(f"✅ Archived {moved} expenses"))
@@ -0,0 +1,32 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from selavu import backups
+
+
+class Command(BaseCommand):
+    help = "Take an online backup of the SQLite database without blocking writers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source',
+                            help="Database file to back up (default: settings.DATABASES)")
+        parser.add_argument('--output', '-o',
+                            help="Write the backup here instead of the rotating backups/ set")
+        parser.add_argument('--keep', type=int, default=backups.BACKUP_KEEP,
+                            help="Backups to keep in the backups/ directory")
+        parser.add_argument('--verify', action='store_true',
+                            help="Run an integrity check on the finished backup")
+
+    def handle(self, *args, source, output, keep, verify, **options):
+        self.stdout.write("⏳ Backing up SQLite database...")
+        try:
+            if output:
+                path = backups.online_backup(Path(output), source_path=source)
+            else:
+                path = backups.create_backup(keep=keep, source_path=source)
+            if verify:
+                backups.check_integrity(path)
+        except backups.BackupError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"✅ Backup created: {path}"))
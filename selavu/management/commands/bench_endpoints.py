@@ -0,0 +1,172 @@
+import json
+import os
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext, setup_test_environment, teardown_test_environment)
+from django.urls import reverse
+
+from selavu.models import Category, Expense
+from selavu.pagination import encode_cursor
+from selavu.synthetic import generate_ledger
+from selavu.testing import process_cache
+
+DEFAULT_BASELINE = os.path.join(settings.BASE_DIR, 'benchmarks', 'baseline.json')
+
+
+def endpoints(user):
+    """ (name, method, url, POST data) for every endpoint we track """
+    mid_page = Expense.objects.filter(add_by=user).order_by('-date', '-pk')[
+        Expense.objects.filter(add_by=user).count() // 2]
+    category = Category.objects.filter(user=user).first()
+    return [
+        ('expense_list', 'get', reverse('expense_list'), None),
+        ('expense_list_deep_page', 'get',
+         f"{reverse('expense_list')}?after={encode_cursor(mid_page)}", None),
+        ('expense_list_filtered', 'get',
+         f"{reverse('expense_list')}?category={category.pk}&min_amount=100", None),
+        ('add_expense_form', 'get', reverse('add_expense'), None),
+        ('add_expense_submit', 'post', reverse('add_expense'), {
+            'category': category.pk, 'date': mid_page.date.isoformat(),
+            'description': 'Benchmark expense', 'amount': '123.45'}),
+        ('export_expenses_csv', 'get', reverse('export_ledger', args=['expenses', 'csv']), None),
+        ('admin_expense_changelist', 'get', '/admin/selavu/expense/', None),
+        ('admin_category_changelist', 'get', '/admin/selavu/category/', None),
+        ('admin_income_changelist', 'get', '/admin/selavu/income/', None),
+    ]
+
+
+def _request(client, method, url, data):
+    response = getattr(client, method)(url, data) if data else getattr(client, method)(url)
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    if response.status_code >= 400:
+        raise CommandError(f"{method.upper()} {url} returned {response.status_code}")
+    return response
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def measure(client, method, url, data, requests, warmup=2):
+    for _ in range(warmup):
+        _request(client, method, url, data)
+
+    latencies = []
+    queries = 0
+    for _ in range(requests):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            _request(client, method, url, data)
+            latencies.append((time.perf_counter() - started) * 1000)
+        queries = max(queries, len(captured.captured_queries))
+
+    # ✅ Memory is traced on a separate request so it doesn't skew the timings
+    tracemalloc.start()
+    _request(client, method, url, data)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'queries': queries,
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+class Command(BaseCommand):
+    help = ("Seed a throwaway database with synthetic users and expenses, drive the "
+            "main views through the test client and report latency, queries and memory")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=3)
+        parser.add_argument('--expenses', type=int, default=5000,
+                            help="Expenses per user")
+        parser.add_argument('--requests', type=int, default=30,
+                            help="Timed requests per endpoint")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+        parser.add_argument('--write-baseline', action='store_true',
+                            help="Save this run as the new baseline")
+        parser.add_argument('--check', action='store_true',
+                            help="Fail if an endpoint regressed against the baseline")
+        parser.add_argument('--tolerance', type=float, default=1.5,
+                            help="Allowed median slowdown factor before --check fails")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        # The seeded database is new every run; so must the cache be
+        cache = process_cache()
+        cache.enable()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            cache.disable()
+            teardown_test_environment()
+
+        self.report(results)
+        if options['write_baseline']:
+            os.makedirs(os.path.dirname(options['baseline']), exist_ok=True)
+            with open(options['baseline'], 'w') as f:
+                json.dump({
+                    'users': options['users'],
+                    'expenses_per_user': options['expenses'],
+                    'endpoints': results,
+                }, f, indent=2, sort_keys=True)
+                f.write('\n')
+            self.stdout.write(self.style.SUCCESS(f"✅ Baseline written to {options['baseline']}"))
+        if options['check']:
+            self.check_regressions(results, options['baseline'], options['tolerance'])
+
+    def run(self, options):
+        self.stdout.write(
+            f"⏳ Seeding {options['users']} users x {options['expenses']} expenses...")
+        users = generate_ledger(users=options['users'], expenses_per_user=options['expenses'],
+                                seed=options['seed'], superuser=True)
+        client = Client()
+        client.force_login(users[0])
+
+        results = {}
+        for name, method, url, data in endpoints(users[0]):
+            results[name] = measure(client, method, url, data, options['requests'])
+        return results
+
+    def report(self, results):
+        self.stdout.write(f"{'endpoint':28} {'p50':>8} {'p95':>8} {'p99':>8} {'queries':>8} {'peak KiB':>10}")
+        for name, stats in results.items():
+            self.stdout.write(
+                f"{name:28} {stats['p50_ms']:8.2f} {stats['p95_ms']:8.2f} {stats['p99_ms']:8.2f} "
+                f"{stats['queries']:8d} {stats['peak_kib']:10.1f}")
+
+    def check_regressions(self, results, baseline_path, tolerance):
+        try:
+            with open(baseline_path) as f:
+                baseline = json.load(f)['endpoints']
+        except FileNotFoundError:
+            raise CommandError(f"No baseline at {baseline_path}; run with --write-baseline first")
+
+        problems = []
+        for name, stats in results.items():
+            expected = baseline.get(name)
+            if expected is None:
+                continue
+            if stats['queries'] > expected['queries']:
+                problems.append(f"{name}: {stats['queries']} queries (baseline {expected['queries']})")
+            # The median is compared; tail latencies are too noisy on shared machines
+            if stats['p50_ms'] > expected['p50_ms'] * tolerance:
+                problems.append(f"{name}: p50 {stats['p50_ms']} ms (baseline {expected['p50_ms']} ms)")
+        if problems:
+            raise CommandError("Regressions against the baseline:\n  " + "\n  ".join(problems))
+        self.stdout.write(self.style.SUCCESS("✅ No regressions against the baseline"))
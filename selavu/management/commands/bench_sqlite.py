@@ -0,0 +1,129 @@
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# What Django's SQLite backend did before SQLITE_PRAGMAS: rollback journal,
+# full fsync, Python's 5 s lock wait and deferred transactions
+DEFAULT_CONFIG = {
+    'pragmas': {'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+    'begin': 'BEGIN',
+}
+
+
+def tuned_config():
+    return {
+        'pragmas': dict(settings.SQLITE_PRAGMAS),
+        'begin': f"BEGIN {settings.DATABASES['default']['OPTIONS'].get('transaction_mode', '')}",
+    }
+
+
+def _connect(path, config):
+    conn = sqlite3.connect(path, isolation_level=None)
+    for name, value in config['pragmas'].items():
+        conn.execute(f"PRAGMA {name}={value}")
+    return conn
+
+
+def _writer(path, config, deadline, results):
+    """ Insert an expense and bump its rollup row, like an admin save does """
+    conn = _connect(path, config)
+    done = errors = 0
+    latencies = []
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        try:
+            conn.execute(config['begin'])
+            total = conn.execute(
+                "SELECT total FROM rollup WHERE id = 1").fetchone()[0]
+            conn.execute(
+                "INSERT INTO expense (amount, description) VALUES (?, ?)",
+                (12.5, 'benchmark row'))
+            conn.execute("UPDATE rollup SET total = ? WHERE id = 1", (total + 12.5,))
+            conn.execute("COMMIT")
+            done += 1
+            latencies.append(time.monotonic() - started)
+        except sqlite3.OperationalError:
+            errors += 1  # "database is locked"
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+    conn.close()
+    results.put(('write', done, errors, latencies))
+
+
+def _reader(path, config, deadline, results):
+    """ Dashboard-style aggregate over the whole table """
+    conn = _connect(path, config)
+    done = errors = 0
+    latencies = []
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        try:
+            conn.execute("SELECT COUNT(*), SUM(amount) FROM expense").fetchone()
+            done += 1
+            latencies.append(time.monotonic() - started)
+        except sqlite3.OperationalError:
+            errors += 1
+    conn.close()
+    results.put(('read', done, errors, latencies))
+
+
+def run_benchmark(config, writers, readers, seconds, seed_rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.sqlite3')
+        conn = _connect(path, config)
+        conn.execute("CREATE TABLE expense (id INTEGER PRIMARY KEY, amount REAL, description TEXT)")
+        conn.execute("CREATE TABLE rollup (id INTEGER PRIMARY KEY, total REAL)")
+        conn.execute("INSERT INTO rollup VALUES (1, 0)")
+        conn.execute("BEGIN")
+        conn.executemany("INSERT INTO expense (amount, description) VALUES (?, ?)",
+                         ((1.0, 'seed') for _ in range(seed_rows)))
+        conn.execute("COMMIT")
+        conn.close()
+
+        results = multiprocessing.Queue()
+        deadline = time.monotonic() + seconds
+        workers = [multiprocessing.Process(target=_writer, args=(path, config, deadline, results))
+                   for _ in range(writers)]
+        workers += [multiprocessing.Process(target=_reader, args=(path, config, deadline, results))
+                    for _ in range(readers)]
+        for worker in workers:
+            worker.start()
+        collected = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+
+    summary = {}
+    for kind in ('write', 'read'):
+        rows = [r for r in collected if r[0] == kind]
+        latencies = sorted(latency for r in rows for latency in r[3])
+        summary[kind] = {
+            'ops': sum(r[1] for r in rows),
+            'errors': sum(r[2] for r in rows),
+            'per_second': sum(r[1] for r in rows) / seconds,
+            'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0,
+        }
+    return summary
+
+
+class Command(BaseCommand):
+    help = "Compare concurrent writer/reader throughput with default and tuned SQLite settings"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--seed-rows', type=int, default=50000)
+
+    def handle(self, *args, writers, readers, seconds, seed_rows, **options):
+        for label, config in (('default', DEFAULT_CONFIG), ('tuned', tuned_config())):
+            self.stdout.write(f"⏳ {label}: {writers} writers, {readers} readers, {seconds}s...")
+            summary = run_benchmark(config, writers, readers, seconds, seed_rows)
+            for kind, stats in summary.items():
+                self.stdout.write(
+                    f"  {kind:5} {stats['per_second']:9.1f} ops/s  "
+                    f"p95 {stats['p95_ms']:7.1f} ms  locked errors {stats['errors']}")
@@ -0,0 +1,41 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from selavu.exports import EXPORTS, WRITERS, export_range, stream_export
+
+
+class Command(BaseCommand):
+    help = "Export a user's expenses or incomes as CSV, JSON or XLSX"
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument('--user', required=True, help="Username to export")
+        parser.add_argument('--format', dest='fmt', choices=sorted(WRITERS), default='csv')
+        parser.add_argument('--cycle', type=int,
+                            help="Cycles back from the current one (0 = current)")
+        parser.add_argument('--start', type=parse_date, help="YYYY-MM-DD")
+        parser.add_argument('--end', type=parse_date, help="YYYY-MM-DD")
+        parser.add_argument('--output', '-o', help="File to write (default: stdout)")
+
+    def handle(self, *args, kind, fmt, cycle, start, end, output, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown user: {options['user']}")
+
+        try:
+            start, end = export_range(user, cycle=cycle, start=start, end=end)
+        except ValueError as e:
+            raise CommandError(str(e))
+        destination = open(output, 'wb') if output else sys.stdout.buffer
+        try:
+            for chunk in stream_export(kind, fmt, user, start, end):
+                destination.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        finally:
+            if output:
+                destination.close()
+        if output:
+            self.stdout.write(self.style.SUCCESS(f"✅ Exported {kind} to {output}"))
@@ -0,0 +1,71 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from selavu.currency import MissingRate
+from selavu.importers import StatementError, import_statement, parse_statement
+from selavu.models import Category
+
+
+class Command(BaseCommand):
+    help = "Import a bank CSV/OFX statement as expenses for a user"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--user', required=True, help="Username to import for")
+        parser.add_argument('--format', dest='statement_format',
+                            choices=['csv', 'ofx'], default='csv')
+        parser.add_argument('--default-category', required=True,
+                            help="Category name or id for rows no CategoryRule matches")
+        parser.add_argument('--date-column', default='date')
+        parser.add_argument('--amount-column', default='amount')
+        parser.add_argument('--description-column', default='description')
+        parser.add_argument('--date-format', default='%Y-%m-%d')
+        parser.add_argument('--debit-sign', choices=['any', 'negative', 'positive'],
+                            default='any',
+                            help="Which amount sign marks spending in the statement")
+        parser.add_argument('--currency',
+                            help="Currency of the statement's amounts (default: home currency)")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown user: {options['user']}")
+        # ✅ Only the user's workspaces' categories; an id picks one of several of a name
+        name = options['default_category']
+        categories = Category.objects.for_user(user)
+        matches = list(categories.filter(pk=int(name)) if name.isdigit()
+                       else categories.filter(name=name)[:2])
+        if not matches:
+            raise CommandError(f"Unknown category: {name}")
+        if len(matches) > 1:
+            raise CommandError(f"Several of {user.username}'s workspaces have a category "
+                               f"named {name}; pass its id instead")
+        category = matches[0]
+
+        csv_options = {}
+        if options['statement_format'] == 'csv':
+            csv_options = {
+                'date_column': options['date_column'],
+                'amount_column': options['amount_column'],
+                'description_column': options['description_column'],
+                'date_format': options['date_format'],
+            }
+
+        def progress(created, duplicates, skipped):
+            self.stdout.write(f"⏳ {created} imported, {duplicates} duplicates, {skipped} skipped")
+
+        with open(options['path'], 'rb') as statement:
+            try:
+                result = import_statement(
+                    user, parse_statement(statement, options['statement_format'], **csv_options),
+                    category, debit_sign=options['debit_sign'],
+                    batch_size=options['batch_size'], progress=progress,
+                    currency=options['currency'] and options['currency'].upper())
+            except (StatementError, MissingRate) as e:
+                raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Imported {result.created} expenses "
+            f"({result.duplicates} duplicates, {result.skipped} skipped)"))
@@ -0,0 +1,41 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from selavu.audit import cycle_totals, ledger_as_of
+from selavu.currency import home_currency_for, money
+from selavu.models import Category
+
+
+class Command(BaseCommand):
+    help = "Print a user's cycle totals as they were at a point in time, from the audit log"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('when', help="ISO timestamp, e.g. 2025-03-30T18:00")
+
+    def handle(self, *args, username, when, **options):
+        user = User.objects.filter(username=username).first()
+        if user is None:
+            raise CommandError(f"Unknown user: {username}")
+        moment = parse_datetime(when)
+        if moment is None:
+            raise CommandError(f"Invalid timestamp: {when}")
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+
+        ledger = ledger_as_of(user, moment)
+        totals = cycle_totals(ledger)
+        # Names as they were then, including categories deleted since; rows
+        # may use categories another user owns
+        names = {category.pk: category.name for category in ledger['category']}
+        names.update(Category.objects.filter(pk__in={key[2] for key in totals} - set(names))
+                     .values_list('pk', 'name'))
+        currency = home_currency_for(user)
+        for (cycle_start, kind, category_id, source), (total, count) in sorted(
+                totals.items(), key=lambda item: (item[0][0], item[0][1], str(item[0][2:]))):
+            label = names.get(category_id, f"category #{category_id}") if category_id else source
+            self.stdout.write(f"{cycle_start}  {kind:<7}  {label:<24} "
+                              f"{money(total, currency):>14}  ({count})")
+        self.stdout.write(self.style.SUCCESS(f"✅ {len(totals)} totals as of {moment}"))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from selavu.currency import base_currency, load_rates, parse_rates
+
+
+class Command(BaseCommand):
+    help = "Load exchange rates from a CSV with date, currency and rate columns"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--inverse', action='store_true',
+            help="The file quotes units of currency per base unit (e.g. ECB reference rates)")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, path, inverse, batch_size, **options):
+        try:
+            with open(path, encoding='utf-8-sig', newline='') as rates:
+                written, users = load_rates(parse_rates(rates, inverse=inverse),
+                                            batch_size=batch_size)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Loaded {written} rates against {base_currency()}, "
+            f"rebuilt the totals of {users} users"))
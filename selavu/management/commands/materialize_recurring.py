@@ -0,0 +1,36 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from selavu.recurring import materialize_due
+
+
+class Command(BaseCommand):
+    help = ("Create the expenses and incomes that recurring templates have due. "
+            "Safe to run as often as you like (e.g. hourly from cron)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help="Materialize up to this day (YYYY-MM-DD), default today")
+        parser.add_argument(
+            '--user', action='append', dest='usernames', default=[],
+            help="Only this user's templates (repeatable)")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, date, usernames, batch_size, **options):
+        today = None
+        if date:
+            today = parse_date(date)
+            if today is None:
+                raise CommandError(f"Invalid date: {date}")
+
+        users = None
+        if usernames:
+            users = list(User.objects.filter(username__in=usernames))
+            missing = set(usernames) - {u.username for u in users}
+            if missing:
+                raise CommandError(f"Unknown user(s): {', '.join(sorted(missing))}")
+
+        result = materialize_due(today=today, users=users, batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {result.templates} templates due: created {result.expenses} expenses "
+            f"and {result.incomes} incomes"))
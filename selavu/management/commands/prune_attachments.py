@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from selavu import attachments
+
+
+class Command(BaseCommand):
+    help = "Delete stored receipt files no attachment refers to any more"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-hours', type=int, default=24,
+                            help="Remove unfinished uploads older than this")
+
+    def handle(self, *args, stale_hours, **options):
+        blobs, tmp_files = attachments.prune(stale_after=timedelta(hours=stale_hours))
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Pruned {blobs} files and {tmp_files} unfinished uploads"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from selavu import snapshots
+
+
+class Command(BaseCommand):
+    help = "Drop old snapshots and the chunks only they referenced"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-last', type=int, default=7,
+                            help="Always keep this many of the newest snapshots")
+        parser.add_argument('--keep-daily', type=int, default=30,
+                            help="Keep the newest snapshot of each of this many days")
+
+    def handle(self, *args, keep_last, keep_daily, **options):
+        manifests, chunks = snapshots.prune_snapshots(
+            keep_last=keep_last, keep_daily=keep_daily)
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Pruned {manifests} snapshots and {chunks} chunks"))
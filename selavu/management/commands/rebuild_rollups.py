@@ -0,0 +1,32 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from selavu import rollups, tasks
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-cycle rollup table from the expense and income ledger"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', action='append', dest='usernames', default=[],
+            help="Only rebuild this user's rollups (repeatable)")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--queue', action='store_true',
+                            help="Hand the rebuild to `manage.py run_tasks` and return")
+
+    def handle(self, *args, usernames, batch_size, queue, **options):
+        users = None
+        if usernames:
+            users = list(User.objects.filter(username__in=usernames))
+            missing = set(usernames) - {u.username for u in users}
+            if missing:
+                raise CommandError(f"Unknown user(s): {', '.join(sorted(missing))}")
+
+        if queue:
+            task = tasks.enqueue('rebuild_rollups',
+                                 user_ids=users and [user.pk for user in users])
+            self.stdout.write(self.style.SUCCESS(f"✅ Queued as task #{task.pk}"))
+            return
+        count = rollups.rebuild(users=users, batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(f"✅ Rebuilt {count} rollup rows"))
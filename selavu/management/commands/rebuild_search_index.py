@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from selavu.search import rebuild_search_indexes
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search indexes over expense and income descriptions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-optimize', action='store_true',
+                            help="Skip merging the index segments afterwards")
+
+    def handle(self, *args, no_optimize, **options):
+        tables = rebuild_search_indexes(optimize=not no_optimize)
+        self.stdout.write(self.style.SUCCESS(f"✅ Rebuilt search index for {', '.join(tables)}"))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from selavu import backups
+
+
+class Command(BaseCommand):
+    help = "Restore the SQLite database from a backup after checking its integrity"
+
+    def add_arguments(self, parser):
+        parser.add_argument('backup', nargs='?',
+                            help="Backup file (default: newest file in backups/)")
+        parser.add_argument('--target',
+                            help="Database file to restore into (default: settings.DATABASES)")
+        parser.add_argument('--no-safety-copy', action='store_true',
+                            help="Don't back up the current database first")
+
+    def handle(self, *args, backup, target, no_safety_copy, **options):
+        if not backup:
+            available = backups.list_backups()
+            if not available:
+                raise CommandError(f"No backups found in {backups.BACKUP_DIR}")
+            backup = available[0]
+
+        self.stdout.write(f"⏳ Restoring database from {backup}...")
+        try:
+            safety_copy = backups.restore_backup(
+                backup, target_path=target, keep_safety_copy=not no_safety_copy)
+        except backups.BackupError as e:
+            raise CommandError(str(e))
+        if safety_copy:
+            self.stdout.write(f"Previous database saved to {safety_copy}")
+        self.stdout.write(self.style.SUCCESS("✅ Database restored successfully!"))
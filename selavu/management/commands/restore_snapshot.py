@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from selavu import snapshots
+
+
+class Command(BaseCommand):
+    help = "Rebuild a database snapshot from its manifest and restore it"
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', nargs='?',
+                            help="Snapshot name (default: the newest one)")
+        parser.add_argument('--list', action='store_true', help="List snapshots and exit")
+        parser.add_argument('--output', '-o',
+                            help="Only rebuild the database file here; leave the live database alone")
+        parser.add_argument('--target',
+                            help="Database file to restore into (default: settings.DATABASES)")
+        parser.add_argument('--no-safety-copy', action='store_true',
+                            help="Don't back up the current database first")
+
+    def handle(self, *args, name, output, target, no_safety_copy, **options):
+        names = snapshots.list_manifests()
+        if options['list']:
+            for snapshot in names:
+                self.stdout.write(snapshot)
+            return
+        if not name:
+            if not names:
+                raise CommandError(f"No snapshots found in {snapshots.SNAPSHOT_DIR}")
+            name = names[0]
+
+        try:
+            if output:
+                snapshots.materialize(name, output)
+                self.stdout.write(self.style.SUCCESS(f"✅ Snapshot {name} rebuilt at {output}"))
+                return
+            self.stdout.write(f"⏳ Restoring snapshot {name}...")
+            safety_copy = snapshots.restore_snapshot(
+                name, target_path=target, keep_safety_copy=not no_safety_copy)
+        except snapshots.backups.BackupError as e:
+            raise CommandError(str(e))
+        if safety_copy:
+            self.stdout.write(f"Previous database saved to {safety_copy}")
+        self.stdout.write(self.style.SUCCESS("✅ Database restored successfully!"))
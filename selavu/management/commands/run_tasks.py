@@ -0,0 +1,73 @@
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from selavu import tasks
+
+
+class Command(BaseCommand):
+    help = "Run queued background tasks (imports, backups, rebuilds) on a process pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int,
+                            default=getattr(settings, 'SELAVU_TASK_PROCESSES', 2),
+                            help="Worker processes; 0 runs tasks in this process")
+        parser.add_argument('--poll', type=float, default=1.0,
+                            help="Seconds between looks at the queue when it is idle")
+        parser.add_argument('--burst', action='store_true',
+                            help="Exit once the queue is empty instead of waiting for more")
+
+    def handle(self, *args, processes, poll, burst, **options):
+        if not processes:
+            ran = tasks.run_pending()
+            self.stdout.write(self.style.SUCCESS(f"✅ Ran {ran} tasks"))
+            return
+
+        # Children start fresh and set Django up themselves; no SQLite
+        # connection is ever shared across a fork
+        connections.close_all()
+        pool = self.pool(processes)
+        running = {}
+        ran = 0
+        self.stdout.write(f"⏳ Waiting for tasks with {processes} processes...")
+        try:
+            while True:
+                while len(running) < processes:
+                    pk = tasks.claim()
+                    if pk is None:
+                        break
+                    running[pool.submit(tasks.work, pk)] = pk
+                if not running:
+                    if burst:
+                        break
+                    connections.close_all()  # Idle: don't hold a connection open
+                    time.sleep(poll)
+                    continue
+                done, _ = wait(running, timeout=poll, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pk = running.pop(future)
+                    ran += 1
+                    if future.exception():
+                        # The process died; the task's lease runs out and it is retried
+                        self.stderr.write(f"❌ Task #{pk}: {future.exception()!r}")
+                    else:
+                        self.stdout.write(f"✅ Task #{pk} finished")
+                if any(isinstance(future.exception(), BrokenProcessPool) for future in done):
+                    pool.shutdown(wait=True, cancel_futures=True)
+                    pool = self.pool(processes)
+        except KeyboardInterrupt:
+            self.stdout.write("⏳ Stopping; waiting for running tasks...")
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+        self.stdout.write(self.style.SUCCESS(f"✅ Ran {ran} tasks"))
+
+    @staticmethod
+    def pool(processes):
+        return ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=django.setup)
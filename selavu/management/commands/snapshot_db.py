@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from selavu import snapshots
+
+
+class Command(BaseCommand):
+    help = "Take an incremental, content-addressed snapshot of the SQLite database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source',
+                            help="Database file to snapshot (default: settings.DATABASES)")
+        parser.add_argument('--prune', action='store_true',
+                            help="Apply the retention policy after the snapshot")
+        parser.add_argument('--keep-last', type=int, default=7)
+        parser.add_argument('--keep-daily', type=int, default=30)
+
+    def handle(self, *args, source, prune, keep_last, keep_daily, **options):
+        self.stdout.write("⏳ Taking snapshot...")
+        try:
+            manifest = snapshots.take_snapshot(source_path=source)
+        except snapshots.backups.BackupError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Snapshot {manifest['name']}: {len(manifest['chunks'])} chunks, "
+            f"{manifest['new_chunks']} new ({manifest['new_bytes']} bytes stored)"))
+
+        if prune:
+            manifests, chunks = snapshots.prune_snapshots(
+                keep_last=keep_last, keep_daily=keep_daily)
+            self.stdout.write(f"Pruned {manifests} snapshots and {chunks} chunks")
@@ -0,0 +1,143 @@
+import bisect
+import json
+import threading
+from collections import defaultdict
+
+# Upper bounds of the histogram buckets; the last bucket is +Inf
+TIME_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    """ Fixed-bucket histogram: O(log buckets) to record, no samples kept """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """ {le: count} with cumulative counts, the way Prometheus wants them """
+        total = 0
+        result = {}
+        for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            total += count
+            result[str(bound)] = total
+        return result
+
+    def quantile(self, q):
+        """ Upper bucket bound holding the q-th observation (an estimate) """
+        if not self.count:
+            return 0
+        rank = q * self.count
+        for bound, total in self.cumulative().items():
+            if total >= rank:
+                return bound
+        return '+Inf'
+
+
+class RouteStats:
+    def __init__(self):
+        self.wall_ms = Histogram(TIME_BUCKETS_MS)
+        self.sql_ms = Histogram(TIME_BUCKETS_MS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.duplicate_queries = 0
+        self.requests_with_duplicates = 0
+        self.slow_requests = 0
+
+
+class MetricsRegistry:
+    """
+    ✅ Per-route request metrics aggregated in this process.
+
+    Each gunicorn worker keeps its own registry, so a scrape sees the worker
+    that served it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = defaultdict(RouteStats)
+
+    def record(self, route, wall_ms, sql_ms, queries, duplicates, slow=False):
+        """ sql_ms/queries are None when they couldn't be measured (async views) """
+        with self._lock:
+            stats = self._routes[route]
+            stats.wall_ms.observe(wall_ms)
+            if queries is not None:
+                stats.sql_ms.observe(sql_ms)
+                stats.queries.observe(queries)
+            stats.duplicate_queries += duplicates
+            stats.requests_with_duplicates += 1 if duplicates else 0
+            stats.slow_requests += 1 if slow else 0
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {route: {
+                'requests': stats.wall_ms.count,
+                'measured_requests': stats.queries.count,
+                'wall_ms_sum': round(stats.wall_ms.sum, 3),
+                'wall_ms_p50': stats.wall_ms.quantile(0.5),
+                'wall_ms_p95': stats.wall_ms.quantile(0.95),
+                'sql_ms_sum': round(stats.sql_ms.sum, 3),
+                'queries_sum': int(stats.queries.sum),
+                'queries_p95': stats.queries.quantile(0.95),
+                'duplicate_queries': stats.duplicate_queries,
+                'requests_with_duplicates': stats.requests_with_duplicates,
+                'slow_requests': stats.slow_requests,
+                'wall_ms_buckets': stats.wall_ms.cumulative(),
+                'sql_ms_buckets': stats.sql_ms.cumulative(),
+                'queries_buckets': stats.queries.cumulative(),
+            } for route, stats in self._routes.items()}
+
+    def as_json(self):
+        return json.dumps(self.snapshot(), indent=2, sort_keys=True)
+
+    def as_prometheus(self):
+        lines = []
+        snapshot = self.snapshot()
+        histograms = (
+            ('selavu_request_duration_ms', 'wall_ms', 'Wall time per request in milliseconds'),
+            ('selavu_request_sql_ms', 'sql_ms', 'SQL time per request in milliseconds'),
+            ('selavu_request_queries', 'queries', 'SQL queries per request'),
+        )
+        for metric, key, help_text in histograms:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} histogram")
+            for route, stats in sorted(snapshot.items()):
+                label = f'route="{_escape_label(route)}"'
+                for bound, count in stats[f'{key}_buckets'].items():
+                    lines.append(f'{metric}_bucket{{{label},le="{bound}"}} {count}')
+                total = stats['queries_sum'] if key == 'queries' else stats[f'{key}_sum']
+                count = stats['requests'] if key == 'wall_ms' else stats['measured_requests']
+                lines.append(f"{metric}_sum{{{label}}} {total}")
+                lines.append(f"{metric}_count{{{label}}} {count}")
+
+        counters = (
+            ('selavu_duplicate_queries_total', 'duplicate_queries',
+             'Repeated executions of the same SQL within one request'),
+            ('selavu_slow_requests_total', 'slow_requests',
+             'Requests slower than SELAVU_SLOW_REQUEST_MS'),
+        )
+        for metric, key, help_text in counters:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for route, stats in sorted(snapshot.items()):
+                lines.append(f'{metric}{{route="{_escape_label(route)}"}} {stats[key]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,96 @@
+import logging
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+SLOW_REQUEST_MS = getattr(settings, 'SELAVU_SLOW_REQUEST_MS', 500)
+# The same SQL run this many times in one request is reported as a likely N+1
+DUPLICATE_QUERY_THRESHOLD = getattr(settings, 'SELAVU_DUPLICATE_QUERY_THRESHOLD', 5)
+
+
+class QueryTracker:
+    """ execute_wrapper that times every query and counts repeated SQL """
+
+    def __init__(self):
+        self.count = 0
+        self.sql_seconds = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_seconds += time.perf_counter() - started
+            self.count += 1
+            self.statements[sql] += 1  # Parameters stay out, so N+1 loops collapse
+
+    @property
+    def duplicates(self):
+        return sum(n - 1 for n in self.statements.values() if n > 1)
+
+    def worst_repeat(self):
+        return self.statements.most_common(1)[0] if self.statements else (None, 0)
+
+
+class QueryInstrumentationMiddleware:
+    """
+    ✅ Records wall time, SQL time, query count and repeated queries for every
+    request, aggregated per URL name in selavu.metrics, and logs slow paths.
+    Queries run while a streaming response is iterated are not counted.
+
+    Under ASGI only wall time is recorded: the async ORM runs its queries on
+    a worker thread, out of reach of a wrapper installed on the event loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        tracker = QueryTracker()
+        started = time.perf_counter()
+        with connection.execute_wrapper(tracker):
+            response = self.get_response(request)
+        self.record(request, (time.perf_counter() - started) * 1000, tracker)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, (time.perf_counter() - started) * 1000)
+        return response
+
+    def record(self, request, wall_ms, tracker=None):
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match else 'unresolved'
+        slow = wall_ms >= SLOW_REQUEST_MS
+        if tracker is None:
+            registry.record(route, wall_ms, None, None, 0, slow=slow)
+            if slow:
+                logger.warning("Slow request %s %s: %.0f ms total",
+                               request.method, route, wall_ms)
+            return
+
+        sql_ms = tracker.sql_seconds * 1000
+        registry.record(route, wall_ms, sql_ms, tracker.count, tracker.duplicates, slow=slow)
+        sql, repeats = tracker.worst_repeat()
+        if repeats >= DUPLICATE_QUERY_THRESHOLD:
+            logger.warning("%s ran the same query %d times (likely N+1): %s",
+                           route, repeats, sql[:300])
+        if slow:
+            logger.warning("Slow request %s %s: %.0f ms total, %d queries in %.0f ms",
+                           request.method, route, wall_ms, tracker.count, sql_ms)
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('selavu', '0006_profile'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cyclerollup',
+            index=models.Index(fields=['user', 'cycle_start'], name='selavu_rollup_user_cycle_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['add_by', 'date'], name='selavu_exp_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['add_by', 'category', 'date'], name='selavu_exp_user_cat_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='income',
+            index=models.Index(fields=['add_by', 'date'], name='selavu_inc_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='income',
+            index=models.Index(fields=['add_by', 'source', 'date'], name='selavu_inc_user_src_date_idx'),
+        ),
+    ]
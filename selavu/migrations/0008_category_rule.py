@@ -0,0 +1,30 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('selavu', '0007_ledger_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pattern', models.CharField(max_length=255)),
+                ('is_regex', models.BooleanField(default=False)),
+                ('priority', models.PositiveIntegerField(default=100)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='selavu.category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['priority', 'id'],
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:22
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('selavu', '0009_budget'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecurringTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('expense', 'Expense'), ('income', 'Income')], default='expense', max_length=10)),
+                ('source', models.CharField(blank=True, choices=[('Salary', 'Salary'), ('equity', 'equity'), ('Allowance', 'Allowance'), ('Other', 'Other')], default='', max_length=50)),
+                ('description', models.TextField(blank=True, default='')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('frequency', models.CharField(choices=[('daily', 'Every N days'), ('weekly', 'Every N weeks'), ('monthly', 'Every N months on day D'), ('cycle', 'Every N billing cycles on day D of the cycle')], default='monthly', max_length=10)),
+                ('interval', models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)])),
+                ('day', models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(31)])),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('active', models.BooleanField(default=True)),
+                ('next_due', models.DateField(blank=True, editable=False, null=True)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='selavu.category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='recurring',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='expenses', to='selavu.recurringtransaction'),
+        ),
+        migrations.AddField(
+            model_name='income',
+            name='recurring',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='incomes', to='selavu.recurringtransaction'),
+        ),
+        migrations.AddConstraint(
+            model_name='expense',
+            constraint=models.UniqueConstraint(condition=models.Q(('recurring__isnull', False)), fields=('recurring', 'date'), name='unique_recurring_expense'),
+        ),
+        migrations.AddConstraint(
+            model_name='income',
+            constraint=models.UniqueConstraint(condition=models.Q(('recurring__isnull', False)), fields=('recurring', 'date'), name='unique_recurring_income'),
+        ),
+        migrations.AddIndex(
+            model_name='recurringtransaction',
+            index=models.Index(fields=['active', 'next_due'], name='selavu_recurring_due_idx'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+from django.db import migrations
+
+# Spelled out rather than built by selavu.search, so later changes there
+# can't change what this migration does
+
+EXPENSE_INDEX = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS selavu_expense_fts USING fts5("
+    "description, content='selavu_expense', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS selavu_expense_fts_insert AFTER INSERT ON selavu_expense BEGIN "
+    "INSERT INTO selavu_expense_fts(rowid, description) VALUES (new.id, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS selavu_expense_fts_delete AFTER DELETE ON selavu_expense BEGIN "
+    "INSERT INTO selavu_expense_fts(selavu_expense_fts, rowid, description) "
+    "VALUES ('delete', old.id, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS selavu_expense_fts_update "
+    "AFTER UPDATE OF description ON selavu_expense BEGIN "
+    "INSERT INTO selavu_expense_fts(selavu_expense_fts, rowid, description) "
+    "VALUES ('delete', old.id, old.description); "
+    "INSERT INTO selavu_expense_fts(rowid, description) VALUES (new.id, new.description); END",
+    "INSERT INTO selavu_expense_fts(selavu_expense_fts) VALUES ('rebuild')",
+]
+
+EXPENSE_DROP = [
+    "DROP TRIGGER IF EXISTS selavu_expense_fts_insert",
+    "DROP TRIGGER IF EXISTS selavu_expense_fts_delete",
+    "DROP TRIGGER IF EXISTS selavu_expense_fts_update",
+    "DROP TABLE IF EXISTS selavu_expense_fts",
+]
+
+INCOME_INDEX = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS selavu_income_fts USING fts5("
+    "description, source, content='selavu_income', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS selavu_income_fts_insert AFTER INSERT ON selavu_income BEGIN "
+    "INSERT INTO selavu_income_fts(rowid, description, source) "
+    "VALUES (new.id, new.description, new.source); END",
+    "CREATE TRIGGER IF NOT EXISTS selavu_income_fts_delete AFTER DELETE ON selavu_income BEGIN "
+    "INSERT INTO selavu_income_fts(selavu_income_fts, rowid, description, source) "
+    "VALUES ('delete', old.id, old.description, old.source); END",
+    "CREATE TRIGGER IF NOT EXISTS selavu_income_fts_update "
+    "AFTER UPDATE OF description, source ON selavu_income BEGIN "
+    "INSERT INTO selavu_income_fts(selavu_income_fts, rowid, description, source) "
+    "VALUES ('delete', old.id, old.description, old.source); "
+    "INSERT INTO selavu_income_fts(rowid, description, source) "
+    "VALUES (new.id, new.description, new.source); END",
+    "INSERT INTO selavu_income_fts(selavu_income_fts) VALUES ('rebuild')",
+]
+
+INCOME_DROP = [
+    "DROP TRIGGER IF EXISTS selavu_income_fts_insert",
+    "DROP TRIGGER IF EXISTS selavu_income_fts_delete",
+    "DROP TRIGGER IF EXISTS selavu_income_fts_update",
+    "DROP TABLE IF EXISTS selavu_income_fts",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('selavu', '0010_recurring_transaction'),
+    ]
+
+    operations = [
+        migrations.RunSQL(EXPENSE_INDEX, EXPENSE_DROP),
+        migrations.RunSQL(INCOME_INDEX, INCOME_DROP),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:53
+
+import django.core.validators
+import selavu.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('selavu', '0011_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expense',
+            name='currency',
+            field=models.CharField(default=selavu.models.default_currency, max_length=3, validators=[django.core.validators.RegexValidator('^[A-Z]{3}$', 'Use a three-letter ISO 4217 code, e.g. INR.')]),
+        ),
+        migrations.AddField(
+            model_name='income',
+            name='currency',
+            field=models.CharField(default=selavu.models.default_currency, max_length=3, validators=[django.core.validators.RegexValidator('^[A-Z]{3}$', 'Use a three-letter ISO 4217 code, e.g. INR.')]),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='home_currency',
+            field=models.CharField(default=selavu.models.default_currency, max_length=3, validators=[django.core.validators.RegexValidator('^[A-Z]{3}$', 'Use a three-letter ISO 4217 code, e.g. INR.')]),
+        ),
+        migrations.AddField(
+            model_name='recurringtransaction',
+            name='currency',
+            field=models.CharField(default=selavu.models.default_currency, max_length=3, validators=[django.core.validators.RegexValidator('^[A-Z]{3}$', 'Use a three-letter ISO 4217 code, e.g. INR.')]),
+        ),
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(max_length=3, validators=[django.core.validators.RegexValidator('^[A-Z]{3}$', 'Use a three-letter ISO 4217 code, e.g. INR.')])),
+                ('date', models.DateField()),
+                ('rate', models.DecimalField(decimal_places=10, max_digits=20)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('currency', 'date'), name='unique_exchange_rate')],
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:00
+
+import django.core.serializers.json
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def baseline_existing_ledgers(apps, schema_editor):
+    # ✅ Rows written before the log existed: one checkpoint per user, so
+    # replays start from the ledger as it stood at migration time
+    Checkpoint = apps.get_model('selavu', 'LedgerCheckpoint')
+    states = {}
+    for name, owner in (('expense', 'add_by_id'), ('income', 'add_by_id'),
+                        ('category', 'user_id')):
+        for row in apps.get_model('selavu', name).objects.values().iterator():
+            state = states.setdefault(row[owner], {'expense': {}, 'income': {}, 'category': {}})
+            state[name][str(row['id'])] = row
+    taken_at = django.utils.timezone.now()
+    Checkpoint.objects.bulk_create(
+        Checkpoint(user_id=user_id, last_event_id=0, taken_at=taken_at, state=state)
+        for user_id, state in states.items())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('selavu', '0012_currency'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.IntegerField()),
+                ('last_event_id', models.BigIntegerField()),
+                ('taken_at', models.DateTimeField()),
+                ('state', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_id', 'taken_at'], name='selavu_ckpt_user_time_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LedgerEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.IntegerField()),
+                ('model', models.CharField(max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete')], max_length=10)),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_id', 'id'], name='selavu_event_user_id_idx'), models.Index(fields=['model', 'object_id'], name='selavu_event_object_idx')],
+            },
+        ),
+        migrations.RunPython(baseline_existing_ledgers, migrations.RunPython.noop),
+    ]
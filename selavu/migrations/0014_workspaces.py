@@ -0,0 +1,98 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def personal_workspaces(apps, schema_editor):
+    # ✅ Every existing user gets their own workspace, holding the categories
+    # and incomes they wrote. An expense goes where its category is, as
+    # Expense.workspace and assign_workspaces() have it, so one filed in
+    # someone else's category lands in that user's workspace
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Workspace = apps.get_model('selavu', 'Workspace')
+    Membership = apps.get_model('selavu', 'Membership')
+    Workspace.objects.bulk_create(
+        Workspace(name=username, personal_for_id=pk)
+        for pk, username in User.objects.values_list('pk', 'username'))
+    Membership.objects.bulk_create(
+        Membership(user_id=user_id, workspace_id=pk, role='owner')
+        for pk, user_id in Workspace.objects.values_list('pk', 'personal_for'))
+    for name, owner in (('category', 'user'), ('income', 'add_by')):
+        apps.get_model('selavu', name).objects.update(workspace=Subquery(
+            Workspace.objects.filter(personal_for=OuterRef(owner)).values('pk')[:1]))
+    Category = apps.get_model('selavu', 'Category')
+    apps.get_model('selavu', 'Expense').objects.update(workspace=Subquery(
+        Category.objects.filter(pk=OuterRef('category')).values('workspace')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('selavu', '0013_audit_log'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='category',
+            name='name',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.CreateModel(
+            name='Membership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('owner', 'Owner'), ('member', 'Member')], default='member', max_length=10)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Workspace',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('members', models.ManyToManyField(related_name='workspaces', through='selavu.Membership', to=settings.AUTH_USER_MODEL)),
+                ('personal_for', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='personal_workspace', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='membership',
+            name='workspace',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='selavu.workspace'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='workspace',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='selavu.workspace'),
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='workspace',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='selavu.workspace'),
+        ),
+        migrations.AddField(
+            model_name='income',
+            name='workspace',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='selavu.workspace'),
+        ),
+        migrations.RunPython(personal_workspaces, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['workspace', 'date'], name='selavu_exp_ws_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='income',
+            index=models.Index(fields=['workspace', 'date'], name='selavu_inc_ws_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='category',
+            constraint=models.UniqueConstraint(fields=('workspace', 'name'), name='unique_category_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='membership',
+            constraint=models.UniqueConstraint(fields=('user', 'workspace'), name='unique_membership'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:18
+
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+import selavu.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('selavu', '0016_tasks'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedCycle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateField()),
+                ('end', models.DateField()),
+                ('rows', models.PositiveIntegerField(default=0)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('currency', models.CharField(default=selavu.models.default_currency, max_length=3, validators=[django.core.validators.RegexValidator('^[A-Z]{3}$', 'Use a three-letter ISO 4217 code, e.g. INR.')])),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_cycles', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'start'), name='unique_archived_cycle')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedExpense',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('description', models.TextField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('currency', models.CharField(default=selavu.models.default_currency, max_length=3, validators=[django.core.validators.RegexValidator('^[A-Z]{3}$', 'Use a three-letter ISO 4217 code, e.g. INR.')])),
+                ('add_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='selavu.category')),
+                ('recurring', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='selavu.recurringtransaction')),
+                ('workspace', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='selavu.workspace')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['add_by', 'date'], name='selavu_arch_user_date_idx'), models.Index(fields=['workspace', 'date'], name='selavu_arch_ws_date_idx')],
+            },
+        ),
+    ]
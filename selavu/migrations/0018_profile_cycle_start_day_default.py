@@ -0,0 +1,20 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:33
+
+import django.core.validators
+import selavu.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('selavu', '0017_archive'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='profile',
+            name='cycle_start_day',
+            field=models.PositiveSmallIntegerField(default=selavu.models.default_cycle_start_day, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(31)]),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('selavu', '0018_profile_cycle_start_day_default'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='income',
+            name='date',
+            field=models.DateField(),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+
+def fill_rollups(apps, schema_editor):
+    # ✅ The rollup table started empty (0005) and nothing filled it from the
+    # rows already there, so upgraded dashboards showed 0. Rebuilding is
+    # idempotent: ledgers whose rollups are right get the same rows back.
+    # This runs today's rebuild, which matches the schema as of this
+    # migration; should a later change break that, make this a no-op and
+    # tell upgraders to run `manage.py rebuild_rollups` instead.
+    Expense = apps.get_model('selavu', 'Expense')
+    Income = apps.get_model('selavu', 'Income')
+    ArchivedExpense = apps.get_model('selavu', 'ArchivedExpense')
+    if not (Expense.objects.exists() or Income.objects.exists()
+            or ArchivedExpense.objects.exists()):
+        return
+    from selavu import rollups
+
+    rollups.rebuild()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('selavu', '0019_income_date'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop, elidable=True),
+    ]
@@ -1,13 +1,97 @@
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import User  # To link with User model
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.validators import MaxValueValidator, MinValueValidator, RegexValidator
+from django.utils import timezone
+
+
+def default_currency():
+    # ✅ Read at save time, so migrations don't freeze the setting
+    return getattr(settings, 'SELAVU_DEFAULT_CURRENCY', 'INR')
+
+
+def default_cycle_start_day():
+    return getattr(settings, 'SELAVU_CYCLE_START_DAY', 27)
+
+
+currency_code = RegexValidator(r'^[A-Z]{3}$', "Use a three-letter ISO 4217 code, e.g. INR.")
+
+
+def currency_field():
+    return models.CharField(max_length=3, default=default_currency, validators=[currency_code])
+
+
+class Workspace(models.Model):
+    """ ✅ A ledger shared by its members: a household, or one user's own """
+    name = models.CharField(max_length=100)
+    members = models.ManyToManyField(User, through='Membership', related_name='workspaces')
+    # Set on the workspace every user gets for rows they don't share
+    personal_for = models.OneToOneField(
+        User, on_delete=models.CASCADE, null=True, blank=True, related_name='personal_workspace')
+
+    def __str__(self):
+        return self.name
+
+
+class Membership(models.Model):
+    OWNER = 'owner'
+    MEMBER = 'member'
+    ROLES = [
+        (OWNER, 'Owner'),
+        (MEMBER, 'Member'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    workspace = models.ForeignKey(Workspace, on_delete=models.CASCADE)
+    role = models.CharField(max_length=10, choices=ROLES, default=MEMBER)
+
+    class Meta:
+        constraints = [
+            # ✅ Also the (user, workspace) index every scoped query reads
+            models.UniqueConstraint(fields=['user', 'workspace'], name='unique_membership'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} in {self.workspace} ({self.role})"
+
+
+class WorkspaceQuerySet(models.QuerySet):
+    """ ✅ Row-level access: ledger rows are visible to their workspace's members """
+
+    def for_user(self, user):
+        # One indexed subquery, so scoped aggregates stay a single query
+        return self.filter(workspace__in=Membership.objects.filter(
+            user=user).values('workspace'))
+
+    def for_workspace(self, workspace):
+        return self.filter(workspace=workspace)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from .workspaces import assign_workspaces
+
+        # ✅ bulk_create skips the pre_save signal that fills the workspace in
+        objs = list(objs)
+        assign_workspaces(objs)
+        return super().bulk_create(objs, *args, **kwargs)
 
 
 class Category(models.Model):
     id = models.AutoField(primary_key=True)  # Auto-incrementing ID
-    # Unique category name
-    name = models.CharField(max_length=255, unique=True)
+    name = models.CharField(max_length=255)
     # ✅ Assigns category to creator
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # ✅ Shared with the workspace's members; the creator's own one by default
+    workspace = models.ForeignKey(Workspace, on_delete=models.CASCADE, null=True, blank=True)
+
+    objects = WorkspaceQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # Unique category name within a workspace
+            models.UniqueConstraint(fields=['workspace', 'name'], name='unique_category_name'),
+        ]
 
     def __str__(self):
         return self.name  # Show category name in admin panel
@@ -22,6 +106,33 @@ class Expense(models.Model):
     description = models.TextField()  # Long text field for description
     # Number with 2 decimal places
     amount = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = currency_field()  # ✅ The amount's currency, as paid
+    # ✅ Set on rows materialized from a recurring template
+    recurring = models.ForeignKey(
+        'RecurringTransaction', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='expenses')
+    # ✅ Always the category's workspace
+    workspace = models.ForeignKey(Workspace, on_delete=models.CASCADE, null=True, blank=True)
+
+    objects = WorkspaceQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # One row per template and occurrence date, however often the scheduler runs
+            models.UniqueConstraint(
+                fields=['recurring', 'date'],
+                condition=models.Q(recurring__isnull=False),
+                name='unique_recurring_expense'),
+        ]
+        indexes = [
+            # ✅ Every ledger query filters on the owner plus a date range
+            models.Index(fields=['add_by', 'date'],
+                         name='selavu_exp_user_date_idx'),
+            models.Index(fields=['add_by', 'category', 'date'],
+                         name='selavu_exp_user_cat_date_idx'),
+            models.Index(fields=['workspace', 'date'],
+                         name='selavu_exp_ws_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.category.name} - {self.amount} - {self.date}"
@@ -40,9 +151,411 @@ class Income(models.Model):
     description = models.TextField(
         blank=True, null=True)  # Allows detailed notes
     amount = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = currency_field()
     date = models.DateField()
     add_by = models.ForeignKey(
         User, on_delete=models.CASCADE)  # Links to User model
+    recurring = models.ForeignKey(
+        'RecurringTransaction', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='incomes')
+    # The author's own workspace unless shared explicitly
+    workspace = models.ForeignKey(Workspace, on_delete=models.CASCADE, null=True, blank=True)
+
+    objects = WorkspaceQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recurring', 'date'],
+                condition=models.Q(recurring__isnull=False),
+                name='unique_recurring_income'),
+        ]
+        indexes = [
+            models.Index(fields=['add_by', 'date'],
+                         name='selavu_inc_user_date_idx'),
+            models.Index(fields=['add_by', 'source', 'date'],
+                         name='selavu_inc_user_src_date_idx'),
+            models.Index(fields=['workspace', 'date'],
+                         name='selavu_inc_ws_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.source} - {self.amount}"
+
+
+class CycleRollup(models.Model):
+    """
+    ✅ Running totals per user, billing cycle and category/source, in the
+    user's home currency
+    """
+    EXPENSE = 'expense'
+    INCOME = 'income'
+    KINDS = [
+        (EXPENSE, 'Expense'),
+        (INCOME, 'Income'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    cycle_start = models.DateField()  # First day of the billing cycle
+    kind = models.CharField(max_length=10, choices=KINDS)
+    # Set for expense rollups only
+    category = models.ForeignKey(
+        Category, on_delete=models.CASCADE, null=True, blank=True)
+    # Set for income rollups only
+    source = models.CharField(max_length=50, blank=True, default='')
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'cycle_start'],
+                         name='selavu_rollup_user_cycle_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'cycle_start', 'category'],
+                condition=models.Q(kind='expense'),
+                name='unique_expense_rollup'),
+            models.UniqueConstraint(
+                fields=['user', 'cycle_start', 'source'],
+                condition=models.Q(kind='income'),
+                name='unique_income_rollup'),
+        ]
+
+    def __str__(self):
+        key = self.category.name if self.category_id else self.source
+        return f"{self.cycle_start} - {self.kind} - {key} - {self.total}"
+
+
+class Profile(models.Model):
+    """ ✅ Per-user ledger preferences """
+    user = models.OneToOneField(User, on_delete=models.CASCADE)
+    # Day of the month a billing cycle starts on (SELAVU_CYCLE_START_DAY by default)
+    cycle_start_day = models.PositiveSmallIntegerField(
+        default=default_cycle_start_day, validators=[MinValueValidator(1), MaxValueValidator(31)])
+    # Totals, dashboards and budgets are converted into this currency
+    home_currency = currency_field()
+
+    def __str__(self):
+        return f"{self.user} - cycle starts on day {self.cycle_start_day}"
+
+
+class CategoryRule(models.Model):
+    """ ✅ Maps statement descriptions to a category during imports """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    # Keyword (case-insensitive substring) or regular expression
+    pattern = models.CharField(max_length=255)
+    is_regex = models.BooleanField(default=False)
+    # Lower numbers are tried first
+    priority = models.PositiveIntegerField(default=100)
+
+    class Meta:
+        ordering = ['priority', 'id']
+
+    def __str__(self):
+        return f"{self.pattern} -> {self.category.name}"
+
+
+class Budget(models.Model):
+    """ ✅ Spending limit for a category, every cycle or one specific cycle """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    # Empty applies to every cycle; a date pins the budget to the cycle that
+    # starts then and overrides the every-cycle one
+    cycle_start = models.DateField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'category', 'cycle_start'],
+                name='unique_cycle_budget'),
+            models.UniqueConstraint(
+                fields=['user', 'category'],
+                condition=models.Q(cycle_start__isnull=True),
+                name='unique_default_budget'),
+        ]
+
+    def clean(self):
+        from .cycles import cycle_for, start_day_for_id
+
+        # ✅ Any day in a cycle stands for that cycle
+        if self.cycle_start and self.user_id:
+            self.cycle_start = cycle_for(self.cycle_start, start_day_for_id(self.user_id)).start
+
+    def __str__(self):
+        cycle = self.cycle_start or 'every cycle'
+        return f"{self.category.name} - {self.amount} ({cycle})"
+
+
+class RecurringTransaction(models.Model):
+    """ ✅ Template for an expense or income that repeats on a schedule """
+    DAILY = 'daily'
+    WEEKLY = 'weekly'
+    MONTHLY = 'monthly'
+    CYCLE = 'cycle'
+    FREQUENCIES = [
+        (DAILY, 'Every N days'),
+        (WEEKLY, 'Every N weeks'),
+        (MONTHLY, 'Every N months on day D'),
+        (CYCLE, 'Every N billing cycles on day D of the cycle'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=CycleRollup.KINDS,
+                            default=CycleRollup.EXPENSE)
+    # Expense templates need a category, income templates a source
+    category = models.ForeignKey(
+        Category, on_delete=models.CASCADE, null=True, blank=True)
+    source = models.CharField(
+        max_length=50, choices=Income.INCOME_SOURCES, blank=True, default='')
+    description = models.TextField(blank=True, default='')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = currency_field()
+
+    frequency = models.CharField(max_length=10, choices=FREQUENCIES, default=MONTHLY)
+    interval = models.PositiveSmallIntegerField(
+        default=1, validators=[MinValueValidator(1)])
+    # Day of the month (monthly) or of the cycle, 1 = first day (cycle);
+    # clipped to the last day in short months
+    day = models.PositiveSmallIntegerField(
+        default=1, validators=[MinValueValidator(1), MaxValueValidator(31)])
+    start_date = models.DateField()
+    end_date = models.DateField(null=True, blank=True)
+    active = models.BooleanField(default=True)
+    # ✅ Scheduler cursor: the first occurrence not materialized yet
+    next_due = models.DateField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['active', 'next_due'],
+                         name='selavu_recurring_due_idx'),
+        ]
+
+    def clean(self):
+        if self.kind == CycleRollup.EXPENSE and not self.category_id:
+            raise ValidationError({'category': "Recurring expenses need a category."})
+        if self.kind == CycleRollup.INCOME and not self.source:
+            raise ValidationError({'source': "Recurring incomes need a source."})
+        if self.end_date and self.end_date < self.start_date:
+            raise ValidationError({'end_date': "End date is before the start date."})
+
+    def __str__(self):
+        what = self.category.name if self.category_id else self.source
+        return f"{what} - {self.amount} ({self.get_frequency_display()})"
+
+
+class ExchangeRate(models.Model):
+    """
+    ✅ What one unit of `currency` was worth on `date`, in the base currency
+    of the loaded rate file (SELAVU_BASE_CURRENCY). Loaded with
+    `manage.py load_exchange_rates`.
+    """
+    currency = models.CharField(max_length=3, validators=[currency_code])
+    date = models.DateField()
+    rate = models.DecimalField(max_digits=20, decimal_places=10)
+
+    class Meta:
+        constraints = [
+            # Also the (currency, date) index every rate lookup seeks on
+            models.UniqueConstraint(fields=['currency', 'date'], name='unique_exchange_rate'),
+        ]
+
+    def __str__(self):
+        return f"{self.currency} {self.date}: {self.rate}"
+
+
+class LedgerEvent(models.Model):
+    """
+    ✅ Append-only record of one change to an expense, income or category,
+    written in the same transaction as the change. `data` holds the row's
+    fields after a create/update (only the changed ones for bulk updates)
+    and its last state for a delete.
+    """
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    ACTIONS = [
+        (CREATE, 'Create'),
+        (UPDATE, 'Update'),
+        (DELETE, 'Delete'),
+    ]
+
+    # Owner of the changed row; no FK cascade should ever rewrite history
+    user_id = models.IntegerField()
+    model = models.CharField(max_length=20)  # 'expense', 'income' or 'category'
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # ✅ Replays read one user's events after a checkpoint's id
+            models.Index(fields=['user_id', 'id'], name='selavu_event_user_id_idx'),
+            models.Index(fields=['model', 'object_id'], name='selavu_event_object_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("Ledger events are append-only")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.created_at} - {self.action} {self.model} #{self.object_id}"
+
+
+class LedgerCheckpoint(models.Model):
+    """
+    ✅ A user's whole ledger as replayed up to (and including) event
+    `last_event_id`, so reconstructing a point in time replays only the
+    events after the nearest checkpoint.
+    """
+    user_id = models.IntegerField()
+    last_event_id = models.BigIntegerField()
+    # created_at of that event: the checkpoint is the ledger as of this time
+    taken_at = models.DateTimeField()
+    # {'expense': {pk: fields}, 'income': {...}, 'category': {...}}
+    state = models.JSONField(encoder=DjangoJSONEncoder)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user_id', 'taken_at'], name='selavu_ckpt_user_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"user {self.user_id} as of {self.taken_at}"
+
+
+class Blob(models.Model):
+    """
+    ✅ One stored file, named by the SHA-256 of its content, so identical
+    uploads are kept once. Lives under SELAVU_ATTACHMENT_DIR.
+    """
+    digest = models.CharField(max_length=64, primary_key=True)
+    size = models.PositiveBigIntegerField()
+    # Sniffed from the first bytes, never taken from the client
+    content_type = models.CharField(max_length=100, default='application/octet-stream')
+    # Filled in off the request path by attachments.process_blob()
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    has_thumbnail = models.BooleanField(default=False)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.digest[:12]} ({self.content_type}, {self.size} bytes)"
+
+
+class Attachment(models.Model):
+    """ ✅ A receipt or other file on an expense """
+    expense = models.ForeignKey(Expense, on_delete=models.CASCADE, related_name='attachments')
+    # Orphaned blobs are removed by `manage.py prune_attachments`
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, related_name='attachments')
+    name = models.CharField(max_length=255)  # File name as uploaded
+    uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    uploaded_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.name} on expense #{self.expense_id}"
+
+
+class Task(models.Model):
+    """
+    ✅ A background job for selavu.tasks, run by `manage.py run_tasks`.
+    Failed attempts are retried with backoff until max_attempts.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)  # Registered with @tasks.task
+    kwargs = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True,
+                             related_name='tasks')
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    progress = models.FloatField(default=0)  # 0 to 1
+    message = models.CharField(max_length=255, blank=True)
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(blank=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # A running task whose worker died is picked up again after this
+    locked_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # ✅ Workers look for the oldest due task of a status
+            models.Index(fields=['status', 'run_after'], name='selavu_task_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+
+class ArchivedExpense(models.Model):
+    """
+    ✅ An expense from a closed cycle older than SELAVU_ARCHIVE_AFTER_CYCLES,
+    moved out of the hot table by archive.archive_cycles(). It keeps the id
+    it had there; read through archive.py, not on its own.
+    """
+    archived = True  # Templates show these read-only
+
+    id = models.IntegerField(primary_key=True)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+')
+    date = models.DateField()
+    add_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    description = models.TextField()
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = currency_field()
+    recurring = models.ForeignKey(
+        'RecurringTransaction', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='+')
+    workspace = models.ForeignKey(Workspace, on_delete=models.CASCADE, null=True, blank=True,
+                                  related_name='+')
+
+    objects = WorkspaceQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['add_by', 'date'], name='selavu_arch_user_date_idx'),
+            models.Index(fields=['workspace', 'date'], name='selavu_arch_ws_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.category.name} - {self.amount} - {self.date} (archived)"
+
+
+class ArchivedCycle(models.Model):
+    """
+    ✅ One user's cycle whose expenses went to the archive, with the cycle's
+    totals (home currency) as the rollups had them when it was archived.
+    The newest `end` tells readers how far back the hot table reaches.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_cycles')
+    start = models.DateField()
+    end = models.DateField()
+    rows = models.PositiveIntegerField(default=0)  # Expenses moved to the archive
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.PositiveIntegerField(default=0)
+    currency = currency_field()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'start'], name='unique_archived_cycle'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.start} - {self.end}"
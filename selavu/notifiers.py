@@ -0,0 +1,65 @@
+import json
+import sys
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_NOTIFIER = 'selavu.notifiers.ConsoleNotifier'
+ALERT_FILE = getattr(settings, 'SELAVU_ALERT_FILE', None)
+
+
+class BaseNotifier:
+    """ ✅ Delivers alerts (e.g. selavu.budgets.BudgetAlert); subclass and override send() """
+
+    def send(self, alert):
+        raise NotImplementedError
+
+
+class ConsoleNotifier(BaseNotifier):
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+        self._lock = threading.Lock()
+
+    def send(self, alert):
+        with self._lock:
+            self.stream.write(f"[selavu] {alert.message}\n")
+            self.stream.flush()
+
+
+class FileNotifier(BaseNotifier):
+    """ One JSON object per line, appended to SELAVU_ALERT_FILE """
+
+    def __init__(self, path=None):
+        self.path = path or ALERT_FILE
+        if not self.path:
+            raise ValueError("FileNotifier needs SELAVU_ALERT_FILE")
+        self._lock = threading.Lock()
+
+    def send(self, alert):
+        line = json.dumps(alert.as_dict(), default=str)
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+
+class MemoryNotifier(BaseNotifier):
+    """ Keeps alerts in MemoryNotifier.outbox, for tests """
+    outbox = []
+
+    def send(self, alert):
+        self.outbox.append(alert)
+
+
+_notifiers = {}
+
+
+def get_notifier():
+    """ ✅ The SELAVU_NOTIFIER backend, built once per process """
+    path = getattr(settings, 'SELAVU_NOTIFIER', DEFAULT_NOTIFIER)
+    if path not in _notifiers:
+        _notifiers[path] = import_string(path)()
+    return _notifiers[path]
+
+
+def notify(alert):
+    get_notifier().send(alert)
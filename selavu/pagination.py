@@ -0,0 +1,129 @@
+from datetime import date
+
+from django.db.models import Q
+
+# Largest id SQLite can bind; a bigger one would fail in the query, not here
+MAX_ID = 2 ** 63 - 1
+
+
+class InvalidCursor(ValueError):
+    """ A cursor we didn't hand out: malformed or tampered with """
+
+
+class KeysetPage:
+    """ ✅ One page of rows ordered newest first on (date, id) """
+
+    def __init__(self, rows, next_cursor=None, previous_cursor=None):
+        self.rows = rows
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def encode_cursor(row):
+    return f"{row.date.isoformat()}.{row.pk}"
+
+
+def decode_cursor(value):
+    """ "2025-03-30.123" back into (date, id); None without a cursor, InvalidCursor if bad """
+    if not value:
+        return None
+    try:
+        day, pk = value.split('.', 1)
+        key = date.fromisoformat(day), int(pk)
+    except ValueError:
+        raise InvalidCursor(f"Invalid cursor: {value[:40]}")
+    if not 0 <= key[1] <= MAX_ID:
+        raise InvalidCursor(f"Invalid cursor: {value[:40]}")
+    return key
+
+
+def _seek(queryset, after, before, page_size):
+    """ The page query plus how to read the rows it returns """
+    before_key = decode_cursor(before)
+    after_key = decode_cursor(after)
+    if before_key:
+        day, pk = before_key
+        qs = queryset.filter(Q(date__gt=day) | Q(date=day, pk__gt=pk))
+        return qs.order_by('date', 'pk')[:page_size + 1], before_key, after_key
+
+    qs = queryset
+    if after_key:
+        day, pk = after_key
+        qs = qs.filter(Q(date__lt=day) | Q(date=day, pk__lt=pk))
+    return qs.order_by('-date', '-pk')[:page_size + 1], before_key, after_key
+
+
+def _page(rows, page_size, before_key, after_key):
+    has_more = len(rows) > page_size
+    if before_key:
+        rows = rows[:page_size][::-1]
+        return KeysetPage(
+            rows,
+            next_cursor=encode_cursor(rows[-1]) if rows else None,
+            previous_cursor=encode_cursor(rows[0]) if rows and has_more else None,
+        )
+    rows = rows[:page_size]
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(rows[-1]) if rows and has_more else None,
+        previous_cursor=encode_cursor(rows[0]) if rows and after_key else None,
+    )
+
+
+def _reaches(rows, through, page_size, before_key):
+    """ Whether a page can hold rows dated `through` or earlier """
+    if through is None:
+        return False
+    if before_key:
+        return before_key[0] <= through
+    return len(rows) <= page_size or rows[-1].date <= through
+
+
+def _merge(rows, older_rows, page_size, before_key):
+    rows = sorted(rows + older_rows, key=lambda row: (row.date, row.pk), reverse=not before_key)
+    return rows[:page_size + 1]
+
+
+def paginate_by_cursor(queryset, after=None, before=None, page_size=50,
+                       older=None, older_through=None):
+    """
+    Seek pagination on (date, id) instead of OFFSET, so every page costs the
+    same no matter how deep the user scrolls.
+
+    `after` walks towards older rows, `before` walks back towards newer ones.
+    `older` is a second queryset (the archive) with rows up to
+    `older_through`; it is only read for pages that reach back that far,
+    and its rows are merged in on the same key. Raises InvalidCursor for a
+    cursor that doesn't decode.
+    """
+    qs, before_key, after_key = _seek(queryset, after, before, page_size)
+    rows = list(qs)
+    if older is not None and _reaches(rows, older_through, page_size, before_key):
+        rows = _merge(rows, list(_seek(older, after, before, page_size)[0]), page_size,
+                      before_key)
+    return _page(rows, page_size, before_key, after_key)
+
+
+async def apaginate_by_cursor(queryset, after=None, before=None, page_size=50,
+                              older=None, older_through=None):
+    """ ✅ paginate_by_cursor() for async views, through the async ORM """
+    qs, before_key, after_key = _seek(queryset, after, before, page_size)
+    rows = [row async for row in qs]
+    if older is not None and _reaches(rows, older_through, page_size, before_key):
+        older_qs = _seek(older, after, before, page_size)[0]
+        rows = _merge(rows, [row async for row in older_qs], page_size, before_key)
+    return _page(rows, page_size, before_key, after_key)
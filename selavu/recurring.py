@@ -0,0 +1,120 @@
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils.timezone import now
+
+from . import audit, rollups, workspaces
+from .cycles import (
+    _month_shift, _start_in_month, cycle_back, cycle_for, default_start_day, start_days_for_ids)
+from .models import CycleRollup, Expense, Income, LedgerEvent, RecurringTransaction
+
+MaterializeResult = namedtuple('MaterializeResult', ['templates', 'expenses', 'incomes'])
+
+
+def _day_in_cycle(cycle, day):
+    return min(cycle.start + timedelta(days=day - 1), cycle.end)
+
+
+def first_occurrence(template, start_day=None):
+    """ The first occurrence on or after the template's start date """
+    start = template.start_date
+    if template.frequency == RecurringTransaction.MONTHLY:
+        first = _start_in_month(start.year, start.month, template.day)
+        if first < start:
+            year, month = _month_shift(start.year, start.month, 1)
+            first = _start_in_month(year, month, template.day)
+        return first
+    if template.frequency == RecurringTransaction.CYCLE:
+        first = _day_in_cycle(cycle_for(start, start_day), template.day)
+        if first < start:
+            first = _day_in_cycle(cycle_back(start, -1, start_day), template.day)
+        return first
+    return start
+
+
+def next_occurrence(template, current, start_day=None):
+    """ The occurrence after `current`; months and cycles keep the template's day """
+    if template.frequency == RecurringTransaction.DAILY:
+        return current + timedelta(days=template.interval)
+    if template.frequency == RecurringTransaction.WEEKLY:
+        return current + timedelta(weeks=template.interval)
+    if template.frequency == RecurringTransaction.MONTHLY:
+        year, month = _month_shift(current.year, current.month, template.interval)
+        return _start_in_month(year, month, template.day)
+    return _day_in_cycle(cycle_back(current, -template.interval, start_day), template.day)
+
+
+def _build_row(template, day):
+    if template.kind == CycleRollup.EXPENSE:
+        return Expense(category_id=template.category_id, date=day, add_by_id=template.user_id,
+                       description=template.description, amount=template.amount,
+                       currency=template.currency, recurring_id=template.pk)
+    return Income(source=template.source, date=day, add_by_id=template.user_id,
+                  description=template.description, amount=template.amount,
+                  currency=template.currency, recurring_id=template.pk)
+
+
+def _drop_existing(model, rows, chunk_size=500):
+    """ Rows whose (template, date) is already in the ledger are left out """
+    if not rows:
+        return rows
+    template_ids = sorted({row.recurring_id for row in rows})
+    first_day = min(row.date for row in rows)
+    existing = set()
+    for i in range(0, len(template_ids), chunk_size):
+        existing.update(model.objects.filter(
+            recurring_id__in=template_ids[i:i + chunk_size], date__gte=first_day,
+        ).values_list('recurring_id', 'date'))
+    return [row for row in rows if (row.recurring_id, row.date) not in existing]
+
+
+def materialize_due(today=None, users=None, batch_size=1000):
+    """
+    ✅ Write every occurrence due up to `today` for all active templates in
+    one transaction: rows go in with bulk_create, rollups are updated per
+    bucket and each template's next_due cursor moves past what was written.
+    Re-running is a no-op, and a run that dies leaves nothing half-written.
+    """
+    today = today or now().date()
+    with transaction.atomic():
+        templates = RecurringTransaction.objects.filter(
+            Q(next_due__lte=today) | Q(next_due__isnull=True), active=True)
+        if users is not None:
+            templates = templates.filter(user__in=users)
+        templates = list(templates)
+        start_days = start_days_for_ids({t.user_id for t in templates})
+
+        expenses, incomes = [], []
+        for template in templates:
+            start_day = start_days.get(template.user_id) or default_start_day()
+            due = template.next_due or first_occurrence(template, start_day)
+            while due <= today and (template.end_date is None or due <= template.end_date):
+                row = _build_row(template, due)
+                (expenses if template.kind == CycleRollup.EXPENSE else incomes).append(row)
+                due = next_occurrence(template, due, start_day)
+            template.next_due = due
+            if template.end_date and due > template.end_date:
+                template.active = False
+
+        expenses = _drop_existing(Expense, expenses)
+        incomes = _drop_existing(Income, incomes)
+        # bulk_create skips the rollup signals, so fold the rows in per bucket
+        Expense.objects.bulk_create(expenses, batch_size=batch_size)
+        Income.objects.bulk_create(incomes, batch_size=batch_size)
+        rollups.apply_many(expenses)
+        rollups.apply_many(incomes)
+        audit.record_many(expenses + incomes, LedgerEvent.CREATE)
+        workspaces.touch({row.workspace_id for row in expenses + incomes})
+        # Templates of one run mostly land on a handful of next dates, so one
+        # UPDATE per (next_due, active) beats a per-row bulk_update()
+        cursors = defaultdict(list)
+        for template in templates:
+            cursors[(template.next_due, template.active)].append(template.pk)
+        for (next_due, active), ids in cursors.items():
+            for i in range(0, len(ids), batch_size):
+                RecurringTransaction.objects.filter(pk__in=ids[i:i + batch_size]).update(
+                    next_due=next_due, active=active)
+
+    return MaterializeResult(len(templates), len(expenses), len(incomes))
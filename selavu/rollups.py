@@ -0,0 +1,275 @@
+import threading
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce
+
+from . import budgets
+from .caching import bump_versions
+from .currency import RateCache
+from .cycles import cycle_for, default_start_day
+from .models import (
+    ArchivedExpense, CycleRollup, Expense, Income, Profile, default_currency)
+
+ROLLUP_FIELDS = ('add_by_id', 'date', 'amount', 'currency', 'category_id', 'source')
+
+# A ledger row reduced to what the rollups care about
+Entry = namedtuple('Entry', ['kind', 'user_id', 'date', 'category_id', 'source', 'amount',
+                             'currency'])
+
+# Signed entries collected by batched() instead of being written one by one
+_pending = threading.local()
+
+
+def entry_of(instance):
+    # Rows created from strings ("2025-03-30", "12.50") have not been cleaned yet
+    day = instance._meta.get_field('date').to_python(instance.date)
+    amount = Decimal(str(instance.amount))
+    if isinstance(instance, Expense):
+        return Entry(CycleRollup.EXPENSE, instance.add_by_id, day,
+                     instance.category_id, '', amount, instance.currency)
+    return Entry(CycleRollup.INCOME, instance.add_by_id, day,
+                 None, instance.source, amount, instance.currency)
+
+
+def ledger_settings(user_ids=None):
+    """
+    {user_id: (cycle start day, home currency)} from the profiles in one
+    query; users without a profile get the defaults.
+    """
+    profiles = Profile.objects.all()
+    if user_ids is not None:
+        profiles = profiles.filter(user_id__in=list(user_ids))
+    found = {user_id: (start_day, home) for user_id, start_day, home in profiles.values_list(
+        'user_id', 'cycle_start_day', 'home_currency')}
+    defaults = (default_start_day(), default_currency())
+    return defaultdict(lambda: defaults, found)
+
+
+def signed_deltas(entries):
+    """
+    ✅ {rollup key: [amount, count]} for (Entry, sign) pairs, in each user's
+    home currency. Foreign-currency rows are converted in one pass over a
+    RateCache loaded up front, never with a query per row.
+    """
+    user_settings = ledger_settings({entry.user_id for entry, _ in entries})
+    rates = RateCache()
+    rates.load(pair for entry, _ in entries if entry.currency != user_settings[entry.user_id][1]
+               for pair in ((entry.currency, entry.date),
+                            (user_settings[entry.user_id][1], entry.date)))
+    deltas = defaultdict(lambda: [Decimal(0), 0])
+    for entry, sign in entries:
+        start_day, home = user_settings[entry.user_id]
+        delta = deltas[rollup_key(entry, start_day)]
+        delta[0] += rates.convert(entry.amount, entry.currency, home, entry.date) * sign
+        delta[1] += sign
+    return deltas
+
+
+def snapshot(instance):
+    """
+    Remember which bucket a saved row currently sits in, so a later edit or
+    delete can take its old amount back out. Returns None for unsaved rows and
+    for rows loaded with the needed fields deferred.
+    """
+    if instance.pk is None:
+        return None
+    deferred = instance.get_deferred_fields()
+    if any(f.attname in deferred for f in instance._meta.concrete_fields
+           if f.attname in ROLLUP_FIELDS):
+        return None
+    return entry_of(instance)
+
+
+def rollup_key(entry, start_day):
+    """ (user, cycle start, kind, category, source) bucket the entry counts towards """
+    cycle_start = cycle_for(entry.date, start_day).start
+    return (entry.user_id, cycle_start, entry.kind, entry.category_id, entry.source)
+
+
+def record_change(previous, current):
+    """
+    ✅ Move an edited row between buckets: take `previous` out and put
+    `current` in. Either side may be None for creates and deletes.
+    """
+    if batching():
+        _pending.entries.extend((entry, sign) for entry, sign in ((previous, -1), (current, 1))
+                                if entry is not None)
+        return
+    deltas = signed_deltas([(entry, sign) for entry, sign in ((previous, -1), (current, 1))
+                            if entry is not None])
+    for key, (amount, count) in deltas.items():
+        if amount or count:
+            apply_delta(key, amount, count)
+
+
+def apply_delta(key, amount, count):
+    """ ✅ Add `amount`/`count` to one rollup row, creating it on first use """
+    user_id, cycle_start, kind, category_id, source = key
+    lookup = {
+        'user_id': user_id,
+        'cycle_start': cycle_start,
+        'kind': kind,
+        'category_id': category_id,
+        'source': source,
+    }
+    rows = CycleRollup.objects.filter(**lookup)
+    if not rows.update(total=F('total') + amount, count=F('count') + count):
+        try:
+            with transaction.atomic():
+                CycleRollup.objects.create(total=amount, count=count, **lookup)
+        except IntegrityError:
+            # Another writer created the row in between
+            rows.update(total=F('total') + amount, count=F('count') + count)
+    budgets.evaluate(key, amount)
+
+
+@contextmanager
+def batched():
+    """
+    ✅ One transaction in which the save/delete signals only collect their
+    rollup changes; they are written together by apply_entries() on the way
+    out. Use around queryset deletes and loops of saves.
+    """
+    if batching():
+        yield  # The outer batch writes everything
+        return
+    _pending.entries = []
+    try:
+        with transaction.atomic():
+            yield
+            entries, _pending.entries = _pending.entries, None
+            apply_entries(entries)
+    finally:
+        _pending.entries = None
+
+
+def batching():
+    return getattr(_pending, 'entries', None) is not None
+
+
+def apply_many(instances, sign=1, batch_size=500):
+    """
+    Fold rows written without signals (bulk_create and friends) into the
+    rollups. `sign=-1` takes them back out.
+    """
+    apply_entries([(entry_of(instance), sign) for instance in instances], batch_size)
+
+
+def apply_entries(entries, batch_size=500):
+    """
+    Apply (Entry, sign) pairs: touched buckets are read in chunks, then
+    updated and created in bulk, so the cost doesn't grow with one query per
+    bucket.
+    """
+    if not entries:
+        return
+    # A row moved out and back again leaves its bucket as it was
+    deltas = {key: delta for key, delta in signed_deltas(entries).items() if any(delta)}
+    user_ids = sorted({entry.user_id for entry, _ in entries})
+    if not deltas:
+        bump_versions(user_ids)
+        return
+
+    # ✅ Read-modify-write is safe here: the (IMMEDIATE) transaction holds
+    # SQLite's write lock until commit
+    with transaction.atomic():
+        first = min(key[1] for key in deltas)
+        last = max(key[1] for key in deltas)
+        existing = {}
+        for i in range(0, len(user_ids), batch_size):
+            for row in CycleRollup.objects.filter(
+                    user_id__in=user_ids[i:i + batch_size], cycle_start__range=(first, last)):
+                existing[(row.user_id, row.cycle_start, row.kind,
+                          row.category_id, row.source)] = row
+
+        increments, created, moves = [], [], []
+        for key, (amount, count) in deltas.items():
+            row = existing.get(key)
+            if row is None:
+                user_id, cycle_start, kind, category_id, source = key
+                row = CycleRollup(user_id=user_id, cycle_start=cycle_start, kind=kind,
+                                  category_id=category_id, source=source, total=0, count=0)
+                created.append(row)
+            else:
+                increments.append((str(amount), count, row.pk))
+            row.total += amount
+            row.count += count
+            moves.append((key, amount, row.total))
+
+        # bulk_update() builds a CASE per row, which SQLite evaluates slowly for
+        # thousands of rows; one prepared statement run per row is far cheaper
+        table = connection.ops.quote_name(CycleRollup._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"UPDATE {table} SET total = total + %s, count = count + %s WHERE id = %s",
+                increments)
+        CycleRollup.objects.bulk_create(created, batch_size=batch_size)
+        budgets.evaluate_many(moves)
+    bump_versions(user_ids)
+
+
+def rebuild(users=None, batch_size=500):
+    """
+    Recompute the rollups from the raw ledger in bulk. Rows in the owner's
+    home currency are summed per day in the database, so only (days x
+    categories) rows reach Python; foreign-currency rows are grouped per
+    amount too and each group is converted once, rounded like a single row.
+    """
+    with transaction.atomic():
+        expenses = Expense.objects.all()
+        archived = ArchivedExpense.objects.all()
+        incomes = Income.objects.all()
+        rollups = CycleRollup.objects.all()
+        if users is not None:
+            expenses = expenses.filter(add_by__in=users)
+            archived = archived.filter(add_by__in=users)
+            incomes = incomes.filter(add_by__in=users)
+            rollups = rollups.filter(user__in=users)
+        user_settings = ledger_settings(
+            None if users is None else [getattr(u, 'pk', u) for u in users])
+        home = Coalesce('add_by__profile__home_currency', Value(default_currency()))
+        rates = RateCache()
+
+        totals = defaultdict(lambda: [Decimal(0), 0])
+        # Archived expenses still count; they only live in another table
+        for kind, rows, field in ((CycleRollup.EXPENSE, expenses, 'category'),
+                                  (CycleRollup.EXPENSE, archived, 'category'),
+                                  (CycleRollup.INCOME, incomes, 'source')):
+            rows = rows.order_by().alias(home=home)
+            days = rows.filter(currency=F('home')).values('add_by', 'date', field).annotate(
+                day_total=Sum('amount'), day_count=Count('id'))
+            foreign = list(rows.exclude(currency=F('home')).values(
+                'add_by', 'date', field, 'currency', 'amount').annotate(day_count=Count('id')))
+            rates.load(pair for row in foreign for pair in (
+                (row['currency'], row['date']), (user_settings[row['add_by']][1], row['date'])))
+
+            def add(row, amount):
+                start_day, _ = user_settings[row['add_by']]
+                key = (row['add_by'], cycle_for(row['date'], start_day).start, kind,
+                       row.get('category'), row.get('source', ''))
+                totals[key][0] += amount
+                totals[key][1] += row['day_count']
+
+            for row in days.iterator():
+                add(row, row['day_total'])
+            for row in foreign:
+                amount = rates.convert(row['amount'], row['currency'],
+                                       user_settings[row['add_by']][1], row['date'])
+                add(row, amount * row['day_count'])
+
+        touched = set(rollups.order_by().values_list('user_id', flat=True).distinct())
+        touched.update(key[0] for key in totals)
+        rollups.delete()
+        CycleRollup.objects.bulk_create((
+            CycleRollup(user_id=user_id, cycle_start=cycle_start, kind=kind,
+                        category_id=category_id, source=source,
+                        total=total, count=count)
+            for (user_id, cycle_start, kind, category_id, source), (total, count)
+            in totals.items()
+        ), batch_size=batch_size)
+        bump_versions(touched)
+        return len(totals)
@@ -0,0 +1,141 @@
+import re
+
+from django.db import connections
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.expressions import RawSQL
+
+# Ledger table -> (FTS5 table, indexed columns). The FTS tables are
+# external-content: the text stays in the ledger and triggers mirror writes.
+SEARCH_INDEXES = {
+    'selavu_expense': ('selavu_expense_fts', ('description',)),
+    'selavu_income': ('selavu_income_fts', ('description', 'source')),
+}
+
+TERM = re.compile(r'\w+', re.UNICODE)
+# Ranked results stop here; refine the search to see others
+SEARCH_LIMIT = 500
+
+
+def index_sql(table):
+    """ CREATE statements for the FTS table and its sync triggers, all idempotent """
+    fts, columns = SEARCH_INDEXES[table]
+    cols = ', '.join(columns)
+    new = ', '.join(f'new.{c}' for c in columns)
+    old = ', '.join(f'old.{c}' for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{cols}, content='{table}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {cols} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+    ]
+
+
+def rebuild_sql(table):
+    fts = SEARCH_INDEXES[table][0]
+    return f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"
+
+
+def drop_sql(table):
+    fts = SEARCH_INDEXES[table][0]
+    return [f"DROP TRIGGER IF EXISTS {fts}_{event}" for event in ('insert', 'delete', 'update')] + [
+        f"DROP TABLE IF EXISTS {fts}"]
+
+
+def ensure_search_indexes(using='default'):
+    """
+    ✅ Recreate missing FTS tables/triggers and re-index what they missed.
+    SQLite migrations that remake a ledger table drop its triggers, so this
+    runs after every migrate. Returns the tables that were re-indexed.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return []
+    rebuilt = []
+    with connection.cursor() as cursor:
+        existing = {name for name, in cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")}
+        for table, (fts, _) in SEARCH_INDEXES.items():
+            if table not in existing:
+                continue
+            wanted = {fts} | {f"{fts}_{event}" for event in ('insert', 'delete', 'update')}
+            if wanted <= existing:
+                continue
+            for statement in index_sql(table):
+                cursor.execute(statement)
+            cursor.execute(rebuild_sql(table))
+            rebuilt.append(table)
+    return rebuilt
+
+
+def rebuild_search_indexes(optimize=True, using='default'):
+    """ Re-index every ledger table from scratch and merge the index segments """
+    ensure_search_indexes(using)
+    with connections[using].cursor() as cursor:
+        for table, (fts, _) in SEARCH_INDEXES.items():
+            cursor.execute(rebuild_sql(table))
+            if optimize:
+                cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('optimize')")
+    return list(SEARCH_INDEXES)
+
+
+def match_query(text):
+    """
+    Turn free text into a safe FTS5 query: every word must match, as a
+    prefix ("swig" finds "Swiggy"). Returns None when there is nothing to search.
+    """
+    terms = TERM.findall(text or '')
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search(queryset, text):
+    """
+    ✅ Narrow a ledger queryset to rows matching `text`. The match is one
+    uncorrelated `id IN (SELECT rowid ... MATCH)`, so it stays fast under any
+    ordering or count() - a plain join lets SQLite put the ledger table
+    outside and re-run the MATCH for every row.
+    """
+    query = match_query(text)
+    if query is None:
+        return queryset.none()
+    fts = SEARCH_INDEXES[queryset.model._meta.db_table][0]
+    return queryset.filter(
+        pk__in=RawSQL(f"SELECT rowid FROM {fts} WHERE {fts} MATCH %s", (query,)))
+
+
+def ranked_ids(queryset, text, limit=SEARCH_LIMIT):
+    """ Primary keys of the `limit` best bm25 matches within the queryset """
+    query = match_query(text)
+    if query is None:
+        return []
+    fts = SEARCH_INDEXES[queryset.model._meta.db_table][0]
+    # The FTS table drives; each hit is checked against the queryset's own
+    # filters with one primary key lookup
+    inner, params = queryset.order_by().filter(
+        pk=RawSQL(f"{fts}.rowid", ())).values('pk').query.sql_with_params()
+    sql = (f"SELECT rowid FROM {fts} WHERE {fts} MATCH %s AND EXISTS ({inner}) "
+           f"ORDER BY rank LIMIT %s")
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, (query, *params, limit))
+        return [pk for pk, in cursor.fetchall()]
+
+
+def rank(queryset, text, limit=SEARCH_LIMIT):
+    """
+    ✅ The `limit` best matches in the queryset, best first, annotated with
+    their position as `search_rank`.
+    """
+    ids = ranked_ids(queryset, text, limit)
+    if not ids:
+        return queryset.none()
+    return queryset.filter(pk__in=ids).annotate(search_rank=Case(
+        *[When(pk=pk, then=Value(position)) for position, pk in enumerate(ids)],
+        output_field=IntegerField(),
+    )).order_by('search_rank')
@@ -0,0 +1,156 @@
+from django.db.models.signals import post_delete, post_init, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+
+from . import audit, rollups, workspaces
+from .caching import bump_versions
+from .cycles import default_start_day
+from .search import ensure_search_indexes
+from .classifier import CLASSIFIER_SCOPE
+from .currency import rebuild_for_currencies
+from .models import (
+    Budget, Category, CategoryRule, ExchangeRate, Expense, Income, LedgerEvent, Profile,
+    default_currency)
+
+
+@receiver(post_init, sender=Expense)
+@receiver(post_init, sender=Income)
+def remember_rollup_bucket(sender, instance, **kwargs):
+    instance._rollup_state = rollups.snapshot(instance)
+
+
+@receiver(pre_save, sender=Expense)
+@receiver(pre_save, sender=Income)
+def load_rollup_bucket(sender, instance, raw=False, **kwargs):
+    # ✅ Rows built by hand with an existing pk still need their old bucket
+    if raw or instance.pk is None:
+        return
+    if getattr(instance, '_rollup_state', None) is None:
+        previous = sender.objects.filter(pk=instance.pk).first()
+        instance._rollup_state = rollups.snapshot(previous) if previous else None
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_save, sender=Income)
+def update_rollups_on_save(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    previous = None if created else getattr(instance, '_rollup_state', None)
+    instance._rollup_state = rollups.snapshot(instance)
+    rollups.record_change(previous, instance._rollup_state)
+
+
+@receiver(post_delete, sender=Expense)
+@receiver(post_delete, sender=Income)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    previous = getattr(instance, '_rollup_state', None) or rollups.snapshot(instance)
+    rollups.record_change(previous, None)
+
+
+@receiver(post_init, sender=Expense)
+@receiver(post_init, sender=Income)
+def remember_workspace(sender, instance, **kwargs):
+    # Read from __dict__ so rows loaded with these fields deferred stay lazy
+    instance._loaded_category_id = instance.__dict__.get('category_id')
+    instance._loaded_workspace_id = instance.__dict__.get('workspace_id')
+
+
+@receiver(pre_save, sender=Expense)
+@receiver(pre_save, sender=Income)
+@receiver(pre_save, sender=Category)
+def assign_workspace(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # ✅ A recategorized expense follows its new category's workspace
+    if isinstance(instance, Expense) and instance.pk is not None \
+            and instance.category_id != instance._loaded_category_id:
+        instance.workspace_id = None
+        instance._loaded_category_id = instance.category_id
+    workspaces.assign_workspaces([instance])
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_save, sender=Income)
+@receiver(post_save, sender=Category)
+def log_save(sender, instance, created=False, raw=False, **kwargs):
+    # ✅ Same connection and transaction as the save; views wrap both in atomic()
+    if not raw:
+        audit.record(instance, LedgerEvent.CREATE if created else LedgerEvent.UPDATE)
+
+
+@receiver(post_delete, sender=Expense)
+@receiver(post_delete, sender=Income)
+@receiver(post_delete, sender=Category)
+def log_delete(sender, instance, **kwargs):
+    audit.record(instance, LedgerEvent.DELETE)
+
+
+@receiver(post_init, sender=Profile)
+def remember_ledger_settings(sender, instance, **kwargs):
+    instance._loaded_settings = (
+        (instance.cycle_start_day, instance.home_currency) if instance.pk else None)
+
+
+@receiver(post_save, sender=Profile)
+def rebuild_rollups_on_settings_change(sender, instance, raw=False, **kwargs):
+    # ✅ A new cycle start day re-buckets every row the user has, a new home
+    # currency converts them all again
+    previous = instance._loaded_settings or (default_start_day(), default_currency())
+    instance._loaded_settings = (instance.cycle_start_day, instance.home_currency)
+    if not raw and instance._loaded_settings != previous:
+        rollups.rebuild(users=[instance.user_id])
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_save, sender=Income)
+@receiver(post_delete, sender=Expense)
+@receiver(post_delete, sender=Income)
+def invalidate_ledger_cache(sender, instance, raw=False, **kwargs):
+    # Batched writes bump every touched user once at the end
+    if not raw and not rollups.batching():
+        bump_versions([instance.add_by_id])
+        # ✅ The other members see the row too, where it was and where it is
+        workspaces.touch([instance._loaded_workspace_id, instance.workspace_id])
+        instance._loaded_workspace_id = instance.workspace_id
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Budget)
+@receiver(post_delete, sender=Budget)
+def invalidate_category_cache(sender, instance, raw=False, **kwargs):
+    # ✅ Renamed categories change the chart labels, budgets the status
+    if not raw:
+        bump_versions([instance.user_id])
+        if isinstance(instance, Category):
+            workspaces.touch([instance.workspace_id])
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_delete, sender=Expense)
+def invalidate_classifier(sender, instance, created=False, raw=False, **kwargs):
+    # ✅ New expenses are learned incrementally; changing one it has already
+    # learned from retrains the user's classifier. Bulk edits bump it themselves.
+    if not raw and not created and not rollups.batching():
+        bump_versions([instance.add_by_id], CLASSIFIER_SCOPE)
+
+
+@receiver(post_save, sender=CategoryRule)
+@receiver(post_delete, sender=CategoryRule)
+def invalidate_category_rules(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_versions([instance.user_id], CLASSIFIER_SCOPE)
+
+
+@receiver(post_save, sender=ExchangeRate)
+@receiver(post_delete, sender=ExchangeRate)
+def reconvert_on_rate_change(sender, instance, raw=False, **kwargs):
+    # ✅ Rates edited one by one (admin); load_rates() rebuilds once per file
+    if not raw:
+        rebuild_for_currencies([instance.currency])
+
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, using='default', **kwargs):
+    # ✅ Table remakes in later migrations drop the FTS triggers
+    if sender.name == 'selavu':
+        ensure_search_indexes(using)
@@ -0,0 +1,203 @@
+import fcntl
+import hashlib
+import json
+import os
+import secrets
+import tempfile
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from django.conf import settings
+
+from . import backups
+
+SNAPSHOT_DIR = Path(getattr(settings, 'SELAVU_SNAPSHOT_DIR', backups.BACKUP_DIR / 'snapshots'))
+# Database pages per stored chunk; smaller chunks dedupe better but mean more files
+CHUNK_PAGES = getattr(settings, 'SELAVU_SNAPSHOT_CHUNK_PAGES', 8)
+
+
+class SnapshotError(backups.BackupError):
+    pass
+
+
+def chunk_dir(root=SNAPSHOT_DIR):
+    return Path(root) / 'chunks'
+
+
+def manifest_dir(root=SNAPSHOT_DIR):
+    return Path(root) / 'manifests'
+
+
+def chunk_path(digest, root=SNAPSHOT_DIR):
+    return chunk_dir(root) / digest[:2] / digest
+
+
+def read_page_size(path):
+    """ Page size from the SQLite header (bytes 16-17, 1 means 65536) """
+    with open(path, 'rb') as f:
+        header = f.read(100)
+    if not header.startswith(b'SQLite format 3\x00'):
+        raise SnapshotError(f"{path} is not an SQLite database")
+    size = int.from_bytes(header[16:18], 'big')
+    return 65536 if size == 1 else size
+
+
+def _write_atomic(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def take_snapshot(root=SNAPSHOT_DIR, source_path=None, chunk_pages=CHUNK_PAGES):
+    """
+    ✅ Store the database as content-addressed chunks plus a manifest.
+
+    A consistent copy is taken with the online backup API, cut into chunks of
+    `chunk_pages` pages, and each chunk is written (zlib-compressed) only if
+    no earlier snapshot already stored it. Returns the manifest dict.
+    """
+    root = Path(root)
+    with tempfile.TemporaryDirectory() as tmp:
+        copy_path = backups.online_backup(Path(tmp) / 'snapshot.sqlite3', source_path=source_path)
+        page_size = read_page_size(copy_path)
+        chunk_size = page_size * chunk_pages
+
+        # From finding a chunk already stored until the manifest refers to
+        # it, prune_snapshots() must not delete it
+        with _locked(root, exclusive=False):
+            whole = hashlib.sha256()
+            chunks = []
+            new_chunks = new_bytes = size = 0
+            with open(copy_path, 'rb') as f:
+                while True:
+                    data = f.read(chunk_size)
+                    if not data:
+                        break
+                    size += len(data)
+                    whole.update(data)
+                    digest = hashlib.sha256(data).hexdigest()
+                    chunks.append(digest)
+                    path = chunk_path(digest, root)
+                    if not path.exists():
+                        compressed = zlib.compress(data, 6)
+                        _write_atomic(path, compressed)
+                        new_chunks += 1
+                        new_bytes += len(compressed)
+
+            created = datetime.now()
+            manifest = {
+                'name': snapshot_name(created),
+                'created': created.isoformat(timespec='seconds'),
+                'page_size': page_size,
+                'chunk_size': chunk_size,
+                'size': size,
+                'sha256': whole.hexdigest(),
+                'chunks': chunks,
+                'new_chunks': new_chunks,
+                'new_bytes': new_bytes,
+            }
+            _write_atomic(manifest_dir(root) / f"{manifest['name']}.json",
+                          json.dumps(manifest).encode('utf-8'))
+    return manifest
+
+
+def snapshot_name(created):
+    """ Sorts by time; the random tail keeps snapshots taken together apart """
+    return f"{created.strftime('%Y-%m-%d_%H-%M-%S-%f')}-{secrets.token_hex(3)}"
+
+
+@contextmanager
+def _locked(root, exclusive):
+    """
+    Snapshots being taken share this lock; pruning takes it alone, so it
+    never deletes a chunk a snapshot has counted on but not referenced yet
+    """
+    root.mkdir(parents=True, exist_ok=True)
+    with open(root / '.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield  # Closing the file releases it
+
+
+def list_manifests(root=SNAPSHOT_DIR):
+    """ Manifest names, newest first """
+    return sorted((p.stem for p in manifest_dir(root).glob('*.json')), reverse=True)
+
+
+def load_manifest(name, root=SNAPSHOT_DIR):
+    path = manifest_dir(root) / f"{name}.json"
+    if not path.is_file():
+        raise SnapshotError(f"No snapshot named {name}")
+    return json.loads(path.read_text())
+
+
+def materialize(name, output_path, root=SNAPSHOT_DIR):
+    """ Rebuild snapshot `name` into `output_path`, verifying every chunk """
+    manifest = load_manifest(name, root)
+    whole = hashlib.sha256()
+    output_path = Path(output_path)
+    partial_path = output_path.with_name(output_path.name + '.partial')
+    with open(partial_path, 'wb') as out:
+        for digest in manifest['chunks']:
+            try:
+                data = zlib.decompress(chunk_path(digest, root).read_bytes())
+            except (OSError, zlib.error) as e:
+                partial_path.unlink(missing_ok=True)
+                raise SnapshotError(f"Chunk {digest} is missing or unreadable: {e}")
+            if hashlib.sha256(data).hexdigest() != digest:
+                partial_path.unlink(missing_ok=True)
+                raise SnapshotError(f"Chunk {digest} is corrupt")
+            whole.update(data)
+            out.write(data)
+    if whole.hexdigest() != manifest['sha256']:
+        partial_path.unlink(missing_ok=True)
+        raise SnapshotError(f"Snapshot {name} does not match its checksum")
+    os.replace(partial_path, output_path)
+    backups.check_integrity(output_path)
+    return output_path
+
+
+def restore_snapshot(name, target_path=None, root=SNAPSHOT_DIR, keep_safety_copy=True):
+    """ Rebuild snapshot `name` and restore it over the live database """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = materialize(name, Path(tmp) / f"{name}.sqlite3", root)
+        return backups.restore_backup(path, target_path, keep_safety_copy=keep_safety_copy)
+
+
+def prune_snapshots(root=SNAPSHOT_DIR, keep_last=7, keep_daily=30, today=None):
+    """
+    Keep the newest `keep_last` snapshots plus the newest snapshot of each of
+    the last `keep_daily` days, delete the other manifests, then delete every
+    chunk no remaining manifest refers to. Returns (manifests, chunks) removed.
+    Waits for snapshots being taken to finish first.
+    """
+    root = Path(root)
+    with _locked(root, exclusive=True):
+        names = list_manifests(root)
+        keep = set(names[:keep_last])
+        cutoff = (today or datetime.now().date()) - timedelta(days=keep_daily)
+        seen_days = set()
+        for name in names:  # newest first, so the first one per day wins
+            day = datetime.strptime(name[:10], '%Y-%m-%d').date()
+            if day > cutoff and day not in seen_days:
+                seen_days.add(day)
+                keep.add(name)
+
+        removed_manifests = 0
+        for name in names:
+            if name not in keep:
+                (manifest_dir(root) / f"{name}.json").unlink()
+                removed_manifests += 1
+
+        referenced = set()
+        for name in keep:
+            referenced.update(load_manifest(name, root)['chunks'])
+        removed_chunks = 0
+        for path in chunk_dir(root).glob('*/*'):
+            if path.name not in referenced:
+                path.unlink()
+                removed_chunks += 1
+    return removed_manifests, removed_chunks
@@ -0,0 +1,66 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from . import audit, rollups
+from .models import Category, Expense, Income
+
+CATEGORY_NAMES = ['Food', 'Rent', 'Travel', 'Fuel', 'Groceries', 'Bills',
+                  'Shopping', 'Health', 'Fun', 'Other']
+MERCHANTS = ['Swiggy', 'Zomato', 'Amazon', 'Uber', 'Ola', 'BigBasket',
+             'Indian Oil', 'Airtel', 'Apollo', 'PVR', 'Landlord', 'Metro']
+
+
+def generate_ledger(users=5, expenses_per_user=1000, incomes_per_user=None,
+                    days=3 * 365, seed=1, superuser=False, batch_size=1000):
+    """
+    ✅ Seed N users x M expenses (and monthly-ish incomes) with deterministic
+    random data spread over the last `days` days. Returns the created users.
+    """
+    rng = random.Random(seed)
+    if incomes_per_user is None:
+        incomes_per_user = max(1, days // 30)
+    today = date.today()
+    sources = [choice for choice, _ in Income.INCOME_SOURCES]
+
+    created_users = []
+    with transaction.atomic():
+        for u in range(users):
+            username = f"bench{seed}_{u}"
+            if superuser:
+                user = User.objects.create_superuser(username, f"{username}@example.com", 'bench')
+            else:
+                user = User.objects.create_user(username, f"{username}@example.com", 'bench')
+            created_users.append(user)
+            # Suffixed so a superuser can tell the bench users' categories apart
+            categories = [Category.objects.create(name=f"{name} ({username})", user=user)
+                          for name in CATEGORY_NAMES]
+
+            Expense.objects.bulk_create((
+                Expense(
+                    category=rng.choice(categories),
+                    date=today - timedelta(days=rng.randrange(days)),
+                    add_by=user,
+                    description=f"{rng.choice(MERCHANTS)} #{rng.randrange(100000)}",
+                    amount=Decimal(rng.randrange(100, 500000)) / 100,
+                )
+                for _ in range(expenses_per_user)
+            ), batch_size=batch_size)
+            Income.objects.bulk_create((
+                Income(
+                    source=rng.choice(sources),
+                    date=today - timedelta(days=rng.randrange(days)),
+                    add_by=user,
+                    description='Synthetic income',
+                    amount=Decimal(rng.randrange(1000000, 20000000)) / 100,
+                )
+                for _ in range(incomes_per_user)
+            ), batch_size=batch_size)
+
+        rollups.rebuild(users=created_users)
+        # Seeded rows skip the event log; replays start from their checkpoint
+        audit.baseline(created_users)
+    return created_users
@@ -0,0 +1,279 @@
+import logging
+import os
+import tempfile
+import time
+import traceback
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import archive, backups, rollups
+from .currency import MissingRate
+from .importers import StatementError, import_statement, parse_statement
+from .models import Category, Task
+
+logger = logging.getLogger(__name__)
+
+# {name: (function, max attempts)}, filled by @task
+REGISTRY = {}
+
+
+class TaskError(Exception):
+    """ A failure retrying won't fix (bad input); the task fails at once """
+
+
+def task(name=None, max_attempts=3):
+    """
+    ✅ Register a function as a background task. It is called with the
+    kwargs it was queued with plus `report`, a Progress, and returns a
+    JSON-serialisable result.
+    """
+    def register(func):
+        REGISTRY[name or func.__name__] = (func, max_attempts)
+        return func
+    return register
+
+
+def task_dir():
+    return Path(getattr(settings, 'SELAVU_TASK_DIR', os.path.join(settings.BASE_DIR, 'tasks')))
+
+
+def eager():
+    return getattr(settings, 'SELAVU_TASKS_EAGER', False)
+
+
+def enqueue(name, user=None, delay=None, **kwargs):
+    """
+    ✅ Queue a registered task and return its Task row at once; a
+    `manage.py run_tasks` worker picks it up after the transaction commits.
+    With SELAVU_TASKS_EAGER it runs in this process instead (tests, dev).
+    """
+    if name not in REGISTRY:
+        raise ValueError(f"Unknown task: {name}")
+    task = Task.objects.create(
+        name=name, kwargs=kwargs, user=user, max_attempts=REGISTRY[name][1],
+        run_after=timezone.now() + (delay or timedelta()))
+    if eager():
+        transaction.on_commit(lambda: run_now(task.pk))
+        if not transaction.get_connection().in_atomic_block:
+            task.refresh_from_db()  # on_commit already ran it
+    return task
+
+
+def stash(fileobj):
+    """
+    Copy an upload somewhere a worker process can read it. Pass the path as
+    the task's `upload` kwarg: it is deleted once the task is done or has
+    failed for good, and kept for retries until then.
+    """
+    directory = task_dir() / 'uploads'
+    directory.mkdir(parents=True, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=directory, prefix='upload-')
+    with os.fdopen(fd, 'wb') as f:
+        for chunk in fileobj.chunks() if hasattr(fileobj, 'chunks') else iter(
+                lambda: fileobj.read(64 * 1024), b''):
+            f.write(chunk)
+    return path
+
+
+def progress_interval():
+    return getattr(settings, 'SELAVU_TASK_PROGRESS_SECONDS', 1)
+
+
+def lease():
+    return timedelta(seconds=getattr(settings, 'SELAVU_TASK_LEASE_SECONDS', 60 * 60))
+
+
+def claim(pk=None):
+    """
+    ✅ Take the oldest due task, or task `pk` whether due or not, and mark it
+    running; returns its id or None. The conditional UPDATE is what makes
+    it safe for several workers to race for the same row. Running tasks
+    whose lease ran out (their worker died) are due again.
+    """
+    now = timezone.now()
+    claimable = Q(status=Task.QUEUED) | Q(status=Task.RUNNING, locked_until__lt=now)
+    if pk is not None:
+        candidates = [pk]
+    else:
+        candidates = Task.objects.filter(claimable).filter(
+            Q(status=Task.RUNNING) | Q(run_after__lte=now)).order_by(
+            'run_after', 'pk').values_list('pk', flat=True)[:10]
+    for candidate in candidates:
+        claimed = Task.objects.filter(claimable, pk=candidate).update(
+            status=Task.RUNNING, attempts=F('attempts') + 1, started_at=now,
+            locked_until=now + lease(), progress=0, message='')
+        if claimed:
+            return candidate
+    return None
+
+
+class Progress:
+    """
+    ✅ `report(done, total=None, message='')` for a running task: saved on
+    its Task row, at most once per SELAVU_TASK_PROGRESS_SECONDS. Report
+    between transactions; an update made inside one isn't seen by readers
+    until it commits, and SQLite's write lock makes the update wait anyway.
+    """
+
+    def __init__(self, pk):
+        self.pk = pk
+        self.saved_at = None
+
+    def __call__(self, done, total=None, message=''):
+        now = time.monotonic()
+        if self.saved_at is not None and now - self.saved_at < progress_interval():
+            return
+        self.saved_at = now
+        fraction = min(done / total, 1.0) if total else 0.0
+        Task.objects.filter(pk=self.pk, status=Task.RUNNING).update(
+            progress=fraction, message=str(message)[:255])
+
+
+def retry_delay(attempts):
+    """ Exponential backoff: SELAVU_TASK_RETRY_SECONDS, then twice that, ... """
+    return timedelta(seconds=getattr(settings, 'SELAVU_TASK_RETRY_SECONDS', 30)
+                     * 2 ** (attempts - 1))
+
+
+def execute(pk):
+    """
+    ✅ Run one claimed task and record how it went: done with its result,
+    queued again with backoff, or failed once out of attempts. This is what
+    run_pending() and eager tasks run.
+    """
+    task = Task.objects.get(pk=pk)
+    func = REGISTRY.get(task.name, (None,))[0]
+    try:
+        if func is None:
+            raise LookupError(f"Unknown task: {task.name}")
+        result = func(report=Progress(pk), **task.kwargs)
+    except Exception as e:
+        logger.exception("Task %s #%s failed (attempt %s)", task.name, pk, task.attempts)
+        _failed(task, traceback.format_exc(), final=isinstance(e, TaskError))
+    else:
+        _finished(task, Task.DONE, result=result, progress=1.0)
+
+
+def work(pk):
+    """ execute() in a worker process, which manages its connection like a request would """
+    close_old_connections()
+    try:
+        execute(pk)
+    finally:
+        close_old_connections()
+
+
+def _failed(task, error, final=False):
+    if not final and task.attempts < task.max_attempts:
+        Task.objects.filter(pk=task.pk).update(
+            status=Task.QUEUED, error=error, locked_until=None,
+            run_after=timezone.now() + retry_delay(task.attempts))
+    else:
+        _finished(task, Task.FAILED, error=error)
+
+
+def _finished(task, status, **fields):
+    Task.objects.filter(pk=task.pk).update(
+        status=status, finished_at=timezone.now(), locked_until=None, **fields)
+    upload = task.kwargs.get('upload')
+    if upload:
+        Path(upload).unlink(missing_ok=True)
+
+
+def run_now(pk):
+    """ Run a task in this process until it is done or out of attempts, without backoff """
+    while claim(pk) is not None:
+        execute(pk)
+
+
+def run_pending(limit=None):
+    """ ✅ Run due tasks one after another in this process; returns how many ran """
+    ran = 0
+    while limit is None or ran < limit:
+        pk = claim()
+        if pk is None:
+            break
+        execute(pk)
+        ran += 1
+    return ran
+
+
+def visible_tasks(user):
+    """ Tasks a user may see: their own; superusers see everyone's """
+    if user.is_superuser:
+        return Task.objects.all()
+    return Task.objects.filter(user=user)
+
+
+def task_json(task):
+    data = {
+        'id': task.pk,
+        'name': task.name,
+        'status': task.status,
+        'progress': task.progress,
+        'message': task.message,
+        'attempts': task.attempts,
+        'created_at': task.created_at,
+        'finished_at': task.finished_at,
+        'result': task.result,
+    }
+    if task.error and task.status != Task.RUNNING:
+        # The last line of the traceback, not the whole thing
+        data['error'] = task.error.strip().splitlines()[-1]
+    return data
+
+
+@task(name='backup')
+def backup_task(report):
+    report(0, message="Backing up")
+    # Kept apart from the scheduled backups and never rotated: a request
+    # can't push those out
+    path = backups.create_backup(backups.BACKUP_DIR / 'requested', keep=None)
+    return {'path': str(path), 'name': path.name, 'size': path.stat().st_size}
+
+
+@task(name='import_statement')
+def import_statement_task(report, upload, user_id, category_id, statement_format='csv',
+                          debit_sign='any', csv_options=None):
+    user = User.objects.get(pk=user_id)
+    # Checked again here: the rows land in the category's workspace
+    category = Category.objects.for_user(user).filter(pk=category_id).first()
+    if category is None:
+        raise TaskError(f"Category #{category_id} is not in any of your workspaces")
+
+    with open(upload, 'rb') as statement:
+        size = os.fstat(statement.fileno()).st_size
+
+        def progress(created, duplicates, skipped):
+            # How far the parser has read is how far the import has got
+            # (the parser closes the file once it has read the last line)
+            report(size if statement.closed else statement.tell(), size,
+                   f"{created} imported, {duplicates} duplicates, {skipped} skipped")
+
+        try:
+            # ✅ A transaction per batch, so progress is saved as it goes; a
+            # retry skips the batches already written as duplicates
+            result = import_statement(
+                user, parse_statement(statement, statement_format, **(csv_options or {})),
+                category, debit_sign=debit_sign, progress=progress, atomic=False)
+        except (StatementError, MissingRate) as e:
+            raise TaskError(str(e)) from e
+    return result._asdict()
+
+
+@task(name='rebuild_rollups', max_attempts=1)
+def rebuild_rollups_task(report, user_ids=None):
+    report(0, message="Rebuilding")
+    return {'rows': rollups.rebuild(users=user_ids)}
+
+
+@task(name='archive_cycles', max_attempts=1)
+def archive_cycles_task(report, keep=None, user_ids=None):
+    report(0, message="Archiving")
+    return {'moved': archive.archive_cycles(users=user_ids, keep=keep)}
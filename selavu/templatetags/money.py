@@ -0,0 +1,11 @@
+from django import template
+
+from ..currency import money as format_money
+
+register = template.Library()
+
+
+@register.filter
+def money(amount, currency):
+    """ ✅ {{ expense.amount|money:expense.currency }} -> "₹1,234.50" """
+    return format_money(amount, currency)
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from .caching import CACHE_ALIAS
+
+
+def process_cache():
+    """
+    ✅ override_settings() that moves the dashboard cache into this process'
+    memory. For runs on a throwaway database (tests, benchmarks): a shared
+    cache would hand them the ledger versions a previous run left behind.
+    """
+    return override_settings(CACHES={**settings.CACHES, CACHE_ALIAS: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'selavu-dashboard',
+    }})
+
+
+class TestRunner(DiscoverRunner):
+    """ ✅ The default runner, with process_cache() around the whole run """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache = process_cache()
+        self._cache.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._cache.disable()
+        super().teardown_test_environment(**kwargs)
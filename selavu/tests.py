@@ -1,3 +1,1696 @@
-from django.test import TestCase
+import csv
+import hashlib
+import importlib
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import zipfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.contrib.auth.models import Permission, User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.management import CommandError, call_command
+from django.utils import timezone
+
+from .archive import archive_cycles, archived_expenses, archived_through, restore
+from .attachments import BlobWriter, StoredUpload, attach, blob_path, prune, store_file
+from .cycles import current_cycle, cycle_back, cycle_for, cycles_back, user_cycle_back
+from .admin import get_dashboard_data_for_user
+from .budgets import BudgetAlert, budget_status
+from .audit import cycle_totals, ledger_as_of, replay, totals_as_of
+from .caching import _cache
+from .classifier import RuleMatcher, _classifiers, classifier_for
+from .currency import load_rates, money, parse_rates
+from .forms import ExpenseFilterForm, ExpenseForm
+from .importers import StatementError, StatementRow, import_statement, parse_statement
+from .metrics import registry
+from .models import (
+    ArchivedCycle, ArchivedExpense, Attachment, Blob, Budget, Category, CategoryRule, CycleRollup, ExchangeRate, Expense, Income, LedgerCheckpoint,
+    LedgerEvent, Membership, Profile, RecurringTransaction, Task, Workspace)
+from .notifiers import MemoryNotifier
+from . import backups, bulk, rollups, snapshots
+from .pagination import InvalidCursor, paginate_by_cursor
+from .recurring import materialize_due
+from .search import ensure_search_indexes, match_query, rank, search
+from .trends import cycle_trends
+from . import tasks
+from .workspaces import shared_dashboard
+
+
+class LedgerQueryPlanTests(TestCase):
+    """
+    ✅ Guard the hot ledger queries against falling back to full table scans.
+
+    Each test runs EXPLAIN QUERY PLAN against a seeded SQLite database, so a
+    dropped index or a rewritten filter shows up here instead of in production.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(f"user{i}") for i in range(5)]
+        cls.user = cls.users[0]
+        cls.categories = [
+            Category.objects.create(name=f"category{i}", user=cls.user)
+            for i in range(8)
+        ]
+        start = date.today() - timedelta(days=3 * 365)
+        Expense.objects.bulk_create([
+            Expense(
+                category=cls.categories[i % len(cls.categories)],
+                date=start + timedelta(days=i % 1095),
+                add_by=cls.users[i % len(cls.users)],
+                description=f"expense {i}",
+                amount=Decimal(i % 500) + Decimal('0.50'),
+            )
+            for i in range(3000)
+        ], batch_size=500)
+        Income.objects.bulk_create([
+            Income(
+                source=['Salary', 'equity', 'Allowance', 'Other'][i % 4],
+                date=start + timedelta(days=i % 1095),
+                add_by=cls.users[i % len(cls.users)],
+                amount=Decimal(1000 + i),
+            )
+            for i in range(600)
+        ], batch_size=500)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def query_plan(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def queryset_plan(self, queryset):
+        return self.query_plan(*queryset.query.sql_with_params())
+
+    def assertNoFullScan(self, plan, tables=('selavu_expense', 'selavu_income')):
+        for detail in plan:
+            for table in tables:
+                self.assertFalse(
+                    detail.startswith(f"SCAN {table}"),
+                    f"Full scan of {table}: {plan}")
+
+    def assertUsesIndex(self, plan, index_name):
+        self.assertTrue(any(index_name in detail for detail in plan),
+                        f"{index_name} not used: {plan}")
+
+    def test_cycle_expense_queryset_uses_user_date_index(self):
+        qs = Expense.objects.filter(
+            add_by=self.user, date__range=current_cycle(self.user).range)
+        plan = self.queryset_plan(qs)
+        self.assertNoFullScan(plan)
+        self.assertUsesIndex(plan, 'selavu_exp_user_date_idx')
+
+    def test_cycle_expense_sum_uses_index(self):
+        qs = Expense.objects.filter(
+            add_by=self.user, date__range=current_cycle(self.user).range,
+        ).values('category__name').annotate(total=Sum('amount'))
+        self.assertNoFullScan(self.queryset_plan(qs))
+
+    def test_category_date_range_uses_category_index(self):
+        qs = Expense.objects.filter(
+            add_by=self.user, category=self.categories[0],
+            date__gte=date.today() - timedelta(days=90))
+        plan = self.queryset_plan(qs)
+        self.assertNoFullScan(plan)
+        self.assertUsesIndex(plan, 'selavu_exp_user_cat_date_idx')
+
+    def test_cycle_income_sum_uses_user_date_index(self):
+        qs = Income.objects.filter(
+            add_by=self.user, date__range=current_cycle(self.user).range)
+        plan = self.queryset_plan(qs)
+        self.assertNoFullScan(plan)
+        self.assertUsesIndex(plan, 'selavu_inc_user_date_idx')
+
+    def test_rollup_lookup_uses_index(self):
+        qs = CycleRollup.objects.filter(
+            user=self.user, cycle_start=current_cycle(self.user).start)
+        self.assertNoFullScan(self.queryset_plan(qs), tables=('selavu_cyclerollup',))
+
+    def test_expense_list_pages_never_scan(self):
+        self.client.force_login(self.user)
+        first_page = self.client.get('/expenses/')
+        after = first_page.context['page'].next_cursor
+        for params in ({}, {'after': after},
+                       {'start_date': '2024-01-01', 'end_date': '2024-12-31'},
+                       {'category': self.categories[1].pk, 'min_amount': '10'}):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get('/expenses/', params)
+            ledger_queries = [q['sql'] for q in queries.captured_queries
+                              if 'selavu_expense' in q['sql']]
+            self.assertTrue(ledger_queries)
+            for sql in ledger_queries:
+                self.assertNoFullScan(self.query_plan(sql))
+
+
+class PaginationTests(TestCase):
+    """ ✅ Keyset pages walk (date, id) both ways without gaps or repeats """
+
+    def setUp(self):
+        self.user = User.objects.create_user('devi', password='x')
+        self.category = Category.objects.create(name='Food', user=self.user)
+        # Three rows on each of three days, so pages split days
+        Expense.objects.bulk_create([
+            Expense(category=self.category, date=date(2024, 1, day), add_by=self.user,
+                    description=f'{day}-{n}', amount=day * 10 + n)
+            for day in (1, 2, 3) for n in range(3)])
+        self.expenses = Expense.objects.filter(add_by=self.user)
+        self.newest_first = list(self.expenses.order_by('-date', '-pk'))
+        self.client.force_login(self.user)
+
+    def test_pages_walk_forwards_and_back(self):
+        pages, page = [], paginate_by_cursor(self.expenses, page_size=4)
+        self.assertFalse(page.has_previous)
+        while True:
+            pages.append(page)
+            if not page.has_next:
+                break
+            page = paginate_by_cursor(self.expenses, after=page.next_cursor, page_size=4)
+        self.assertEqual([len(p) for p in pages], [4, 4, 1])
+        self.assertEqual([row for p in pages for row in p], self.newest_first)
+        self.assertTrue(pages[-1].has_previous)
+
+        # Back from the last page: the same rows, in the same order
+        back = paginate_by_cursor(self.expenses, before=pages[-1].previous_cursor, page_size=4)
+        self.assertEqual(back.rows, pages[1].rows)
+        back = paginate_by_cursor(self.expenses, before=back.previous_cursor, page_size=4)
+        self.assertEqual(back.rows, pages[0].rows)
+        self.assertFalse(back.has_previous)
+
+    def test_bad_cursors_are_a_400(self):
+        for cursor in ('nonsense', '2024-13-01.5', '2024-01-01.x',
+                       '2024-01-01.99999999999999999999', '2024-01-01.-3'):
+            with self.assertRaises(InvalidCursor):
+                paginate_by_cursor(self.expenses, after=cursor)
+            self.assertEqual(self.client.get('/expenses/', {'after': cursor}).status_code, 400)
+            self.assertEqual(self.client.get('/expenses/', {'before': cursor}).status_code, 400)
+            response = self.client.get('/api/v1/expenses/', {'after': cursor})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('Invalid cursor', response.json()['error'])
+
+    def test_filter_offers_only_the_users_categories(self):
+        theirs = Category.objects.create(name='Theirs', user=User.objects.create_user('ravi'))
+        form = ExpenseFilterForm({'category': theirs.pk}, user=self.user)
+        self.assertFalse(form.is_valid())
+        self.assertEqual(list(form.fields['category'].queryset), [self.category])
+
+
+class RollupTests(TestCase):
+    """ ✅ Saves and deletes move cycle totals by exactly their own delta """
+
+    def setUp(self):
+        self.user = User.objects.create_user('anbu', password='x')
+        self.food = Category.objects.create(name='Food', user=self.user)
+        self.fuel = Category.objects.create(name='Fuel', user=self.user)
+
+    def totals(self):
+        return {(row.cycle_start, row.kind, row.category_id, row.source): (row.total, row.count)
+                for row in CycleRollup.objects.filter(user=self.user, count__gt=0)}
+
+    def expense(self, day, amount, category=None):
+        return Expense.objects.create(category=category or self.food, date=day,
+                                      add_by=self.user, description='Row', amount=amount)
+
+    def test_saves_and_deletes_apply_their_deltas(self):
+        meal = self.expense(date(2024, 1, 30), 100)
+        self.expense(date(2024, 2, 1), 50)
+        Income.objects.create(source='Salary', date=date(2024, 1, 27), add_by=self.user,
+                              amount=1000)
+        self.assertEqual(self.totals(), {
+            (date(2024, 1, 27), 'expense', self.food.pk, ''): (150, 2),
+            (date(2024, 1, 27), 'income', None, 'Salary'): (1000, 1)})
+
+        # Into the previous cycle and another category: out of one bucket, into another
+        meal.date, meal.category, meal.amount = date(2024, 1, 26), self.fuel, Decimal('80')
+        meal.save()
+        self.assertEqual(self.totals(), {
+            (date(2024, 1, 27), 'expense', self.food.pk, ''): (50, 1),
+            (date(2023, 12, 27), 'expense', self.fuel.pk, ''): (80, 1),
+            (date(2024, 1, 27), 'income', None, 'Salary'): (1000, 1)})
+
+        meal.delete()
+        Income.objects.filter(add_by=self.user).update(source='Bonus')  # No signal: no change
+        self.assertEqual(self.totals(), {
+            (date(2024, 1, 27), 'expense', self.food.pk, ''): (50, 1),
+            (date(2024, 1, 27), 'income', None, 'Salary'): (1000, 1)})
+
+    def test_batched_queryset_deletes_write_once(self):
+        for day in range(1, 11):
+            self.expense(date(2024, 3, day), day)
+        with CaptureQueriesContext(connection) as queries:
+            with rollups.batched():
+                Expense.objects.filter(add_by=self.user, date__lte=date(2024, 3, 5)).delete()
+        writes = [q for q in queries if 'selavu_cyclerollup' in q['sql']
+                  and not q['sql'].startswith('SELECT')]
+        self.assertEqual(len(writes), 1)  # Five deletes, one UPDATE
+        self.assertEqual(self.totals(), {
+            (date(2024, 2, 27), 'expense', self.food.pk, ''): (sum(range(6, 11)), 5)})
+
+    def test_rebuild_matches_the_incremental_totals(self):
+        rows = [self.expense(date(2024, 1, day), day * 10, (self.food, self.fuel)[day % 2])
+                for day in range(20, 31)]
+        Income.objects.create(source='Salary', date=date(2024, 1, 28), add_by=self.user,
+                              amount=1000)
+        rows[0].delete()
+        rows[1].amount = 5
+        rows[1].save()
+        with rollups.batched():
+            Expense.objects.filter(pk__in=[r.pk for r in rows[5:8]]).delete()
+        incremental = self.totals()
+        self.assertEqual(len(incremental), 5)
+        rollups.rebuild(users=[self.user])
+        self.assertEqual(self.totals(), incremental)
+
+    def test_migrating_fills_the_rollups_of_existing_rows(self):
+        self.expense(date(2024, 1, 30), 100)
+        Income.objects.create(source='Salary', date=date(2024, 1, 27), add_by=self.user,
+                              amount=1000)
+        expected = self.totals()
+        # As after 0005 on a database that already had rows
+        CycleRollup.objects.all().delete()
+        migration = importlib.import_module('selavu.migrations.0020_fill_rollups')
+        migration.fill_rollups(django_apps, None)
+        self.assertEqual(self.totals(), expected)
+
+
+class CycleTests(TestCase):
+    """ ✅ Cycles run from the start day to the day before it next month """
+
+    def test_cycles_roll_over_the_year(self):
+        self.assertEqual(cycle_for(date(2024, 1, 5)).range,
+                         (date(2023, 12, 27), date(2024, 1, 26)))
+        self.assertEqual(cycle_for(date(2023, 12, 27)), cycle_for(date(2024, 1, 26)))
+        self.assertEqual(cycle_back(date(2024, 2, 1), 1).start, date(2023, 12, 27))
+        self.assertEqual(cycle_back(date(2023, 12, 30), -1).range,
+                         (date(2024, 1, 27), date(2024, 2, 26)))
+        self.assertEqual([c.start.month for c in cycles_back(date(2024, 1, 30), 3)], [11, 12, 1])
+
+    def test_late_start_days_clamp_to_short_months(self):
+        for start_day in (29, 30, 31):
+            # February has no such day: its cycle starts on its last day
+            self.assertEqual(cycle_for(date(2023, 3, 1), start_day).range,
+                             (date(2023, 2, 28), date(2023, 3, start_day - 1)))
+            self.assertEqual(cycle_for(date(2024, 2, 29), start_day).start, date(2024, 2, 29))
+            self.assertEqual(cycle_for(date(2024, 2, 28), start_day).end, date(2024, 2, 28))
+        self.assertEqual(cycle_for(date(2024, 4, 30), 31).range,
+                         (date(2024, 4, 30), date(2024, 5, 30)))
+        # Every day is in exactly one cycle
+        cycles = cycles_back(date(2025, 1, 1), 14, 31)
+        for previous, cycle in zip(cycles, cycles[1:]):
+            self.assertEqual(cycle.start, previous.end + timedelta(days=1))
+
+    def test_default_start_day_follows_the_setting(self):
+        user = User.objects.create_user('kavya', password='x')
+        with self.settings(SELAVU_CYCLE_START_DAY=1):
+            self.assertEqual(cycle_for(date(2024, 3, 15)).range,
+                             (date(2024, 3, 1), date(2024, 3, 31)))
+            self.assertEqual(current_cycle(user, date(2024, 3, 15)).start, date(2024, 3, 1))
+            self.assertEqual(Profile.objects.create(user=user).cycle_start_day, 1)
+
+
+class StatementImportTests(TestCase):
+    """ ✅ Statements stream into expenses once, whatever the bank's format """
+
+    def setUp(self):
+        self.user = User.objects.create_user('selvi', password='x')
+        self.category = Category.objects.create(name='Bank', user=self.user)
+
+    def test_csv_parses_amounts_dates_and_descriptions(self):
+        statement = io.BytesIO(
+            '\ufeffDay,Value,Narration\n'
+            '05/01/2024,"1,234.50",  Rent  \n'
+            '06/01/2024,(12.00),"Tea, two"\n'
+            '07/01/2024,₹ -99,\n'
+            '08/01/2024,Rs. 2.50 CR,Cashback\n'
+            ',,Closing balance\n'.encode())
+        rows = list(parse_statement(statement, date_column='Day', amount_column='Value',
+                                    description_column='Narration', date_format='%d/%m/%Y'))
+        self.assertEqual(rows, [
+            StatementRow(date(2024, 1, 5), Decimal('1234.50'), 'Rent'),
+            StatementRow(date(2024, 1, 6), Decimal('-12.00'), 'Tea, two'),
+            StatementRow(date(2024, 1, 7), Decimal('-99'), ''),
+            StatementRow(date(2024, 1, 8), Decimal('2.50'), 'Cashback')])
+
+    def test_bad_csv_lines_name_the_line(self):
+        for body, message in ((b'2024-01-05,10,Bus\n2024-01-06\n', 'Line 3: no amount'),
+                              (b'2024-01-05,ten,Bus\n', 'Line 2: Invalid amount'),
+                              (b'2024-01-05,1e5,Bus\n', "Line 2: Invalid amount: '1e5'"),
+                              (b'2024-01-05,12abc34,Bus\n', 'Line 2: Invalid amount'),
+                              (b'05-01-2024,10,Bus\n', 'Line 2: invalid date')):
+            with self.assertRaisesMessage(StatementError, message):
+                list(parse_statement(io.BytesIO(b'date,amount,description\n' + body)))
+        with self.assertRaisesMessage(StatementError, 'Missing CSV column(s): amount'):
+            list(parse_statement(io.BytesIO(b'date,description\n')))
+
+    def test_ofx_in_sgml_and_xml(self):
+        sgml = (b'OFXHEADER:100\n<OFX><BANKTRANLIST>\n<STMTTRN>\n<TRNTYPE>DEBIT\n'
+                b'<DTPOSTED>20240105120000\n<TRNAMT>-45.10\n<NAME>METRO\n<MEMO>Card 12\n'
+                b'</STMTTRN>\n</BANKTRANLIST></OFX>\n')
+        xml = (b'<OFX><STMTTRN><DTPOSTED>20240106</DTPOSTED><TRNAMT>300.00</TRNAMT>'
+               b'<NAME>Refund</NAME></STMTTRN></OFX>')
+        self.assertEqual(list(parse_statement(io.BytesIO(sgml), 'ofx')),
+                         [StatementRow(date(2024, 1, 5), Decimal('-45.10'), 'METRO Card 12')])
+        self.assertEqual(list(parse_statement(io.BytesIO(xml), 'ofx')),
+                         [StatementRow(date(2024, 1, 6), Decimal('300.00'), 'Refund')])
+        with self.assertRaisesMessage(StatementError, 'Incomplete OFX transaction'):
+            list(parse_statement(io.BytesIO(b'<STMTTRN><NAME>x</STMTTRN>'), 'ofx'))
+
+    def test_debit_sign_and_duplicates(self):
+        day = date(2024, 1, 5)
+        Expense.objects.create(category=self.category, date=day, add_by=self.user,
+                               description='Rent', amount=500)
+        rows = [StatementRow(day, Decimal('-500'), '  RENT '),   # Already there
+                StatementRow(day, Decimal('-20'), 'Tea'),
+                StatementRow(day, Decimal('-20'), 'tea'),        # Earlier in the file
+                StatementRow(day, Decimal('1000'), 'Salary'),    # Not spending
+                StatementRow(day, Decimal('0'), 'Fee waived')]
+        result = import_statement(self.user, rows, self.category, debit_sign='negative',
+                                  batch_size=2)
+        self.assertEqual(result._asdict(), {'created': 1, 'duplicates': 2, 'skipped': 2})
+        self.assertEqual(Expense.objects.get(description='Tea').amount, 20)
+
+        result = import_statement(self.user, rows, self.category, debit_sign='positive')
+        self.assertEqual(result._asdict(), {'created': 1, 'duplicates': 0, 'skipped': 4})
+        result = import_statement(self.user, rows, self.category)
+        self.assertEqual(result._asdict(), {'created': 0, 'duplicates': 4, 'skipped': 1})
+        self.assertEqual(CycleRollup.objects.get(user=self.user).total, 1520)
+
+    def test_amounts_are_rounded_to_cents_before_they_count(self):
+        day = date(2024, 2, 5)
+        rows = [StatementRow(day, Decimal('10.005'), 'Tea'),
+                StatementRow(day, Decimal('0.004'), 'Rounding'),  # Nothing once rounded
+                StatementRow(day, Decimal('2.339'), 'Bun')]
+        result = import_statement(self.user, rows, self.category)
+        self.assertEqual(result._asdict(), {'created': 2, 'duplicates': 0, 'skipped': 1})
+        stored = Expense.objects.filter(add_by=self.user).aggregate(total=Sum('amount'))
+        self.assertEqual(stored['total'], Decimal('12.34'))
+        self.assertEqual(CycleRollup.objects.get(user=self.user).total, stored['total'])
+
+
+class ExportTests(TestCase):
+    """ ✅ Exports stream the user's own rows, oldest first, in every format """
+
+    def setUp(self):
+        self.user = User.objects.create_user('nila', password='x')
+        food = Category.objects.create(name='Food & drink', user=self.user)
+        for day, amount, description in ((3, '12.50', 'Tea, "masala"'), (1, '200', 'Lunch'),
+                                         (20, '7', '<b>Snack</b>')):
+            Expense.objects.create(category=food, date=date(2024, 2, day), add_by=self.user,
+                                   description=description, amount=Decimal(amount))
+        Income.objects.create(source='Salary', date=date(2024, 2, 1), add_by=self.user,
+                              amount=1000)
+        other = User.objects.create_user('other')
+        Expense.objects.create(category=Category.objects.create(name='X', user=other),
+                               date=date(2024, 2, 2), add_by=other, description='Not mine',
+                               amount=1)
+        self.client.force_login(self.user)
+
+    def export(self, path, **params):
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_csv_and_json_rows_and_filters(self):
+        rows = list(csv.reader(io.StringIO(self.export('/export/expenses.csv').decode())))
+        self.assertEqual(rows[0], ['id', 'date', 'category', 'description', 'amount', 'currency'])
+        self.assertEqual([row[1:5] for row in rows[1:]], [
+            ['2024-02-01', 'Food & drink', 'Lunch', '200.00'],
+            ['2024-02-03', 'Food & drink', 'Tea, "masala"', '12.50'],
+            ['2024-02-20', 'Food & drink', '<b>Snack</b>', '7.00']])
+
+        data = json.loads(self.export('/export/expenses.json', start='2024-02-02',
+                                      end='2024-02-19'))
+        self.assertEqual([(row['date'], row['amount']) for row in data],
+                         [('2024-02-03', '12.50')])
+        self.assertEqual(json.loads(self.export('/export/incomes.json'))[0]['source'], 'Salary')
+        self.assertEqual(json.loads(self.export('/export/expenses.json', end='2023-01-01')), [])
+        for cycle in ('x', '-1'):
+            self.assertEqual(self.client.get('/export/expenses.csv', {'cycle': cycle}).status_code,
+                             400)
+        self.assertEqual(self.client.get('/export/budgets.csv').status_code, 404)
+
+    def test_xlsx_is_a_workbook_with_one_row_per_expense(self):
+        workbook = zipfile.ZipFile(io.BytesIO(self.export('/export/expenses.xlsx')))
+        self.assertIsNone(workbook.testzip())
+        for part in ('[Content_Types].xml', '_rels/.rels', 'xl/workbook.xml',
+                     'xl/_rels/workbook.xml.rels'):
+            ElementTree.fromstring(workbook.read(part))
+        sheet = ElementTree.fromstring(workbook.read('xl/worksheets/sheet1.xml'))
+        ns = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        rows = [[cell.findtext('s:v', namespaces=ns) or cell.findtext('s:is/s:t', namespaces=ns)
+                 for cell in row.findall('s:c', ns)]
+                for row in sheet.findall('s:sheetData/s:row', ns)]
+        self.assertEqual(rows[0], ['id', 'date', 'category', 'description', 'amount', 'currency'])
+        self.assertEqual([row[2:5] for row in rows[1:]], [
+            ['Food & drink', 'Lunch', '200.00'],
+            ['Food & drink', 'Tea, "masala"', '12.50'],
+            ['Food & drink', '<b>Snack</b>', '7.00']])
+        # Numbers are numeric cells, text is inline strings
+        amount = sheet.findall('s:sheetData/s:row', ns)[1].findall('s:c', ns)[4]
+        self.assertIsNone(amount.get('t'))
+
+    def test_formulas_and_control_characters_are_defused(self):
+        food = Category.objects.get(name='Food & drink')
+        for description in ('=HYPERLINK("http://x")', '+1', '-2+3', '@SUM(A1)',
+                            'Bell\x07 tab\x0b'):
+            Expense.objects.create(category=food, date=date(2024, 3, 1), add_by=self.user,
+                                   description=description, amount=1)
+        rows = list(csv.reader(io.StringIO(self.export('/export/expenses.csv',
+                                                       start='2024-03-01').decode())))
+        self.assertEqual([row[3] for row in rows[1:]], [
+            '\'=HYPERLINK("http://x")', "'+1", "'-2+3", "'@SUM(A1)", 'Bell\x07 tab\x0b'])
+
+        workbook = zipfile.ZipFile(io.BytesIO(self.export('/export/expenses.xlsx',
+                                                          start='2024-03-01')))
+        sheet = ElementTree.fromstring(workbook.read('xl/worksheets/sheet1.xml'))
+        self.assertIn('Bell tab', ElementTree.tostring(sheet, encoding='unicode'))
+
+
+class SnapshotTests(TestCase):
+    """ ✅ Snapshots store each distinct chunk once and rebuild byte for byte """
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name) / 'snapshots'
+        self.source = Path(tmp.name) / 'live.sqlite3'
+        with sqlite3.connect(self.source) as db:
+            db.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, body TEXT)")
+            db.executemany("INSERT INTO t (body) VALUES (?)", [('x' * 500,)] * 400)
+        db.close()
+
+    def take(self):
+        return snapshots.take_snapshot(self.root, source_path=self.source, chunk_pages=4)
+
+    def test_take_materialize_restore_and_prune(self):
+        first, second = self.take(), self.take()
+        # Same second, same content: two snapshots, no new chunks
+        self.assertNotEqual(first['name'], second['name'])
+        self.assertEqual(second['new_chunks'], 0)
+        with sqlite3.connect(self.source) as db:
+            db.execute("UPDATE t SET body = 'changed' WHERE id = 1")
+        db.close()
+        third = self.take()
+        self.assertLess(third['new_chunks'], len(third['chunks']))
+        self.assertEqual(snapshots.list_manifests(self.root)[0], third['name'])
+
+        copy = snapshots.materialize(first['name'], self.root.parent / 'first.sqlite3', self.root)
+        self.assertEqual(hashlib.sha256(copy.read_bytes()).hexdigest(), first['sha256'])
+        snapshots.restore_snapshot(first['name'], str(self.source), self.root,
+                                   keep_safety_copy=False)
+        with sqlite3.connect(self.source) as db:
+            self.assertEqual(db.execute("SELECT body FROM t WHERE id = 1").fetchone()[0],
+                             'x' * 500)
+        db.close()
+
+        self.assertEqual(snapshots.prune_snapshots(self.root, keep_last=1, keep_daily=0),
+                         (2, third['new_chunks']))
+        snapshots.materialize(third['name'], self.root.parent / 'third.sqlite3', self.root)
+        with self.assertRaises(snapshots.SnapshotError):
+            snapshots.materialize(first['name'], self.root.parent / 'gone.sqlite3', self.root)
+
+    def test_prune_waits_for_a_snapshot_being_taken(self):
+        self.take()
+        pruned = threading.Event()
+        with snapshots._locked(self.root, exclusive=False):
+            thread = threading.Thread(target=lambda: (
+                snapshots.prune_snapshots(self.root, keep_last=0, keep_daily=0), pruned.set()))
+            thread.start()
+            self.assertFalse(pruned.wait(0.2))
+        thread.join(5)
+        self.assertTrue(pruned.is_set())
+        self.assertEqual(snapshots.list_manifests(self.root), [])
+
+
+class RequestMetricsTests(TestCase):
+    """ ✅ The instrumentation middleware aggregates per URL name """
+
+    def setUp(self):
+        registry.reset()
+        self.user = User.objects.create_superuser('metrics', password='x')
+        category = Category.objects.create(name='Metrics', user=self.user)
+        for amount in range(3):
+            Expense.objects.create(category=category, date=date.today(),
+                                   add_by=self.user, amount=amount)
+        self.client.force_login(self.user)
+
+    def test_requests_are_recorded_per_route(self):
+        self.client.get('/expenses/')
+        self.client.get('/expenses/')
+        stats = registry.snapshot()['expense_list']
+        self.assertEqual(stats['requests'], 2)
+        self.assertGreater(stats['queries_sum'], 0)
+
+    def test_prometheus_and_json_dumps(self):
+        self.client.get('/expenses/')
+        text = self.client.get('/metrics/').content.decode()
+        self.assertIn('selavu_request_duration_ms_count{route="expense_list"} 1', text)
+        self.assertIn('expense_list', self.client.get('/metrics/', {'format': 'json'}).json())
+
+    def test_metrics_need_staff(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/metrics/').status_code, 302)
+
+
+class DashboardCacheTests(TestCase):
+    """ ✅ Dashboard aggregates come from cache until the ledger changes """
+
+    def setUp(self):
+        _cache().clear()
+        self.user = User.objects.create_user('cached', password='x')
+        self.category = Category.objects.create(name='Cached', user=self.user)
+        self.today = date.today()
+        Expense.objects.create(category=self.category, date=self.today,
+                               add_by=self.user, amount=Decimal('10.00'))
+
+    def rollup_queries(self):
+        with CaptureQueriesContext(connection) as captured:
+            data = get_dashboard_data_for_user(self.user)
+        return data, [q for q in captured.captured_queries if 'selavu_cyclerollup' in q['sql']]
+
+    def test_repeat_reads_skip_aggregates(self):
+        data, queries = self.rollup_queries()
+        self.assertEqual(data['total_expense'], Decimal('10.00'))
+        self.assertTrue(queries)
+        data, queries = self.rollup_queries()
+        self.assertEqual(data['total_expense'], Decimal('10.00'))
+        self.assertEqual(queries, [])
+
+    def test_writes_invalidate(self):
+        self.rollup_queries()
+        expense = Expense.objects.create(category=self.category, date=self.today,
+                                         add_by=self.user, amount=Decimal('5.00'))
+        self.assertEqual(self.rollup_queries()[0]['total_expense'], Decimal('15.00'))
+        expense.delete()
+        self.assertEqual(self.rollup_queries()[0]['total_expense'], Decimal('10.00'))
+
+
+class TrendApiTests(TestCase):
+    """ ✅ Trend series come from one rollup query regardless of N """
+
+    def setUp(self):
+        _cache().clear()
+        self.user = User.objects.create_user('trends', password='x')
+        self.food = Category.objects.create(name='Trend food', user=self.user)
+        for n, amount in ((0, '30.00'), (1, '20.00'), (2, '10.00')):
+            day = user_cycle_back(self.user, n).start
+            Expense.objects.create(category=self.food, date=day, add_by=self.user,
+                                   amount=Decimal(amount))
+            Income.objects.create(source='Salary', date=day, add_by=self.user,
+                                  amount=Decimal('100.00'))
+        self.client.force_login(self.user)
+
+    def test_series(self):
+        with CaptureQueriesContext(connection) as captured:
+            data = self.client.get('/api/trends/', {'cycles': 4, 'window': 2}).json()
+        rollup_reads = [q for q in captured.captured_queries if 'selavu_cyclerollup' in q['sql']]
+        self.assertEqual(len(rollup_reads), 1)
+        self.assertEqual(len(data['cycles']), 4)
+        self.assertEqual(data['expense'], [0.0, 10.0, 20.0, 30.0])
+        self.assertEqual(data['categories'], [{'id': self.food.pk, 'name': 'Trend food',
+                                                'values': [0.0, 10.0, 20.0, 30.0]}])
+        self.assertEqual(data['savings_rate'], [None, 90.0, 80.0, 70.0])
+        self.assertEqual(data['moving_average']['expense'], [0.0, 5.0, 15.0, 25.0])
+
+    def test_categories_with_the_same_name_stay_apart(self):
+        home = Workspace.objects.create(name='Home')
+        Membership.objects.create(user=self.user, workspace=home)
+        shared = Category.objects.create(name='Trend food', user=self.user, workspace=home)
+        Expense.objects.create(category=shared, date=date.today(), add_by=self.user,
+                               amount=Decimal('5.00'))
+        series = self.client.get('/api/trends/', {'cycles': 1}).json()['categories']
+        self.assertEqual([(c['id'], c['name'], c['values']) for c in series], [
+            (self.food.pk, 'Trend food', [30.0]), (shared.pk, 'Trend food', [5.0])])
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get('/api/trends/', {'cycles': 'x'}).status_code, 400)
+
+
+@override_settings(SELAVU_NOTIFIER='selavu.notifiers.MemoryNotifier')
+class BudgetTests(TestCase):
+    """ ✅ Budgets are checked against the running rollup total on every save """
+
+    def setUp(self):
+        _cache().clear()
+        MemoryNotifier.outbox = []
+        self.user = User.objects.create_user('budget', password='x')
+        self.category = Category.objects.create(name='Budgeted', user=self.user)
+        self.cycle = current_cycle(self.user)
+        Budget.objects.create(user=self.user, category=self.category, amount=Decimal('100'))
+
+    def spend(self, amount):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Expense.objects.create(category=self.category, date=self.cycle.start,
+                                          add_by=self.user, amount=Decimal(amount))
+
+    def test_alerts_on_crossing_thresholds_once(self):
+        self.spend('50')
+        self.assertEqual(MemoryNotifier.outbox, [])
+        self.spend('35')
+        self.spend('5')
+        self.assertEqual([a.level for a in MemoryNotifier.outbox], [BudgetAlert.WARNING])
+        self.spend('20')
+        self.spend('20')
+        self.assertEqual([a.level for a in MemoryNotifier.outbox],
+                         [BudgetAlert.WARNING, BudgetAlert.OVER])
+        self.assertEqual(MemoryNotifier.outbox[-1].spent, Decimal('110'))
+
+    def test_status_follows_edits_and_cycle_override(self):
+        expense = self.spend('120')
+        self.assertTrue(budget_status(self.user)[self.category.pk].over)
+        expense.amount = Decimal('60')
+        expense.save()
+        self.assertFalse(budget_status(self.user)[self.category.pk].over)
+        Budget.objects.create(user=self.user, category=self.category,
+                              cycle_start=self.cycle.start, amount=Decimal('50'))
+        status = budget_status(self.user)[self.category.pk]
+        self.assertEqual((status.budget, status.over), (Decimal('50'), True))
+
+
+class RecurringTransactionTests(TestCase):
+    """ ✅ The scheduler writes each occurrence exactly once """
+
+    def setUp(self):
+        self.user = User.objects.create_user('recurring', password='x')
+        self.rent = Category.objects.create(name='Recurring rent', user=self.user)
+
+    def test_monthly_occurrences_clip_and_never_repeat(self):
+        template = RecurringTransaction.objects.create(
+            user=self.user, category=self.rent, amount=Decimal('1000'),
+            frequency=RecurringTransaction.MONTHLY, day=31, start_date=date(2025, 1, 5))
+        result = materialize_due(today=date(2025, 4, 29))
+        self.assertEqual(result.expenses, 3)
+        self.assertEqual(
+            list(template.expenses.order_by('date').values_list('date', flat=True)),
+            [date(2025, 1, 31), date(2025, 2, 28), date(2025, 3, 31)])
+
+        self.assertEqual(materialize_due(today=date(2025, 4, 29)).expenses, 0)
+        template.refresh_from_db()
+        self.assertEqual(template.next_due, date(2025, 4, 30))
+        self.assertEqual(materialize_due(today=date(2025, 4, 30)).expenses, 1)
+        self.assertEqual(materialize_due(today=date(2025, 5, 1)).expenses, 0)
+        self.assertEqual(template.expenses.count(), 4)
+        self.assertEqual(
+            CycleRollup.objects.filter(user=self.user).aggregate(Sum('total'))['total__sum'],
+            Decimal('4000'))
+
+    def test_cycle_income_stops_at_end_date(self):
+        template = RecurringTransaction.objects.create(
+            user=self.user, kind=CycleRollup.INCOME, source='Salary', amount=Decimal('50000'),
+            frequency=RecurringTransaction.CYCLE, day=1, start_date=date(2025, 1, 1),
+            end_date=date(2025, 3, 31))
+        result = materialize_due(today=date(2025, 6, 30))
+        template.refresh_from_db()
+        self.assertEqual(result.incomes, 3)
+        self.assertEqual(
+            list(template.incomes.order_by('date').values_list('date', flat=True)),
+            [date(2025, 1, 27), date(2025, 2, 27), date(2025, 3, 27)])
+        self.assertFalse(template.active)
+
+
+class FullTextSearchTests(TestCase):
+    """ ✅ The FTS5 index follows every write and ranks matches """
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('searcher', password='x')
+        self.category = Category.objects.create(name='Search', user=self.user)
+        self.today = date.today()
+
+    def expense(self, description):
+        return Expense.objects.create(category=self.category, date=self.today,
+                                      add_by=self.user, description=description, amount=1)
+
+    def found(self, text):
+        return list(rank(Expense.objects.all(), text).values_list('description', flat=True))
+
+    def test_match_query_is_safe(self):
+        self.assertEqual(match_query('swig "AND" OR*'), '"swig"* "AND"* "OR"*')
+        self.assertIsNone(match_query(' -- '))
+
+    def test_index_follows_writes(self):
+        dinner = self.expense('Swiggy dinner')
+        Expense.objects.bulk_create([Expense(
+            category=self.category, date=self.today, add_by=self.user,
+            description='Swiggy lunch', amount=1)])
+        self.assertEqual(sorted(self.found('swig')), ['Swiggy dinner', 'Swiggy lunch'])
+        self.assertEqual(search(Expense.objects.all(), 'lunch').count(), 1)
+        dinner.description = 'Zomato dinner'
+        dinner.save()
+        self.assertEqual(self.found('dinner'), ['Zomato dinner'])
+        dinner.delete()
+        self.assertEqual(self.found('dinner'), [])
+
+    def test_ranking_and_views(self):
+        self.expense('Groceries and a little fuel for the weekend trip')
+        self.expense('Fuel top-up, fuel can')
+        self.expense('Groceries')
+        self.assertEqual(self.found('fuel'), [
+            'Fuel top-up, fuel can', 'Groceries and a little fuel for the weekend trip'])
+
+        self.client.force_login(self.user)
+        response = self.client.get('/expenses/', {'q': 'fuel'})
+        self.assertEqual([e.description for e in response.context['expenses']], [
+            'Fuel top-up, fuel can', 'Groceries and a little fuel for the weekend trip'])
+        response = self.client.get('/admin/selavu/expense/', {'q': 'groc'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+    def test_missing_triggers_are_restored(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER selavu_expense_fts_insert")
+        self.expense('Written while the trigger was gone')
+        self.assertEqual(ensure_search_indexes(), ['selavu_expense'])
+        self.assertEqual(self.found('trigger'), ['Written while the trigger was gone'])
+
+
+class MobileApiTests(TestCase):
+    """ ✅ The async JSON API: auth, pages, writes and conditional GETs """
+
+    def setUp(self):
+        _cache().clear()
+        self.user = User.objects.create_user('mobile', password='x')
+        self.category = Category.objects.create(name='Travel', user=self.user)
+        other = User.objects.create_user('other', password='x')
+        self.foreign = Category.objects.create(name='Foreign', user=other)
+        today = date.today()
+        Expense.objects.bulk_create([Expense(
+            category=self.category, date=today - timedelta(days=i), add_by=self.user,
+            description=f'Cab {i}', amount=10) for i in range(60)])
+        self.client.force_login(self.user)
+
+    def test_requires_login(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/api/v1/expenses/').status_code, 401)
+
+    def test_list_detail_and_categories(self):
+        page = self.client.get('/api/v1/expenses/').json()
+        self.assertEqual(len(page['results']), 50)
+        self.assertEqual(page['results'][0]['description'], 'Cab 0')
+        rest = self.client.get('/api/v1/expenses/', {'after': page['next']}).json()
+        self.assertEqual(len(rest['results']), 10)
+        self.assertIsNone(rest['next'])
+        self.assertEqual(len(self.client.get(
+            '/api/v1/expenses/', {'q': 'cab', 'end': str(date.today() - timedelta(days=58))}
+        ).json()['results']), 2)
+
+        first = page['results'][0]
+        detail = self.client.get(f"/api/v1/expenses/{first['id']}/").json()
+        self.assertEqual(detail['category'], {'id': self.category.pk, 'name': 'Travel'})
+        self.assertEqual(self.client.get('/api/v1/expenses/999999/').status_code, 404)
+        self.assertEqual(self.client.get('/api/v1/categories/').json()['results'],
+                         [{'id': self.category.pk, 'name': 'Travel'}])
+        self.assertEqual(self.client.get('/api/v1/dashboard/').status_code, 200)
+
+    def test_create_validates_and_scopes_category(self):
+        body = {'category': self.category.pk, 'date': str(date.today()),
+                'description': 'Train', 'amount': '42.50'}
+        response = self.client.post('/api/v1/expenses/', body, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['amount'], '42.50')
+        self.assertTrue(Expense.objects.filter(add_by=self.user, description='Train').exists())
+
+        response = self.client.post('/api/v1/expenses/', dict(body, category=self.foreign.pk),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('category', response.json()['errors'])
+
+    def test_bad_filters_and_bodies_are_400s(self):
+        for params in ({'start': '2025-02-30'}, {'end': 'soon'},
+                       {'category': '99999999999999999999'}, {'category': '-1'}):
+            self.assertEqual(self.client.get('/api/v1/expenses/', params).status_code, 400)
+        for body in ('"Train"', '42', 'null', '[{"amount": "1"}, 7]'):
+            response = self.client.post('/api/v1/expenses/', body,
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['error'],
+                             "Body must be an object or a list of objects")
+
+    def test_conditional_get_until_the_ledger_changes(self):
+        response = self.client.get('/api/v1/expenses/')
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+        # Session and user only; the ledger is never read
+        with self.assertNumQueries(2):
+            cached = self.client.get('/api/v1/expenses/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+
+        Expense.objects.create(category=self.category, date=date.today(), add_by=self.user,
+                               description='Bus', amount=5)
+        response = self.client.get('/api/v1/expenses/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # Writes skip the validators: no ETag, and If-None-Match can't turn them into a 412
+        response = self.client.post('/api/v1/expenses/', {
+            'category': self.category.pk, 'date': str(date.today()), 'description': 'Tram',
+            'amount': '3'}, content_type='application/json', HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class BulkOperationTests(TestCase):
+    """ ✅ Batch entry and bulk edits leave the rollups as a full rebuild would """
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('bulk', password='x')
+        self.food = Category.objects.create(name='Food', user=self.user)
+        self.fuel = Category.objects.create(name='Fuel', user=self.user)
+        self.today = date.today()
+        self.client.force_login(self.user)
+
+    def rollup_rows(self):
+        return sorted(CycleRollup.objects.filter(user=self.user, count__gt=0).values_list(
+            'cycle_start', 'kind', 'category_id', 'total', 'count'))
+
+    def assertRollupsConsistent(self):
+        kept = self.rollup_rows()
+        rollups.rebuild(users=[self.user])
+        self.assertEqual(kept, self.rollup_rows())
+
+    def line(self, index, **values):
+        row = {'category': self.food.pk, 'date': str(self.today),
+               'description': f'Line {index}', 'amount': '10'}
+        row.update(values)
+        return {f'form-{index}-{name}': value for name, value in row.items()}
+
+    def post_lines(self, *lines):
+        data = {'form-TOTAL_FORMS': len(lines), 'form-INITIAL_FORMS': 0}
+        for line in lines:
+            data.update(line)
+        return self.client.post('/add-expenses/', data)
+
+    def test_formset_saves_every_line_or_none(self):
+        other = Category.objects.create(name='Theirs', user=User.objects.create_user('x'))
+        response = self.post_lines(self.line(0), self.line(1, amount='abc'),
+                                   self.line(2, category=other.pk))
+        self.assertEqual(response.status_code, 200)
+        errors = response.context['formset'].errors
+        self.assertEqual([sorted(e) for e in errors], [[], ['amount'], ['category']])
+        self.assertFalse(Expense.objects.exists())
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post_lines(*[self.line(i) for i in range(15)])
+        # ✅ Lines are validated one by one, but written with a single INSERT
+        self.assertEqual(len([q for q in queries if q['sql'].startswith(
+            'INSERT INTO "selavu_expense"')]), 1)
+        self.assertRedirects(response, '/expenses/', fetch_redirect_response=False)
+        self.assertEqual(Expense.objects.filter(add_by=self.user).count(), 15)
+        self.assertRollupsConsistent()
+
+    def test_api_accepts_a_list(self):
+        rows = [{'category': self.food.pk, 'date': str(self.today), 'description': 'Tea',
+                 'amount': '2'}] * 3
+        response = self.client.post('/api/v1/expenses/', rows + [{'amount': '1'}],
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()['errors']), ['3'])
+        response = self.client.post('/api/v1/expenses/', rows, content_type='application/json')
+        self.assertEqual(len(response.json()['results']), 3)
+        self.assertRollupsConsistent()
+
+    def test_bulk_edits_and_admin_actions(self):
+        Expense.objects.bulk_create([Expense(
+            category=self.food, date=self.today, add_by=self.user,
+            description=f'Meal {i}', amount=5) for i in range(40)])
+        rollups.rebuild(users=[self.user])
+        expenses = Expense.objects.filter(add_by=self.user)
+
+        self.assertEqual(bulk.recategorize(expenses.filter(description__endswith='1'),
+                                           self.fuel), 4)
+        self.assertEqual(bulk.redate(expenses.filter(description__endswith='2'),
+                                     self.today - timedelta(days=62)), 4)
+        self.assertRollupsConsistent()
+
+        # The bulk-edit form offers only the user's own categories
+        Category.objects.create(name='Theirs', user=User.objects.create_user('x'))
+        response = self.client.get('/admin/selavu/expense/')
+        self.assertEqual(set(response.context['action_form'].fields['category'].queryset),
+                         {self.food, self.fuel})
+        self.assertNotContains(response, 'Theirs')
+
+        # The admin list only shows the current cycle
+        ids = list(expenses.filter(category=self.food, date=self.today).values_list(
+            'pk', flat=True)[:10])
+        self.client.post('/admin/selavu/expense/', {
+            'action': 'recategorize_selected', '_selected_action': ids[:5],
+            'category': self.fuel.pk})
+        self.assertEqual(expenses.filter(category=self.fuel).count(), 9)
+        self.client.post('/admin/selavu/expense/', {
+            'action': 'delete_selected', '_selected_action': ids, 'post': 'yes'})
+        self.assertEqual(expenses.count(), 30)
+        self.assertRollupsConsistent()
+
+
+class CategoryClassifierTests(TestCase):
+    """ ✅ Rules in priority order, then the model learned from the user's history """
+
+    def setUp(self):
+        _cache().clear()
+        _classifiers.clear()
+        self.user = User.objects.create_user('classy', password='x')
+        self.food = Category.objects.create(name='Food', user=self.user)
+        self.travel = Category.objects.create(name='Travel', user=self.user)
+        self.other = Category.objects.create(name='Other', user=self.user)
+        history = [('Swiggy order', self.food, 250), ('Zomato dinner', self.food, 600),
+                   ('Swiggy instamart', self.food, 300), ('Uber trip', self.travel, 180),
+                   ('Ola cab airport', self.travel, 900), ('Uber cab', self.travel, 220)]
+        Expense.objects.bulk_create([Expense(
+            category=category, date=date.today(), add_by=self.user,
+            description=description, amount=amount) for description, category, amount in history])
+
+    def test_rules_keep_their_priority_in_one_regex(self):
+        matcher = RuleMatcher([('eats', False, 1), ('uber', False, 2), (r'fuel|petrol', True, 3)])
+        self.assertIsNotNone(matcher.regex)
+        self.assertEqual(matcher.match('UBER EATS order'), 1)
+        self.assertEqual(matcher.match('uber trip'), 2)
+        self.assertEqual(matcher.match('HP Petrol pump'), 3)
+        self.assertIsNone(matcher.match('rent'))
+        # Backreferences can't be merged; those rules are tried one by one
+        matcher = RuleMatcher([(r'(ab)\1', True, 1), ('uber', False, 2)])
+        self.assertIsNone(matcher.regex)
+        self.assertEqual(matcher.match('xabab'), 1)
+
+    def test_model_learns_incrementally_and_retrains_after_edits(self):
+        classifier = classifier_for(self.user)
+        suggestion = classifier.suggest('SWIGGY 88213 order', 280)
+        self.assertEqual((suggestion.category_id, suggestion.source), (self.food.pk, 'model'))
+        self.assertIsNone(classifier.suggest('Electricity bill'))
+
+        Expense.objects.create(category=self.other, date=date.today(), add_by=self.user,
+                               description='Electricity bill', amount=1200)
+        Expense.objects.create(category=self.other, date=date.today(), add_by=self.user,
+                               description='Electricity bill', amount=1100)
+        self.assertIs(classifier_for(self.user), classifier)
+        with self.assertNumQueries(0):
+            self.assertEqual(classifier_for(self.user).suggest(
+                'Electricity bill', 1000).category_id, self.other.pk)
+
+        CategoryRule.objects.create(user=self.user, category=self.travel, pattern='electricity')
+        retrained = classifier_for(self.user)
+        self.assertIsNot(retrained, classifier)
+        self.assertEqual(retrained.suggest('Electricity bill').source, 'rule')
+
+    def test_import_and_api_assign_categories(self):
+        rows = [StatementRow(date.today(), Decimal('-320'), 'SWIGGY*ORDER 1234'),
+                StatementRow(date.today(), Decimal('-150'), 'UBER *TRIP'),
+                StatementRow(date.today(), Decimal('-99'), 'Misc thing')]
+        import_statement(self.user, rows, self.other, debit_sign='negative')
+        self.assertEqual(dict(Expense.objects.filter(description__in=[
+            r.description for r in rows]).values_list('description', 'category__name')), {
+            'SWIGGY*ORDER 1234': 'Food', 'UBER *TRIP': 'Travel', 'Misc thing': 'Other'})
+
+        self.client.force_login(self.user)
+        response = self.client.get('/api/v1/expenses/suggest/', {'description': 'ola cab'})
+        self.assertEqual(response.json()['category'], {'id': self.travel.pk, 'name': 'Travel'})
+        response = self.client.post('/api/v1/expenses/', {
+            'date': str(date.today()), 'description': 'Zomato lunch', 'amount': '300'},
+            content_type='application/json')
+        self.assertEqual(response.json()['category']['name'], 'Food')
+        response = self.client.post('/api/v1/expenses/', {
+            'date': str(date.today()), 'description': 'Unknown', 'amount': '3'},
+            content_type='application/json')
+        self.assertIn('category', response.json()['errors'])
+
+
+@override_settings(SELAVU_DEFAULT_CURRENCY='INR', SELAVU_BASE_CURRENCY='INR')
+class MultiCurrencyTests(TestCase):
+    """ ✅ Rows keep their own currency; rollups add up in the owner's home currency """
+
+    def setUp(self):
+        self.user = User.objects.create_user('traveller', password='x')
+        self.food = Category.objects.create(name='Food', user=self.user)
+        self.today = date.today()
+        load_rates(parse_rates(io.StringIO(
+            "date,currency,rate\n"
+            f"{self.today - timedelta(days=400)},USD,80\n"
+            f"{self.today - timedelta(days=400)},EUR,90\n"
+            f"{self.today},USD,83.3333\n")))
+
+    def expense(self, amount, currency, day=None):
+        return Expense.objects.create(category=self.food, date=day or self.today,
+                                      add_by=self.user, description='Meal', amount=amount,
+                                      currency=currency)
+
+    def food_total(self):
+        return CycleRollup.objects.filter(user=self.user, category=self.food).aggregate(
+            total=Sum('total'))['total']
+
+    def assertRollupsConsistent(self):
+        def rows():
+            return sorted(CycleRollup.objects.filter(user=self.user, count__gt=0).values_list(
+                'cycle_start', 'kind', 'category_id', 'total', 'count'))
+        kept = rows()
+        rollups.rebuild(users=[self.user])
+        self.assertEqual(kept, rows())
+
+    def test_rollups_convert_at_the_rate_of_the_day(self):
+        self.expense(100, 'INR')
+        self.expense('10.01', 'USD')
+        self.expense('10.01', 'USD')
+        # An older row uses the rate in force on its date
+        self.expense(1, 'USD', self.today - timedelta(days=10))
+        self.assertEqual(self.food_total(), Decimal('100') + 2 * Decimal('834.17') + 80)
+        self.assertRollupsConsistent()
+
+        # Totals follow the home currency when it changes
+        Profile.objects.create(user=self.user, home_currency='EUR')
+        self.assertEqual(CycleRollup.objects.filter(user=self.user).aggregate(
+            total=Sum('total'))['total'], Decimal('1.11') + 2 * Decimal('9.27') + Decimal('0.89'))
+        self.assertRollupsConsistent()
+
+    def test_loading_rates_rebuilds_affected_users(self):
+        self.expense(10, 'USD')
+        untouched = User.objects.create_user('homebody')
+        Expense.objects.create(category=Category.objects.create(name='Snacks', user=untouched),
+                               date=self.today, add_by=untouched, description='Tea', amount=5)
+        written, rebuilt = load_rates([('USD', self.today, Decimal('85'))])
+        self.assertEqual((written, rebuilt), (1, 1))
+        self.assertEqual(ExchangeRate.objects.get(currency='USD', date=self.today).rate, 85)
+        self.assertEqual(self.food_total(), Decimal('850'))
+        with self.assertRaises(ValueError):
+            list(parse_rates(io.StringIO("date,currency,rate\n2025-01-01,USD,-1\n")))
+
+    def test_form_and_display(self):
+        form = ExpenseForm({'category': self.food.pk, 'date': str(self.today),
+                            'description': 'Fondue', 'amount': '20', 'currency': 'CHF'},
+                           user=self.user)
+        self.assertIn('currency', form.errors)
+        form = ExpenseForm({'category': self.food.pk, 'date': str(self.today),
+                            'description': 'Dosa', 'amount': '20'}, user=self.user)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data['currency'], 'INR')
+        self.assertEqual(money(Decimal('1234.5'), 'INR'), '₹1,234.50')
+        self.assertEqual(money(3, 'CHF'), 'CHF 3.00')
+
+
+class AuditLogTests(TestCase):
+    """ ✅ Every ledger change is logged, and any past moment can be replayed """
+
+    def setUp(self):
+        self.user = User.objects.create_user('auditor', password='x')
+        self.food = Category.objects.create(name='Food', user=self.user)
+        self.fuel = Category.objects.create(name='Fuel', user=self.user)
+        self.today = date.today()
+        self.client.force_login(self.user)
+
+    def expense(self, amount, description='Meal'):
+        return Expense.objects.create(category=self.food, date=self.today, add_by=self.user,
+                                      description=description, amount=amount)
+
+    def rollup_totals(self):
+        return {(row.cycle_start, row.kind, row.category_id, row.source): (row.total, row.count)
+                for row in CycleRollup.objects.filter(user=self.user, count__gt=0)}
+
+    def test_edits_and_deletes_can_be_replayed(self):
+        meal = self.expense(100)
+        self.expense(40, 'Snack')
+        before_edit, totals_before_edit = timezone.now(), self.rollup_totals()
+
+        self.client.post(f'/edit-expense/{meal.pk}/', {
+            'category': self.fuel.pk, 'date': str(self.today), 'description': 'Diesel',
+            'amount': '250'})
+        after_edit = timezone.now()
+        self.assertEqual(self.client.get(f'/delete-expense/{meal.pk}/').status_code, 405)
+        self.client.post(f'/delete-expense/{meal.pk}/')
+
+        self.assertEqual(list(LedgerEvent.objects.filter(model='expense', object_id=meal.pk)
+                              .values_list('action', flat=True)), ['create', 'update', 'delete'])
+        past = ledger_as_of(self.user, before_edit)
+        self.assertEqual({(e.description, e.amount) for e in past['expense']},
+                         {('Meal', Decimal('100')), ('Snack', Decimal('40'))})
+        self.assertEqual(totals_as_of(self.user, before_edit), totals_before_edit)
+        self.assertEqual([e.category_id for e in ledger_as_of(self.user, after_edit)['expense']
+                          if e.pk == meal.pk], [self.fuel.pk])
+        self.assertEqual(totals_as_of(self.user, timezone.now()), self.rollup_totals())
+
+    @override_settings(SELAVU_AUDIT_CHECKPOINT_EVERY=5)
+    def test_checkpoints_bound_the_replay(self):
+        for i in range(12):
+            self.expense(i + 1, f'Line {i}')
+        # Two categories and twelve expenses: a checkpoint every five events
+        self.assertEqual(LedgerCheckpoint.objects.filter(user_id=self.user.pk).count(), 2)
+        with CaptureQueriesContext(connection) as queries:
+            state, last = replay(self.user.pk)
+        self.assertEqual(len(queries), 2)  # The checkpoint, then the events after it
+        self.assertEqual(last, LedgerEvent.objects.latest('pk'))
+        self.assertEqual(len(state['expense']), 12)
+
+        # Bulk edits and deletes are logged with one INSERT each
+        expenses = Expense.objects.filter(add_by=self.user)
+        bulk.recategorize(expenses.filter(amount__lte=6), self.fuel)
+        with CaptureQueriesContext(connection) as queries:
+            bulk.delete_many(expenses.filter(amount__gt=10))
+        self.assertEqual(len([q for q in queries if q['sql'].startswith(
+            'INSERT INTO "selavu_ledgerevent"')]), 1)
+        ledger = ledger_as_of(self.user, timezone.now())
+        moved = [e.amount for e in ledger['expense'] if e.category_id == self.fuel.pk]
+        self.assertEqual(sorted(moved), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(cycle_totals(ledger), self.rollup_totals())
+
+        event = LedgerEvent.objects.first()
+        with self.assertRaises(ValueError):
+            event.save()
+
+    @override_settings(SELAVU_AUDIT_CHECKPOINT_EVERY=5)
+    def test_most_writes_decide_on_checkpoints_without_a_query(self):
+        self.expense(1)
+        audit_queries = []
+        for i in range(8):
+            with CaptureQueriesContext(connection) as queries:
+                self.expense(i + 2)
+            audit_queries.append(len([q for q in queries if 'selavu_ledgercheckpoint' in q['sql']
+                                      or q['sql'].startswith('SELECT COUNT')]))
+        # Two categories and nine expenses: checkpoints at the fifth and tenth
+        # events, and only the writes taking them looked at the tables
+        self.assertEqual(list(LedgerCheckpoint.objects.filter(user_id=self.user.pk).values_list(
+            'last_event_id', flat=True)), list(LedgerEvent.objects.filter(
+            user_id=self.user.pk).order_by('pk').values_list('pk', flat=True))[4::5])
+        self.assertEqual([bool(n) for n in audit_queries],
+                         [False, True, False, False, False, False, True, False])
+
+
+class WorkspaceTests(TestCase):
+    """ ✅ Household members share rows; everyone else can't reach them """
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='x')
+        self.bob = User.objects.create_user('bob', password='x')
+        self.mallory = User.objects.create_user('mallory', password='x')
+        self.home = Workspace.objects.create(name='Home')
+        Membership.objects.create(user=self.alice, workspace=self.home, role=Membership.OWNER)
+        Membership.objects.create(user=self.bob, workspace=self.home)
+        self.groceries = Category.objects.create(name='Food', user=self.alice,
+                                                 workspace=self.home)
+        # Names are unique per workspace only
+        self.own = Category.objects.create(name='Food', user=self.mallory)
+        self.today = date.today()
+
+    def test_members_share_rows_and_others_get_404(self):
+        shared = Expense.objects.create(category=self.groceries, date=self.today,
+                                        add_by=self.alice, description='Veg', amount=300)
+        Expense.objects.create(category=self.own, date=self.today, add_by=self.mallory,
+                               description='Mine', amount=5)
+        self.assertEqual(shared.workspace, self.home)
+        self.assertEqual(list(Expense.objects.for_user(self.bob)), [shared])
+
+        self.client.force_login(self.bob)
+        self.assertEqual([e['id'] for e in self.client.get('/api/v1/expenses/').json()[
+            'results']], [shared.pk])
+        self.client.force_login(self.mallory)
+        self.assertEqual(self.client.get(f'/edit-expense/{shared.pk}/').status_code, 404)
+        self.assertEqual(self.client.post(f'/delete-expense/{shared.pk}/').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/v1/expenses/{shared.pk}/').status_code, 404)
+        self.assertTrue(Expense.objects.filter(pk=shared.pk).exists())
+
+        # Bob edits Alice's row; moving it to his own category moves it out of the household
+        self.client.force_login(self.bob)
+        response = self.client.post(f'/edit-expense/{shared.pk}/', {
+            'category': self.groceries.pk, 'date': str(self.today), 'description': 'Veg',
+            'amount': '320'})
+        self.assertEqual(response.status_code, 302)
+        mine = Category.objects.create(name='Personal', user=self.bob)
+        bulk.recategorize(Expense.objects.filter(pk=shared.pk), mine)
+        shared.refresh_from_db()
+        self.assertEqual((shared.amount, shared.workspace_id), (320, mine.workspace_id))
+        self.assertEqual(list(Expense.objects.for_user(self.alice)), [])
+
+    def test_member_writes_invalidate_and_dashboard_is_one_query(self):
+        self.client.force_login(self.bob)
+        etag = self.client.get('/api/v1/expenses/').headers['ETag']
+        Expense.objects.bulk_create([Expense(
+            category=self.groceries, date=self.today, add_by=user, description='Milk', amount=50)
+            for user in (self.alice, self.bob, self.alice)])
+        self.assertEqual(Expense.objects.for_workspace(self.home).count(), 3)
+        Expense.objects.create(category=self.groceries, date=self.today, add_by=self.alice,
+                               description='Rice', amount=100)
+        response = self.client.get('/api/v1/expenses/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        with CaptureQueriesContext(connection) as queries:
+            data = shared_dashboard(self.home, self.bob)
+        self.assertEqual(len([q for q in queries if '"selavu_expense"' in q['sql']]), 1)
+        self.assertEqual(data['total_expense'], 250)
+        self.assertEqual({m['username']: m['total'] for m in data['members']},
+                         {'alice': 200, 'bob': 50})
+        response = self.client.get(f'/api/v1/workspaces/{self.home.pk}/dashboard/')
+        self.assertEqual(response.json()['categories'][0]['name'], 'Food')
+        self.client.force_login(self.mallory)
+        response = self.client.get(f'/api/v1/workspaces/{self.home.pk}/dashboard/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_totals_count_every_members_rows_in_shared_categories(self):
+        _cache().clear()
+        own = Category.objects.create(name='Books', user=self.bob)
+        Budget.objects.create(user=self.bob, category=self.groceries, amount=400)
+        for user, amount in ((self.alice, 300), (self.bob, 200)):
+            Expense.objects.create(category=self.groceries, date=self.today, add_by=user,
+                                   description='Veg', amount=amount)
+        Expense.objects.create(category=own, date=self.today, add_by=self.bob,
+                               description='Novel', amount=25)
+        Income.objects.create(source='Salary', amount=1000, date=self.today,
+                              add_by=self.alice, workspace=self.home)
+
+        data = get_dashboard_data_for_user(self.bob)
+        self.assertEqual((data['total_expense'], data['total_income']), (525, 1000))
+        status = budget_status(self.bob)[self.groceries.pk]
+        self.assertEqual((status.spent, status.over), (500, True))
+        self.assertEqual(cycle_trends(self.bob, cycles=1)['categories'], [
+            {'id': own.pk, 'name': 'Books', 'values': [25.0]},
+            {'id': self.groceries.pk, 'name': 'Food', 'values': [500.0]}])
+
+        self.client.force_login(User.objects.create_superuser('root', password='x'))
+        Membership.objects.create(user=User.objects.get(username='root'), workspace=self.home)
+        response = self.client.get('/admin/selavu/category/')
+        totals = {c.name: c.cycle_total for c in response.context['cl'].result_list}
+        self.assertEqual(totals, {'Food': 500})
+
+        # Alice's view: the same shared total, and Bob's own category stays his
+        self.assertEqual(get_dashboard_data_for_user(self.alice)['total_expense'], 500)
+        Expense.objects.create(category=self.groceries, date=self.today, add_by=self.bob,
+                               description='Milk', amount=40)
+        self.assertEqual(get_dashboard_data_for_user(self.alice)['total_expense'], 540)
+
+    def test_import_command_looks_categories_up_in_the_users_workspaces(self):
+        with tempfile.NamedTemporaryFile('wb', suffix='.csv', delete=False) as f:
+            f.write(b'date,amount,description\n2024-01-05,120,Bus\n')
+        self.addCleanup(os.unlink, f.name)
+        call_command('import_statement', f.name, user='mallory', default_category='Food',
+                     stdout=io.StringIO())
+        self.assertEqual(Expense.objects.get().category, self.own)
+
+        # Bob sees two categories named Food: the household's and his own
+        mine = Category.objects.create(name='Food', user=self.bob)
+        with self.assertRaisesMessage(CommandError, 'pass its id'):
+            call_command('import_statement', f.name, user='bob', default_category='Food',
+                         stdout=io.StringIO())
+        with self.assertRaisesMessage(CommandError, 'Unknown category'):
+            call_command('import_statement', f.name, user='bob',
+                         default_category=str(self.own.pk), stdout=io.StringIO())
+        call_command('import_statement', f.name, user='bob', default_category=str(mine.pk),
+                     stdout=io.StringIO())
+        self.assertEqual(Expense.objects.filter(add_by=self.bob).get().category, mine)
+
+
+class AttachmentTests(TestCase):
+    """ ✅ Receipts are stored once per content, served in ranges, and private """
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        settings = override_settings(SELAVU_ATTACHMENT_DIR=self.root.name,
+                                     SELAVU_ATTACHMENT_WORKERS=0)
+        settings.enable()
+        self.addCleanup(self.root.cleanup)
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user('ravi', password='x')
+        self.category = Category.objects.create(name='Travel', user=self.user)
+        self.expense = Expense.objects.create(category=self.category, date=date.today(),
+                                              add_by=self.user, description='Taxi', amount=250)
+        self.pdf = b'%PDF-1.4 ' + bytes(range(256)) * 40
+        self.client.force_login(self.user)
+
+    def upload(self, expense, content, name='receipt.pdf'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(f'/expenses/{expense.pk}/attachments/', {
+                'file': SimpleUploadedFile(name, content, content_type='text/plain')})
+
+    def test_identical_uploads_share_one_blob(self):
+        other = Expense.objects.create(category=self.category, date=date.today(),
+                                       add_by=self.user, description='Train', amount=90)
+        self.assertEqual(self.upload(self.expense, self.pdf).status_code, 302)
+        self.assertEqual(self.upload(other, self.pdf, name='copy.pdf').status_code, 302)
+
+        blob = Blob.objects.get()
+        self.assertEqual(Attachment.objects.filter(blob=blob).count(), 2)
+        # The sniffed type wins over what the client claimed
+        self.assertEqual(blob.content_type, 'application/pdf')
+        self.assertIsNotNone(blob.processed_at)
+        self.assertEqual(blob_path(blob.digest).read_bytes(), self.pdf)
+        self.assertEqual(list((blob_path(blob.digest).parent).iterdir()),
+                         [blob_path(blob.digest)])
+
+        Attachment.objects.all().delete()
+        self.assertEqual(prune(), (1, 0))
+        self.assertFalse(blob_path(blob.digest).exists())
+
+    def test_reupload_survives_a_prune_of_the_same_bytes(self):
+        # The bytes are stored and orphaned; the upload finds them and
+        # drops its own copy, then prune runs before it is attached
+        digest, content_type, size = store_file(io.BytesIO(self.pdf))
+        Blob.objects.create(digest=digest, size=size, content_type=content_type)
+        writer = BlobWriter()
+        writer.write(self.pdf)
+        content = writer.reopen()  # As BlobUploadHandler does
+        upload = StoredUpload(writer.close(), 'r.pdf', content_type, size, file=content)
+        self.addCleanup(upload.close)
+        self.assertEqual(prune(), (1, 0))
+        self.assertFalse(blob_path(digest).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            attach(self.expense, self.user, digest, 'r.pdf', content_type, size, source=upload)
+        self.assertEqual(blob_path(digest).read_bytes(), self.pdf)
+        self.assertIsNotNone(Blob.objects.get(digest=digest).processed_at)
+
+    @override_settings(SELAVU_ATTACHMENT_MAX_BYTES=1024)
+    def test_oversized_upload_is_refused(self):
+        response = self.upload(self.expense, self.pdf)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Blob.objects.exists())
+        # The partial temp file went with it
+        self.assertEqual(list(Path(self.root.name, 'tmp').iterdir()), [])
+
+    def test_ranges_and_conditional_requests(self):
+        self.upload(self.expense, self.pdf)
+        attachment = Attachment.objects.get()
+        url = f'/attachments/{attachment.pk}/'
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.pdf)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('inline', response['Content-Disposition'])
+
+        response = self.client.get(url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.pdf[100:200])
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.pdf)}')
+        response = self.client.get(url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.pdf[-10:])
+        response = self.client.get(url, HTTP_RANGE=f'bytes={len(self.pdf)}-')
+        self.assertEqual(response.status_code, 416)
+
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        outsider = User.objects.create_user('outsider', password='x')
+        self.client.force_login(outsider)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.upload(self.expense, b'x').status_code, 404)
+
+    def test_list_counts_attachments_in_one_query(self):
+        def list_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/expenses/')
+            return response, len(queries)
+
+        self.upload(self.expense, self.pdf)
+        list_queries()  # Budgets are cached after the first view
+        _, baseline = list_queries()
+        for n in range(2):
+            self.upload(self.expense, self.pdf + bytes([n]))
+        response, after = list_queries()
+        self.assertContains(response, '📎3')
+        self.assertEqual(after, baseline)
+
+
+class TaskQueueTests(TestCase):
+    """ ✅ Slow jobs are queued, retried with backoff and report their progress """
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        settings = override_settings(SELAVU_TASK_DIR=self.root.name)
+        settings.enable()
+        self.addCleanup(self.root.cleanup)
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user('meena', password='x')
+        self.category = Category.objects.create(name='Bank', user=self.user)
+        self.client.force_login(self.user)
+        self.calls = []
+
+        def flaky(report, fail_times=0, permanent=False):
+            self.calls.append(fail_times)
+            if permanent:
+                raise tasks.TaskError("Bad input")
+            if len(self.calls) <= fail_times:
+                raise ConnectionError("Try again")
+            report(1, 2, "halfway")
+            return {'ok': True}
+
+        tasks.REGISTRY['flaky'] = (flaky, 3)
+        self.addCleanup(tasks.REGISTRY.pop, 'flaky')
+
+    def test_import_is_queued_and_run_by_a_worker(self):
+        statement = SimpleUploadedFile(
+            'statement.csv', b'date,amount,description\n2024-01-05,120,Bus\n2024-01-06,80,Tea\n')
+        response = self.client.post('/import-expenses/', {
+            'statement': statement, 'statement_format': 'csv',
+            'default_category': self.category.pk, 'debit_sign': 'any',
+            'date_column': 'date', 'amount_column': 'amount',
+            'description_column': 'description', 'date_format': '%Y-%m-%d'})
+        task = Task.objects.get()
+        self.assertRedirects(response, f'/import-expenses/?task={task.pk}')
+        # The request only stored the file
+        self.assertEqual(task.status, Task.QUEUED)
+        self.assertFalse(Expense.objects.exists())
+
+        call_command('run_tasks', processes=0, stdout=io.StringIO())
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.DONE)
+        self.assertEqual(task.result, {'created': 2, 'duplicates': 0, 'skipped': 0})
+        self.assertEqual(Expense.objects.filter(add_by=self.user).count(), 2)
+        self.assertEqual(task.message, "2 imported, 0 duplicates, 0 skipped")
+        self.assertFalse(os.path.exists(task.kwargs['upload']))
+
+        status = self.client.get(f'/api/v1/tasks/{task.pk}/').json()
+        self.assertEqual((status['status'], status['progress']), ('done', 1.0))
+        self.assertContains(self.client.get(f'/import-expenses/?task={task.pk}'), 'Imported 2')
+        self.client.force_login(User.objects.create_user('other', password='x'))
+        self.assertEqual(self.client.get(f'/api/v1/tasks/{task.pk}/').status_code, 404)
+
+    def test_imports_only_into_the_importers_categories(self):
+        victim = User.objects.create_user('ravi', password='x')
+        theirs = Category.objects.create(name='Theirs', user=victim)
+        statement = SimpleUploadedFile('statement.csv', b'date,amount\n2024-01-05,120\n')
+        response = self.client.post('/import-expenses/', {
+            'statement': statement, 'statement_format': 'csv',
+            'default_category': theirs.pk, 'debit_sign': 'any',
+            'date_column': 'date', 'amount_column': 'amount',
+            'description_column': 'description', 'date_format': '%Y-%m-%d'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('default_category', response.context['form'].errors)
+        self.assertFalse(Task.objects.exists())
+
+        # A queued task checks again, whoever queued it
+        path = tasks.stash(io.BytesIO(b'date,amount\n2024-01-05,120\n'))
+        task = tasks.enqueue('import_statement', user=self.user, upload=path,
+                             user_id=self.user.pk, category_id=theirs.pk,
+                             csv_options={'date_column': 'date', 'amount_column': 'amount'})
+        tasks.run_now(task.pk)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.FAILED, 1))
+        self.assertFalse(Expense.objects.exists())
+
+    def test_failures_are_retried_with_backoff(self):
+        task = tasks.enqueue('flaky', user=self.user, fail_times=1)
+        self.assertEqual(tasks.run_pending(), 1)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.QUEUED, 1))
+        self.assertIn('ConnectionError', task.error)
+        # Not due again until the backoff has passed
+        self.assertGreater(task.run_after, timezone.now())
+        self.assertIsNone(tasks.claim())
+
+        Task.objects.filter(pk=task.pk).update(run_after=timezone.now())
+        self.assertEqual(tasks.run_pending(), 1)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts, task.result), (Task.DONE, 2, {'ok': True}))
+
+        # Bad input fails at once; a task out of attempts fails for good
+        bad = tasks.enqueue('flaky', permanent=True)
+        tasks.run_now(bad.pk)
+        self.calls.clear()
+        worse = tasks.enqueue('flaky', fail_times=5)
+        tasks.run_now(worse.pk)
+        self.assertEqual(Task.objects.get(pk=bad.pk).attempts, 1)
+        self.assertEqual(Task.objects.get(pk=worse.pk).attempts, 3)
+        self.assertEqual(set(Task.objects.filter(pk__in=[bad.pk, worse.pk]).values_list(
+            'status', flat=True)), {Task.FAILED})
+
+    def test_claims_are_exclusive_and_dead_workers_lose_them(self):
+        task = tasks.enqueue('flaky', user=self.user)
+        self.assertEqual(tasks.claim(), task.pk)
+        self.assertIsNone(tasks.claim())
+        # A running task saves its progress on its row, throttled
+        report = tasks.Progress(task.pk)
+        report(1, 4, "a quarter")
+        report(2, 4, "too soon to save")
+        status = self.client.get(f'/api/v1/tasks/{task.pk}/').json()
+        self.assertEqual((status['status'], status['progress'], status['message']),
+                         ('running', 0.25, 'a quarter'))
+        with override_settings(SELAVU_TASK_PROGRESS_SECONDS=0):
+            report(3, 4, "most")
+        self.assertEqual(Task.objects.get(pk=task.pk).progress, 0.75)
+
+        Task.objects.filter(pk=task.pk).update(locked_until=timezone.now() - timedelta(1))
+        self.assertEqual(tasks.claim(), task.pk)
+        self.assertEqual(Task.objects.get(pk=task.pk).attempts, 2)
+        # A new attempt starts its progress over
+        self.assertEqual(Task.objects.get(pk=task.pk).progress, 0)
+
+    def test_backups_are_staff_only_queued_and_never_rotate(self):
+        root = Path(self.root.name)
+        source = root / 'live.sqlite3'
+        sqlite3.connect(source).close()
+        scheduled = [root / backups.backup_name(datetime(2024, 1, day)) for day in (1, 2)]
+        for path in scheduled:
+            path.touch()
+        self.enterContext(mock.patch.object(backups, 'BACKUP_DIR', root))
+        self.enterContext(mock.patch.object(backups, 'BACKUP_KEEP', 1))
+        self.enterContext(mock.patch.object(backups, 'database_path', lambda: str(source)))
+
+        self.assertEqual(self.client.post('/backup-db/').status_code, 302)
+        self.client.logout()
+        self.assertEqual(self.client.post('/backup-db/').status_code, 302)
+        self.assertFalse(Task.objects.exists())
+
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+        # Following a link queues nothing
+        self.assertEqual(self.client.get('/backup-db/').status_code, 400)
+        self.assertFalse(Task.objects.exists())
+        response = self.client.post('/backup-db/')
+        self.assertEqual(response.status_code, 202)
+        task = Task.objects.get(name='backup')
+        self.assertEqual(response.headers['Location'], f'/api/v1/tasks/{task.pk}/')
+        tasks.run_pending()
+        task.refresh_from_db()
+        self.assertEqual(Path(task.result['path']).parent, root / 'requested')
+        # The scheduled backups are all still there
+        self.assertTrue(all(path.exists() for path in scheduled))
+
+        response = self.client.get(f'/backup-db/?task={task.pk}')
+        self.assertEqual(b''.join(response.streaming_content)[:15], b'SQLite format 3')
+
+    def test_only_superusers_see_other_users_tasks(self):
+        mine = tasks.enqueue('flaky', user=self.user)
+        theirs = tasks.enqueue('flaky', user=User.objects.create_user('ravi'), upload='/tmp/x')
+        staff = User.objects.create_user('clerk', password='x', is_staff=True)
+        staff.user_permissions.add(Permission.objects.get(codename='view_task'))
+        self.client.force_login(staff)
+        self.assertEqual(list(self.client.get('/admin/selavu/task/').context['cl'].result_list),
+                         [])
+        self.assertEqual(self.client.get(f'/admin/selavu/task/{theirs.pk}/change/').status_code,
+                         302)  # Redirected away: not found for this user
+        self.assertEqual(self.client.get(f'/api/v1/tasks/{theirs.pk}/').status_code, 404)
+
+        self.client.force_login(User.objects.create_superuser('root', password='x'))
+        self.assertEqual(set(self.client.get('/admin/selavu/task/').context['cl'].result_list),
+                         {mine, theirs})
+
+    @override_settings(SELAVU_TASKS_EAGER=True)
+    def test_eager_tasks_run_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            task = tasks.enqueue('flaky', fail_times=1)
+            self.assertEqual(Task.objects.get(pk=task.pk).status, Task.QUEUED)
+        # Retried straight away, no worker needed
+        self.assertEqual(Task.objects.get(pk=task.pk).status, Task.DONE)
+        self.assertEqual(len(self.calls), 2)
+
+
+class ArchiveTests(TestCase):
+    """ ✅ Old cycles move to the archive and are read only for ranges that reach them """
+
+    def setUp(self):
+        self.user = User.objects.create_user('lakshmi', password='x')
+        self.category = Category.objects.create(name='Rent', user=self.user)
+        today = date.today()
+        self.old = [self.spend(today - timedelta(days=days), amount)
+                    for days, amount in ((500, 100), (480, 40), (430, 60))]
+        self.kept = self.spend(today - timedelta(days=490), 25)  # Has a receipt
+        Attachment.objects.create(
+            expense=self.kept, uploaded_by=self.user, name='r.pdf',
+            blob=Blob.objects.create(digest='a' * 64, size=1))
+        self.recent = self.spend(today, 10)
+        self.client.force_login(self.user)
+
+    def spend(self, day, amount):
+        return Expense.objects.create(category=self.category, date=day, add_by=self.user,
+                                      description=f'Spent {amount}', amount=amount)
+
+    def rollups(self):
+        return sorted(CycleRollup.objects.filter(user=self.user).values_list(
+            'cycle_start', 'total', 'count'))
+
+    def test_archiving_moves_rows_but_not_totals(self):
+        before, events = self.rollups(), LedgerEvent.objects.count()
+        self.assertEqual(archive_cycles(users=[self.user], keep=12), 3)
+
+        self.assertEqual(set(Expense.objects.values_list('pk', flat=True)),
+                         {self.kept.pk, self.recent.pk})
+        self.assertEqual(set(ArchivedExpense.objects.values_list('pk', flat=True)),
+                         {expense.pk for expense in self.old})
+        self.assertEqual(self.rollups(), before)
+        self.assertEqual(LedgerEvent.objects.count(), events)
+        cycles = ArchivedCycle.objects.filter(user=self.user)
+        self.assertEqual(sum(cycle.rows for cycle in cycles), 3)
+        # The cycle the receipt kept back still counts it in its totals
+        self.assertEqual(sum(cycle.total for cycle in cycles), Decimal('225'))
+        self.assertEqual(archived_through(self.user), max(cycle.end for cycle in cycles))
+        # A rebuild still sees the archived rows
+        rollups.rebuild(users=[self.user])
+        self.assertEqual(self.rollups(), before)
+
+        self.assertEqual(restore(self.user), 3)
+        self.assertEqual(Expense.objects.count(), 5)
+        self.assertFalse(ArchivedCycle.objects.exists())
+
+    def test_admin_shows_staff_only_their_own_cycles(self):
+        archive_cycles(users=[self.user], keep=12)
+        staff = User.objects.create_user('clerk', password='x', is_staff=True)
+        staff.user_permissions.add(Permission.objects.get(codename='view_archivedcycle'))
+        self.client.force_login(staff)
+        response = self.client.get('/admin/selavu/archivedcycle/')
+        self.assertEqual(list(response.context['cl'].result_list), [])
+        self.assertNotContains(response, 'lakshmi')
+
+        self.client.force_login(User.objects.create_superuser('root', password='x'))
+        response = self.client.get('/admin/selavu/archivedcycle/')
+        self.assertEqual(len(response.context['cl'].result_list),
+                         ArchivedCycle.objects.filter(user=self.user).count())
+
+    def test_reimporting_an_archived_statement_skips_its_rows(self):
+        archive_cycles(users=[self.user], keep=12)
+        before = self.rollups()
+        rows = [StatementRow(e.date, e.amount, e.description) for e in self.old]
+        result = import_statement(self.user, rows, self.category)
+        self.assertEqual((result.created, result.duplicates), (0, 3))
+        self.assertEqual(self.rollups(), before)
+
+    def test_reads_union_the_archive_only_when_reaching_back(self):
+        archive_cycles(users=[self.user], keep=12)
+        everything = sorted((e.date, e.pk) for e in self.old + [self.kept, self.recent])
+
+        # Keyset pages walk across both tables on the same (date, id) key
+        seen, after = [], None
+        while True:
+            page = paginate_by_cursor(
+                Expense.objects.all(), after=after, page_size=2,
+                older=archived_expenses(self.user), older_through=archived_through(self.user))
+            seen += [(row.date, row.pk) for row in page]
+            if not page.has_next:
+                break
+            after = page.next_cursor
+        self.assertEqual(seen, everything[::-1])
+
+        with CaptureQueriesContext(connection) as queries:
+            recent = self.client.get('/api/v1/expenses/', {'start': str(date.today())}).json()
+        self.assertEqual([row['id'] for row in recent['results']], [self.recent.pk])
+        self.assertFalse([q for q in queries if 'archivedexpense' in q['sql']])
+
+        results = self.client.get('/api/v1/expenses/').json()['results']
+        self.assertEqual([row['id'] for row in results], [pk for _, pk in everything[::-1]])
+        self.assertContains(self.client.get('/expenses/'), 'Archived', count=3)
+
+        lines = b''.join(self.client.get('/export/expenses.csv').streaming_content).decode()
+        self.assertEqual([int(line.split(',')[0]) for line in lines.splitlines()[1:]],
+                         [pk for _, pk in everything])
@@ -0,0 +1,85 @@
+from collections import defaultdict
+from decimal import Decimal
+from itertools import chain
+
+from .caching import cached_for_cycle
+from .cycles import current_cycle, user_cycles_back
+from .models import CycleRollup
+from .workspaces import members_totals
+
+MAX_CYCLES = 120  # Ten years of monthly cycles
+
+
+def moving_average(values, window):
+    """ ✅ Trailing average in one pass; the first points average what exists so far """
+    result = []
+    running = 0.0
+    for i, value in enumerate(values):
+        running += value
+        if i >= window:
+            running -= values[i - window]
+        result.append(round(running / min(i + 1, window), 2))
+    return result
+
+
+def _trends(user, cycles, window):
+    periods = user_cycles_back(user, cycles)
+    position = {cycle.start: i for i, cycle in enumerate(periods)}
+
+    income = [Decimal(0)] * cycles
+    expense = [Decimal(0)] * cycles
+    # Keyed by id: two workspaces can each have a category of the same name
+    categories = defaultdict(lambda: [Decimal(0)] * cycles)
+    names = {}
+
+    # ✅ One grouped read of the rollups for every series, whatever N is
+    rows = CycleRollup.objects.filter(
+        user=user, cycle_start__range=(periods[0].start, periods[-1].start), count__gt=0,
+    ).values_list('cycle_start', 'kind', 'category', 'category__name', 'total')
+    # Plus the other members' rows in shared workspaces
+    shared = [(cycle_start, kind, category, name, total)
+              for (cycle_start, kind, category, name, _), total
+              in members_totals(user, periods[0].start, periods[-1].end).items()]
+    for cycle_start, kind, category, name, total in chain(rows.iterator(), shared):
+        i = position.get(cycle_start)
+        if i is None:
+            continue
+        if kind == CycleRollup.INCOME:
+            income[i] += total
+        else:
+            expense[i] += total
+            categories[category][i] += total
+            names[category] = name
+
+    income = [float(v) for v in income]
+    expense = [float(v) for v in expense]
+    balance = [round(i - e, 2) for i, e in zip(income, expense)]
+    savings_rate = [round(b / i * 100, 1) if i else None for b, i in zip(balance, income)]
+
+    return {
+        'cycles': [{'start': c.start.isoformat(), 'end': c.end.isoformat()} for c in periods],
+        'income': income,
+        'expense': expense,
+        'balance': balance,
+        'savings_rate': savings_rate,
+        'categories': [{'id': pk, 'name': names[pk], 'values': [float(v) for v in values]}
+                       for pk, values in sorted(categories.items(),
+                                                key=lambda item: (names[item[0]], item[0]))],
+        'moving_average': {
+            'window': window,
+            'income': moving_average(income, window),
+            'expense': moving_average(expense, window),
+            'balance': moving_average(balance, window),
+        },
+    }
+
+
+def cycle_trends(user, cycles=12, window=3):
+    """
+    ✅ Per-category spend, income, balance, savings rate (% of income) and
+    moving averages over the last `cycles` cycles, oldest first.
+    """
+    cycles = max(1, min(int(cycles), MAX_CYCLES))
+    window = max(1, int(window))
+    return cached_for_cycle(user, current_cycle(user), f'trends:{cycles}:{window}',
+                            lambda: _trends(user, cycles, window))
@@ -1,14 +1,34 @@
 from django.urls import path
-from . import views
+from . import api, views
 from .views import create_admin, backup_db_view
 
 urlpatterns = [
     path('expenses/',  views.expense_list, name='expense_list'),
     path('add-expense/', views.add_expense, name='add_expense'),
+    path('add-expenses/', views.add_expenses, name='add_expenses'),
     path('edit-expense/<int:pk>/', views.edit_expense,
          name='edit_expense'),  # ✅ Ensure this line exists
     path('delete-expense/<int:pk>/', views.delete_expense,
          name='delete_expense'),  # ✅ Add this line
+    path('expenses/<int:pk>/attachments/', views.upload_attachment,
+         name='upload_attachment'),
+    path('attachments/<int:pk>/', views.attachment_file, name='attachment_file'),
+    path('attachments/<int:pk>/thumbnail/', views.attachment_thumbnail,
+         name='attachment_thumbnail'),
+    path('import-expenses/', views.import_expenses, name='import_expenses'),
+    path('export/<str:kind>.<str:fmt>', views.export_ledger,
+         name='export_ledger'),
+    path('api/trends/', views.trends_api, name='trends_api'),
+    path('metrics/', views.metrics_view, name='metrics'),
+    path('api/v1/expenses/', api.expenses, name='api_expenses'),
+    path('api/v1/expenses/suggest/', api.suggest, name='api_suggest_category'),
+    path('api/v1/expenses/<int:pk>/', api.expense_detail, name='api_expense_detail'),
+    path('api/v1/categories/', api.categories, name='api_categories'),
+    path('api/v1/dashboard/', api.dashboard, name='api_dashboard'),
+    path('api/v1/workspaces/', api.workspaces, name='api_workspaces'),
+    path('api/v1/workspaces/<int:pk>/dashboard/', api.workspace_dashboard,
+         name='api_workspace_dashboard'),
+    path('api/v1/tasks/<int:pk>/', api.task_status, name='api_task'),
     path('create-admin/', create_admin),
     path('backup-db/', backup_db_view, name='backup-db'),
 ]
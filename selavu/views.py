@@ -1,34 +1,69 @@
+from pathlib import Path
+
 from django.shortcuts import render, get_object_or_404, redirect
-from .models import Expense, Category
-from .forms import ExpenseForm
-from django.http import HttpResponse
+from .models import Attachment, Expense, Category, Task
+from .forms import ExpenseForm, ExpenseFilterForm, ExpenseFormSet, StatementImportForm
+from .backups import stream_file
+from .exports import CONTENT_TYPES, EXPORTS, export_filename, export_range, stream_export
+from .pagination import InvalidCursor, KeysetPage, paginate_by_cursor
+from .metrics import registry
+from .trends import cycle_trends
+from .budgets import budget_status
+from .search import rank
+from .bulk import create_expenses
+from .currency import home_currency_for
+from . import tasks
+from .archive import archived_expenses, archived_through, reaches_archive
+from .attachments import (
+    BlobUploadHandler, annotate_counts, attach, blob_path, file_response, thumbnail_path)
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, JsonResponse,
+    StreamingHttpResponse)
+from django.db import transaction
+from django.utils.dateparse import parse_date
 from django.template import loader
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.models import User
-import os
-from django.conf import settings
-from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import require_http_methods, require_POST
 # Create your views here.
 
+EXPENSE_PAGE_SIZE = 50
 
-@csrf_exempt
-def backup_db_view(request):
-    db_path = settings.DATABASES['default']['NAME']
-    backup_path = os.path.join(settings.BASE_DIR, "db_backup.sqlite3")
-
-    try:
-        with open(db_path, 'rb') as db_file:
-            with open(backup_path, 'wb') as backup_file:
-                backup_file.write(db_file.read())
 
-        with open(backup_path, 'rb') as backup_file:
-            response = HttpResponse(
-                backup_file.read(), content_type='application/x-sqlite3')
-            response['Content-Disposition'] = 'attachment; filename="db_backup.sqlite3"'
-            return response
+@staff_member_required
+@require_http_methods(['GET', 'POST'])
+def backup_db_view(request):
+    """
+    ✅ Online backup of the live database, taken by a background task: POST
+    queues it (202, Location: the task) and GET ?task=<id> streams it once
+    done. Queued backups only run with a `manage.py run_tasks` worker, or
+    in the web process with SELAVU_TASKS_EAGER.
+    """
+    if request.method == 'POST':
+        # Only a POST queues one: a link, prefetch or reload can't copy the DB again
+        task = tasks.enqueue('backup', user=request.user)
+        return JsonResponse(tasks.task_json(task), status=202, headers={
+            'Location': reverse('api_task', args=[task.pk])})
+    if not request.GET.get('task', '').isdigit():
+        return HttpResponseBadRequest("POST to queue a backup, then GET ?task=<id> for it")
+    task = get_object_or_404(tasks.visible_tasks(request.user).filter(
+        name='backup', status=Task.DONE), pk=request.GET['task'])
+    backup_path = Path(task.result['path'])
+    if not backup_path.exists():
+        raise Http404("Backup was removed")
+    compress = request.GET.get('compress') == 'gzip'
 
-    except Exception as e:
-        return HttpResponse(f"Error: {str(e)}", status=500)
+    filename = backup_path.name + ('.gz' if compress else '')
+    response = StreamingHttpResponse(
+        stream_file(backup_path, compress=compress),
+        content_type='application/gzip' if compress else 'application/x-sqlite3')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    if not compress:
+        response['Content-Length'] = backup_path.stat().st_size
+    return response
 
 
 def create_admin(request):
@@ -46,43 +81,223 @@ def expenses(request):
 
 @login_required
 def add_expense(request):
-    categories = Category.objects.all()  # ✅ Fetch all categories
+    categories = Category.objects.for_user(request.user)  # ✅ Only the user's workspaces'
     if request.method == "POST":
-        form = ExpenseForm(request.POST)
+        form = ExpenseForm(request.POST, user=request.user)
         if form.is_valid():
             expense = form.save(commit=False)
             expense.add_by = request.user  # Assign the logged-in user
-            expense.save()
+            # ✅ The row, its rollups and its audit event commit together; only
+            # writes open the transaction, as it takes SQLite's write lock
+            with transaction.atomic():
+                expense.save()
             return redirect('expense_list')  # Redirect to expense list page
     else:
-        form = ExpenseForm()
+        form = ExpenseForm(user=request.user)
 
-    return render(request, 'add_expense.html', {'form': form, 'categories': categories})
+    return render(request, 'add_expense.html', {
+        'form': form, 'categories': categories, 'home_currency': home_currency_for(request.user)})
 
 
+@login_required
+def add_expenses(request):
+    """ ✅ Enter a whole receipt at once: every line is saved, or none is """
+    formset = ExpenseFormSet(request.POST or None, queryset=Expense.objects.none(),
+                             form_kwargs={'user': request.user})
+    if request.method == "POST" and formset.is_valid():
+        # Errors of all lines are shown together; only filled-in lines are saved
+        create_expenses(request.user, [form for form in formset if form.has_changed()])
+        return redirect('expense_list')
+    return render(request, 'add_expenses.html', {'formset': formset})
+
+
+@login_required
 def edit_expense(request, pk):
-    expense = get_object_or_404(Expense, pk=pk)
+    # ✅ Rows outside the user's workspaces are a 404, not someone else's data
+    expense = get_object_or_404(Expense.objects.for_user(request.user), pk=pk)
 
     if request.method == "POST":
-        form = ExpenseForm(request.POST, instance=expense)
+        form = ExpenseForm(request.POST, instance=expense, user=request.user)
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                form.save()
             return redirect('expense_list')
     else:
-        form = ExpenseForm(instance=expense)
+        form = ExpenseForm(instance=expense, user=request.user)
 
-    return render(request, 'edit_expense.html', {'form': form, 'expense': expense})
+    return render(request, 'edit_expense.html', {
+        'form': form, 'expense': expense,
+        'attachments': expense.attachments.select_related('blob').order_by('uploaded_at')})
 
 
+@login_required
+@require_POST  # ✅ A link or prefetch must not delete anything
+@transaction.atomic
 def delete_expense(request, pk):
-    expense = get_object_or_404(Expense, pk=pk)
+    expense = get_object_or_404(Expense.objects.for_user(request.user), pk=pk)
     expense.delete()
     # ✅ Redirect to expense list after deleting
     return redirect('expense_list')
 
 
+@login_required
+@csrf_exempt  # Checked below, once the upload handlers are in place
+@require_POST
+def upload_attachment(request, pk):
+    """ ✅ Receipts go straight from the request body into the blob store """
+    request.upload_handlers = [BlobUploadHandler(request)]
+    return _upload_attachment(request, pk)
+
+
+@csrf_protect
+@transaction.atomic
+def _upload_attachment(request, pk):
+    expense = get_object_or_404(Expense.objects.for_user(request.user), pk=pk)
+    for upload in request.FILES.getlist('file'):
+        attach(expense, request.user, upload.digest, upload.name, upload.content_type,
+               upload.size, source=upload)
+    errors = getattr(request, 'upload_errors', [])
+    if errors:
+        return render(request, 'edit_expense.html', {
+            'form': ExpenseForm(instance=expense, user=request.user), 'expense': expense,
+            'attachments': expense.attachments.select_related('blob').order_by('uploaded_at'),
+            'upload_errors': errors}, status=400)
+    return redirect('edit_expense', pk=expense.pk)
+
+
+def _visible_attachment(request, pk):
+    return get_object_or_404(Attachment.objects.select_related('blob').filter(
+        expense__in=Expense.objects.for_user(request.user)), pk=pk)
+
+
+@login_required
+def attachment_file(request, pk):
+    attachment = _visible_attachment(request, pk)
+    blob = attachment.blob
+    return file_response(request, blob_path(blob.digest), blob.content_type, blob.digest,
+                         filename=attachment.name)
+
+
+@login_required
+def attachment_thumbnail(request, pk):
+    attachment = _visible_attachment(request, pk)
+    if not attachment.blob.has_thumbnail:
+        raise Http404("No thumbnail yet")
+    digest = attachment.blob.digest
+    return file_response(request, thumbnail_path(digest), 'image/jpeg', f'{digest}-thumb')
+
+
 @login_required
 def expense_list(request):
-    expenses = Expense.objects.filter(
-        add_by=request.user)  # Show only user's expenses
-    return render(request, 'expense_list.html', {'expenses': expenses})
+    filter_form = ExpenseFilterForm(request.GET or None, user=request.user)
+    expenses = Expense.objects.for_user(
+        request.user).select_related('category')  # ✅ Every workspace the user is in
+    archived = archived_expenses(request.user).select_related('category')
+    searching = False
+    start = None
+    if filter_form.is_valid():
+        expenses = filter_form.filter_queryset(expenses)
+        searching = bool(filter_form.cleaned_data.get('q'))
+        start = filter_form.cleaned_data.get('start_date')
+        if not searching:  # The archive has no full-text index
+            archived = filter_form.filter_queryset(archived)
+
+    if searching:
+        # ✅ Best matches first; a rank has no cursor, so refine instead of paging
+        page = KeysetPage(list(rank(expenses, filter_form.cleaned_data['q'],
+                                    limit=EXPENSE_PAGE_SIZE)))
+    else:
+        # ✅ Seek on (date, id) so deep pages cost the same as the first one;
+        # archived cycles are only read once a page gets back to them
+        through = archived_through(request.user)
+        try:
+            page = paginate_by_cursor(
+                expenses,
+                after=request.GET.get('after'),
+                before=request.GET.get('before'),
+                page_size=EXPENSE_PAGE_SIZE,
+                older=archived,
+                older_through=through if reaches_archive(through, start) else None,
+            )
+        except InvalidCursor as e:
+            return HttpResponseBadRequest(str(e))
+    # ✅ One grouped count for the whole page, not a query per row
+    annotate_counts(page)
+    budgets = budget_status(request.user)
+    return render(request, 'expense_list.html', {
+        'expenses': page,
+        'page': page,
+        'filter_form': filter_form,
+        'searching': searching,
+        'budgets': budgets.values(),
+        'over_budget': {pk for pk, status in budgets.items() if status.over},
+        'home_currency': home_currency_for(request.user),
+    })
+
+
+@login_required
+def import_expenses(request):
+    task = None
+    if request.method == "POST":
+        form = StatementImportForm(request.POST, request.FILES, user=request.user)
+        if form.is_valid():
+            data = form.cleaned_data
+            # ✅ A worker parses and imports it; the request only stores the file
+            task = tasks.enqueue(
+                'import_statement', user=request.user, upload=tasks.stash(data['statement']),
+                user_id=request.user.pk, category_id=data['default_category'].pk,
+                statement_format=data['statement_format'], debit_sign=data['debit_sign'],
+                csv_options=form.csv_options())
+            return redirect(f"{reverse('import_expenses')}?task={task.pk}")
+    else:
+        form = StatementImportForm(user=request.user)
+        if request.GET.get('task'):
+            task = get_object_or_404(tasks.visible_tasks(request.user).filter(
+                name='import_statement'), pk=request.GET['task'])
+
+    return render(request, 'import_expenses.html', {
+        'form': form, 'task': task and tasks.task_json(task)})
+
+
+@login_required
+def export_ledger(request, kind, fmt):
+    """ ✅ Stream the user's expenses/incomes as CSV, JSON or XLSX """
+    if kind not in EXPORTS or fmt not in CONTENT_TYPES:
+        raise Http404("Unknown export")
+    try:
+        cycle = request.GET.get('cycle')
+        start, end = export_range(
+            request.user,
+            cycle=int(cycle) if cycle else None,
+            start=parse_date(request.GET.get('start', '')),
+            end=parse_date(request.GET.get('end', '')),
+        )
+    except ValueError:
+        return HttpResponseBadRequest("Invalid cycle or date range")
+
+    response = StreamingHttpResponse(
+        stream_export(kind, fmt, request.user, start, end),
+        content_type=CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = (
+        f'attachment; filename="{export_filename(kind, fmt, start, end)}"')
+    return response
+
+
+@staff_member_required
+def metrics_view(request):
+    """ ✅ Per-route request metrics of this worker, as Prometheus text or ?format=json """
+    if request.GET.get('format') == 'json':
+        return HttpResponse(registry.as_json(), content_type='application/json')
+    return HttpResponse(registry.as_prometheus(),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@login_required
+def trends_api(request):
+    """ ✅ Income/expense/balance/category series over the last ?cycles=N cycles """
+    try:
+        cycles = int(request.GET.get('cycles', 12))
+        window = int(request.GET.get('window', 3))
+    except ValueError:
+        return HttpResponseBadRequest("cycles and window must be integers")
+    return JsonResponse(cycle_trends(request.user, cycles=cycles, window=window))
@@ -0,0 +1,166 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db.models import Case, Count, DateField, DecimalField, F, Q, Sum, When
+
+from .audit import owner_id
+from .caching import bump_versions, cached_for_cycle
+from .currency import RateCache, home_currency_for
+from .cycles import current_cycle, cycle_for, start_day_for
+from .models import (
+    ArchivedExpense, Category, CycleRollup, Expense, Income, Membership, Workspace)
+
+
+def personal_workspace_ids(user_ids):
+    """
+    ✅ {user_id: id of the user's own workspace}, creating the missing ones
+    in bulk. Safe to race: the loser's rows are ignored as conflicts.
+    """
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    personal = Workspace.objects.filter(personal_for__in=user_ids)
+    found = dict(personal.values_list('personal_for', 'pk'))
+    missing = sorted(user_ids - set(found))
+    if missing:
+        names = dict(User.objects.filter(pk__in=missing).values_list('pk', 'username'))
+        Workspace.objects.bulk_create(
+            [Workspace(name=names.get(user_id, f"user {user_id}"), personal_for_id=user_id)
+             for user_id in missing], ignore_conflicts=True)
+        found = dict(personal.values_list('personal_for', 'pk'))
+        Membership.objects.bulk_create(
+            [Membership(user_id=user_id, workspace_id=found[user_id], role=Membership.OWNER)
+             for user_id in missing], ignore_conflicts=True)
+    return found
+
+
+def assign_workspaces(instances):
+    """
+    ✅ Fill in the workspace of rows that have none: an expense goes where
+    its category is, anything else to its author's own workspace. Two
+    queries however many rows there are; use before bulk_create.
+    """
+    pending = [instance for instance in instances if instance.workspace_id is None]
+    category_ids = {instance.category_id for instance in pending if isinstance(instance, Expense)}
+    if category_ids:
+        workspaces = dict(Category.objects.filter(pk__in=category_ids).values_list(
+            'pk', 'workspace_id'))
+        for instance in pending:
+            if isinstance(instance, Expense):
+                instance.workspace_id = workspaces.get(instance.category_id)
+    pending = [instance for instance in pending if instance.workspace_id is None]
+    if pending:
+        personal = personal_workspace_ids({owner_id(instance) for instance in pending})
+        for instance in pending:
+            instance.workspace_id = personal[owner_id(instance)]
+
+
+def touch(workspace_ids):
+    """ ✅ Invalidate the cached ledgers (dashboards, API ETags) of every member """
+    workspace_ids = {workspace_id for workspace_id in workspace_ids if workspace_id is not None}
+    if workspace_ids:
+        bump_versions(set(Membership.objects.filter(
+            workspace_id__in=workspace_ids).values_list('user_id', flat=True)))
+
+
+def shared_dashboard(workspace, user):
+    """
+    ✅ Current-cycle spending of a workspace per category and per member, in
+    the viewer's cycle and home currency. Every member's rows come from one
+    grouped query on the (workspace, date) index; rows in other currencies
+    are grouped per day and amount and converted the way the rollups do.
+    """
+    cycle = current_cycle(user)
+    home = home_currency_for(user)
+    foreign = ~Q(currency=home)
+    rows = list(Expense.objects.for_workspace(workspace).filter(
+        date__range=cycle.range).order_by().values(
+        'add_by', 'add_by__username', 'category', 'category__name', 'currency',
+        day=Case(When(foreign, then=F('date')), output_field=DateField()),
+        unit=Case(When(foreign, then=F('amount')),
+                  output_field=DecimalField(max_digits=10, decimal_places=2)),
+    ).annotate(total=Sum('amount'), count=Count('id')))
+
+    rates = RateCache()
+    rates.load(pair for row in rows if row['day'] is not None
+               for pair in ((row['currency'], row['day']), (home, row['day'])))
+    categories = defaultdict(lambda: Decimal(0))
+    members = defaultdict(lambda: Decimal(0))
+    for row in rows:
+        total = row['total']
+        if row['day'] is not None:
+            total = rates.convert(row['unit'], row['currency'], home, row['day']) * row['count']
+        categories[(row['category'], row['category__name'])] += total
+        members[(row['add_by'], row['add_by__username'])] += total
+
+    return {
+        'workspace': workspace.name,
+        'start_date': cycle.start,
+        'end_date': cycle.end,
+        'currency': home,
+        'total_expense': sum(categories.values(), Decimal(0)),
+        'categories': [{'id': pk, 'name': name, 'total': total}
+                       for (pk, name), total in sorted(categories.items(), key=lambda i: -i[1])],
+        'members': [{'id': pk, 'username': name, 'total': total}
+                    for (pk, name), total in sorted(members.items(), key=lambda i: -i[1])],
+    }
+
+
+def members_totals(user, first, last):
+    """
+    ✅ What the other members of the user's shared workspaces spent and
+    earned there from `first` to `last`, as {(cycle start, kind, category id,
+    category name, source): total} in the user's cycles and home currency.
+    The rollups hold the user's own rows only; adding these gives totals of
+    what for_user() lists. One query for users who share nothing, three
+    otherwise; rows are grouped per day and converted like shared_dashboard.
+    """
+    shared = list(Membership.objects.filter(
+        user=user, workspace__personal_for__isnull=True).values_list('workspace', flat=True))
+    if not shared:
+        return {}
+    start_day = start_day_for(user)
+    home = home_currency_for(user)
+    foreign = ~Q(currency=home)
+
+    def grouped(model, *fields):
+        return model.objects.filter(
+            workspace__in=shared, date__range=(first, last),
+        ).exclude(add_by=user).order_by().values(
+            'date', 'currency', *fields,
+            unit=Case(When(foreign, then=F('amount')),
+                      output_field=DecimalField(max_digits=10, decimal_places=2)),
+        ).annotate(total=Sum('amount'), count=Count('id'))
+
+    # Archived expenses still count, as they do in the rollups
+    expenses = grouped(Expense, 'category', 'category__name').union(
+        grouped(ArchivedExpense, 'category', 'category__name'), all=True)
+    rows = [(CycleRollup.EXPENSE, row) for row in expenses]
+    rows += [(CycleRollup.INCOME, row) for row in grouped(Income, 'source')]
+
+    rates = RateCache()
+    rates.load(pair for _, row in rows if row['unit'] is not None
+               for pair in ((row['currency'], row['date']), (home, row['date'])))
+    totals = defaultdict(lambda: Decimal(0))
+    for kind, row in rows:
+        total = row['total']
+        if row['unit'] is not None:
+            total = rates.convert(row['unit'], row['currency'], home, row['date']) * row['count']
+        key = (cycle_for(row['date'], start_day).start, kind, row.get('category'),
+               row.get('category__name'), row.get('source', ''))
+        totals[key] += total
+    return dict(totals)
+
+
+def members_cycle_totals(user, cycle):
+    """ members_totals() of one cycle, cached until a member's write touches the workspace """
+    return cached_for_cycle(user, cycle, 'members',
+                            lambda: members_totals(user, cycle.start, cycle.end))
+
+
+def members_category_totals(user, cycle):
+    """ {category id: what the other members spent in it} in the cycle """
+    totals = defaultdict(lambda: Decimal(0))
+    for (_, kind, category_id, _, _), total in members_cycle_totals(user, cycle).items():
+        if kind == CycleRollup.EXPENSE:
+            totals[category_id] += total
+    return dict(totals)
@@ -46,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'selavu.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -89,10 +90,37 @@ if "RENDER" in os.environ:
 else:
     DB_PATH = os.path.join(BASE_DIR, "db.sqlite3")  # Local development
 
+# ✅ SQLite tuning, applied by Django to every new connection. WAL lets
+# readers run alongside a writer, busy_timeout makes writers wait for the
+# lock instead of failing with "database is locked", and IMMEDIATE
+# transactions take the write lock up front so two read-then-write
+# transactions can't deadlock each other.
+# journal_mode is stored in the database file itself, so WAL is only the
+# default on Render: locally it would permanently convert the tracked
+# db.sqlite3 (set SQLITE_JOURNAL_MODE=WAL to opt in on an untracked copy).
+SQLITE_PRAGMAS = {
+    "journal_mode": os.environ.get(
+        "SQLITE_JOURNAL_MODE", "WAL" if "RENDER" in os.environ else "DELETE"),
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+    "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", 128 * 1024 * 1024)),
+    # Negative values are KiB, so this is a 20 MB page cache per connection
+    "cache_size": int(os.environ.get("SQLITE_CACHE_SIZE", -20000)),
+    "temp_store": os.environ.get("SQLITE_TEMP_STORE", "MEMORY"),
+}
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": DB_PATH,
+        # Keep connections (and their PRAGMAs/page cache) across requests
+        "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", 600)),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "init_command": ";".join(
+                f"PRAGMA {name}={value}" for name, value in SQLITE_PRAGMAS.items()),
+            "transaction_mode": os.environ.get("SQLITE_TRANSACTION_MODE", "IMMEDIATE"),
+        },
     }
 }
 
@@ -143,3 +171,91 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 STATIC_URL = 'static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+
+# Expense tracker
+# Billing cycles run from this day of the month to the day before it next
+# month (27th -> 26th); users can override it on their Profile.
+SELAVU_CYCLE_START_DAY = int(os.environ.get('SELAVU_CYCLE_START_DAY', 27))
+
+# Requests slower than this, or running one query this many times, are logged
+# by selavu.middleware.QueryInstrumentationMiddleware
+SELAVU_SLOW_REQUEST_MS = int(os.environ.get('SELAVU_SLOW_REQUEST_MS', 500))
+SELAVU_DUPLICATE_QUERY_THRESHOLD = int(os.environ.get('SELAVU_DUPLICATE_QUERY_THRESHOLD', 5))
+
+# Dashboard aggregates are cached per (user, cycle, ledger version) and
+# invalidated by writes, so every worker must share the cache: "file" (the
+# default) or "redis". locmem is per process and only safe with one worker.
+# Tests and bench_endpoints switch to locmem themselves (selavu.testing).
+SELAVU_CACHE_BACKEND = os.environ.get('SELAVU_CACHE_BACKEND', 'file')
+SELAVU_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'selavu-dashboard',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('SELAVU_CACHE_DIR', os.path.join(BASE_DIR, 'cache')),
+    },
+    # Needs the redis package from requirements.txt
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('SELAVU_REDIS_URL', 'redis://127.0.0.1:6379/1'),
+    },
+}
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'dashboard': {
+        **SELAVU_CACHE_BACKENDS[SELAVU_CACHE_BACKEND],
+        'TIMEOUT': int(os.environ.get('SELAVU_CACHE_TIMEOUT', 24 * 60 * 60)),
+    },
+}
+
+# Runs each test suite with a per-process dashboard cache
+TEST_RUNNER = 'selavu.testing.TestRunner'
+
+# Budget alerts: first at SELAVU_BUDGET_WARN_PERCENT of a budget, then when it
+# is exceeded. selavu.notifiers.FileNotifier appends them to SELAVU_ALERT_FILE.
+SELAVU_BUDGET_WARN_PERCENT = int(os.environ.get('SELAVU_BUDGET_WARN_PERCENT', 80))
+SELAVU_NOTIFIER = os.environ.get('SELAVU_NOTIFIER', 'selavu.notifiers.ConsoleNotifier')
+SELAVU_ALERT_FILE = os.environ.get('SELAVU_ALERT_FILE') or None
+
+# Category suggestions: CategoryRules first, then a naive Bayes model of the
+# user's own expenses, kept in memory for the most recently active users
+SELAVU_CLASSIFIER_MIN_CONFIDENCE = float(os.environ.get('SELAVU_CLASSIFIER_MIN_CONFIDENCE', 0.6))
+SELAVU_CLASSIFIER_CACHE_SIZE = int(os.environ.get('SELAVU_CLASSIFIER_CACHE_SIZE', 256))
+
+# Ledger rows carry their own currency; totals are converted into each user's
+# Profile.home_currency. Exchange rates are loaded with
+# `manage.py load_exchange_rates` and quoted in SELAVU_BASE_CURRENCY.
+SELAVU_DEFAULT_CURRENCY = os.environ.get('SELAVU_DEFAULT_CURRENCY', 'INR')
+SELAVU_BASE_CURRENCY = os.environ.get('SELAVU_BASE_CURRENCY', SELAVU_DEFAULT_CURRENCY)
+
+# Every expense, income and category change is appended to selavu.LedgerEvent;
+# each user gets a full checkpoint every SELAVU_AUDIT_CHECKPOINT_EVERY events,
+# so `manage.py ledger_as_of` replays at most that many.
+SELAVU_AUDIT_CHECKPOINT_EVERY = int(os.environ.get('SELAVU_AUDIT_CHECKPOINT_EVERY', 1000))
+
+# Receipt attachments are stored once per content hash under
+# SELAVU_ATTACHMENT_DIR; thumbnails are made in the background by
+# SELAVU_ATTACHMENT_WORKERS threads (0: inline) when Pillow is installed.
+SELAVU_ATTACHMENT_DIR = os.environ.get(
+    'SELAVU_ATTACHMENT_DIR', os.path.join(BASE_DIR, 'attachments'))
+SELAVU_ATTACHMENT_MAX_BYTES = int(os.environ.get('SELAVU_ATTACHMENT_MAX_BYTES', 10 * 1024 * 1024))
+SELAVU_ATTACHMENT_WORKERS = int(os.environ.get('SELAVU_ATTACHMENT_WORKERS', 2))
+
+# Slow jobs (statement imports, queued backups and rollup rebuilds) are rows in
+# selavu.Task, run by `manage.py run_tasks` with SELAVU_TASK_PROCESSES worker
+# processes. Failures are retried after SELAVU_TASK_RETRY_SECONDS, doubling each
+# time. With SELAVU_TASKS_EAGER they run in the web process instead (no worker).
+SELAVU_TASK_DIR = os.environ.get('SELAVU_TASK_DIR', os.path.join(BASE_DIR, 'tasks'))
+SELAVU_TASK_PROCESSES = int(os.environ.get('SELAVU_TASK_PROCESSES', 2))
+SELAVU_TASK_RETRY_SECONDS = int(os.environ.get('SELAVU_TASK_RETRY_SECONDS', 30))
+SELAVU_TASK_LEASE_SECONDS = int(os.environ.get('SELAVU_TASK_LEASE_SECONDS', 60 * 60))
+# A running task saves its progress on its row at most this often
+SELAVU_TASK_PROGRESS_SECONDS = float(os.environ.get('SELAVU_TASK_PROGRESS_SECONDS', 1))
+SELAVU_TASKS_EAGER = os.environ.get('SELAVU_TASKS_EAGER', '').lower() in ('1', 'true', 'yes')
+
+# `manage.py archive_cycles` moves expenses of cycles older than this many
+# cycles into selavu.ArchivedExpense; lists, the API and exports read it only
+# for ranges that reach back that far. Rollup totals are unaffected.
+SELAVU_ARCHIVE_AFTER_CYCLES = int(os.environ.get('SELAVU_ARCHIVE_AFTER_CYCLES', 12))